@@ -23,6 +23,8 @@ import os
 import re
 from typing import Optional, Tuple
 
+import decoder
+
 def extract_bpm_from_filename(filename: str) -> Optional[float]:
     """
     Attempts to parse BPM from a filename (e.g., "Loop_120bpm.wav" -> 120.0).
@@ -52,6 +54,16 @@ def extract_bpm_from_filename(filename: str) -> Optional[float]:
 
     return None
 
+def center_window(total_duration: float, duration: float) -> Tuple[float, float]:
+    """
+    (offset, length) in seconds of the `duration`-long window around the middle of a track.
+
+    The middle usually holds the most representative material (stable tempo and
+    harmony, full arrangement), unlike the intro and outro. Shorter tracks are used whole.
+    """
+    offset = max(0.0, (total_duration - duration) / 2)
+    return offset, min(duration, total_duration)
+
 def analyze_track(file_path: str, duration: int = 60) -> Tuple[float, str]:
     """
     Analyzes an audio file to determine its global BPM and Key.
@@ -78,13 +90,14 @@ def analyze_track(file_path: str, duration: int = 60) -> Tuple[float, str]:
     # 1. Efficient Loading (Center Window)
     # Why: Analyzing a 5-minute song takes ~5x longer than 1 minute.
     # We first get the duration to calculate the offset.
-    total_duration = librosa.get_duration(path=file_path)
+    total_duration = decoder.probe(file_path).duration
     
-    start_offset = max(0.0, (total_duration - duration) / 2)
+    start_offset, _ = center_window(total_duration, duration)
     
-    # Load audio
-    # y: audio time series, sr: sampling rate
-    y, sr = librosa.load(file_path, sr=None, offset=start_offset, duration=duration)
+    # Load audio (only the window is decoded, see decoder.py)
+    # y: mono audio time series, sr: sampling rate
+    data, sr = decoder.read(file_path, offset=start_offset, duration=duration, channels=1)
+    y = data[:, 0]
 
     # --- BPM Detection ---
     # How it works (Librosa beat_track):
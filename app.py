@@ -33,6 +33,8 @@ else:
 # Local Modules
 # Local Modules
 import audio_processor
+import cpu_topology
+import resample
 import analysis
 import mixing
 import base64
@@ -132,6 +134,22 @@ if 'current_mix' not in st.session_state:
     st.session_state.current_mix = None
 if 'input_filename' not in st.session_state:
     st.session_state.input_filename = ""
+if 'processed_preset' not in st.session_state:
+    st.session_state.processed_preset = None
+if 'processed_stems' not in st.session_state:
+    st.session_state.processed_stems = None
+
+@st.cache_resource
+def get_cpu_layout() -> cpu_topology.ThreadLayout:
+    """One inference worker (the script thread); built and reported once per process."""
+    layout = cpu_topology.ThreadLayout(
+        workers=1,
+        threads_per_worker=cpu_topology.INFERENCE_THREADS,
+        interop_threads=cpu_topology.INTEROP_THREADS,
+        pin=cpu_topology.PIN_WORKERS
+    )
+    print(layout.report())
+    return layout
 
 def save_uploaded_file(uploaded_file) -> str:
     """Helper to save uploaded file to disk for processing."""
@@ -154,27 +172,48 @@ def setup_sidebar():
     3. Analyze & Mix
     """)
 
+    # Speed/quality trade-off (see audio_processor.PRESETS)
+    presets = list(audio_processor.PRESETS)
+    preset = st.sidebar.selectbox(
+        "Separation Quality",
+        presets,
+        index=presets.index(audio_processor.DEFAULT_PRESET),
+        help="fast: single htdemucs pass. balanced: htdemucs_ft. best: htdemucs_ft with extra shifts."
+    )
+    drums_only = st.sidebar.checkbox(
+        "Drums only (faster)",
+        help="Only extract the drum stem. With htdemucs_ft this runs one of its four models."
+    )
+    return preset, (["drums"] if drums_only else None)
+
 def main():
     st.title("🥁 Drum Extractor Pro")
     st.markdown("<h3 style='text-align: center; color: #888;'>High-Fidelity Percussion Isolation System</h3>", unsafe_allow_html=True)
 
-    setup_sidebar()
+    preset, stem_selection = setup_sidebar()
 
     # File Uploader
     uploaded_file = st.file_uploader("Upload Audio (WAV/MP3)", type=["wav", "mp3"])
 
     if uploaded_file is not None:
-        # Check if it's a new file
-        if uploaded_file.name != st.session_state.input_filename:
+        # Check if it's a new file (or the quality preset changed)
+        is_new_file = uploaded_file.name != st.session_state.input_filename
+        settings_changed = (preset != st.session_state.processed_preset
+                            or stem_selection != st.session_state.processed_stems)
+        if is_new_file or settings_changed:
             # Reset state for new file
             st.session_state.input_filename = uploaded_file.name
             st.session_state.processed_drums = None
             st.session_state.analysis_results = None
             st.session_state.current_mix = None
             
+            st.session_state.processed_preset = preset
+            st.session_state.processed_stems = stem_selection
+            
             # Save file immediately
-            with st.spinner("Caching input file..."):
-                st.session_state.local_path = save_uploaded_file(uploaded_file)
+            if is_new_file:
+                with st.spinner("Caching input file..."):
+                    st.session_state.local_path = save_uploaded_file(uploaded_file)
 
         # 1. Processing Trigger
         # We process automatically if not done yet
@@ -187,13 +226,14 @@ def main():
 
             try:
                 # Step A: Separation
-                status_text.text("Separating Stems (Demucs htdemucs)... This may take a minute.")
+                status_text.text(f"Separating Stems (Demucs, {preset} preset)... This may take a minute.")
                 progress_bar.progress(50)
                 
                 # Returns Dict[str, str] now
                 import tempfile
                 output_dir = os.path.join(tempfile.gettempdir(), "drum_extractor_pro")
-                stems = audio_processor.separate_audio(st.session_state.local_path, output_dir=output_dir)
+                cpu_topology.configure_current_thread(get_cpu_layout())
+                stems = audio_processor.separate_audio(st.session_state.local_path, output_dir=output_dir, preset=preset, stems=stem_selection)
                 
                 # Store all stems in session state (we only keep 'stems' dict now instead of just drums path)
                 st.session_state.stems = stems
@@ -214,6 +254,9 @@ def main():
             except Exception as e:
                 st.error(f"Error during processing: {e}")
                 st.stop()
+            finally:
+                # The model-rate copy of the input (see resample.py) is not needed any more
+                resample.discard_cached(st.session_state.local_path)
 
         # 2. Results Dashboard
         if st.session_state.processed_drums:
@@ -224,7 +267,8 @@ def main():
             with col1:
                  st.metric("Detected Key", st.session_state.analysis_results['key'])
             with col2:
-                 st.metric("Model", "HTDemucs (v4)")
+                 preset_model = audio_processor.PRESETS[st.session_state.processed_preset]["model"]
+                 st.metric("Model", f"{preset_model} ({st.session_state.processed_preset})")
 
             # 3. Mixing Studio (Old Grid Removed)
             # User requested removal of the 2x2 grid.
@@ -1,170 +1,559 @@
 
 import torch
 import torchaudio
-from demucs.apply import apply_model
-from demucs.pretrained import get_model
 import os
-import soundfile as sf
-import demucs.apply
-# Import tqdm explicitly to be used as the base class
-import tqdm as std_tqdm
+import json
+import shutil
+import decoder
+import functools
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import model_registry
+import inference
+import precision as precision_modes
+import backends
+import stem_writer
+import checkpoint as job_checkpoint
+import analysis
+import result_cache
+import silence as silence_skip
+import silent_stems as silent_stem_check
+import streaming
+import autotune
+import resample
+import parallel as chunk_pool
 
-class ProgressTqdm:
+# Raised by the inference loop; re-exported here for callers
+CancellationException = inference.CancellationException
+
+# Speed/quality presets: which model runs and how many passes it makes.
+# htdemucs_ft is a bag of four fine-tuned models (~4x the cost of a single htdemucs pass),
+# and every extra shift is another full pass over the track.
+PRESETS = {
+    "fast": {"model": "htdemucs", "shifts": 0, "overlap": 0.1},
+    "balanced": {"model": "htdemucs_ft", "shifts": 1, "overlap": 0.25},
+    "best": {"model": "htdemucs_ft", "shifts": 3, "overlap": 0.25},
+}
+DEFAULT_PRESET = "balanced"
+DEFAULT_MODEL = PRESETS[DEFAULT_PRESET]["model"]
+# Sample rate of all Demucs v4 models (the API resamples uploads to it ahead of the model load)
+MODEL_SAMPLERATE = 44100
+STEM_NAMES = ["drums", "bass", "other", "vocals"]
+# Tracks at least this long are separated block by block (bounded memory)
+STREAMING_MIN_SECONDS = 600
+# Preview pass: a short centre window separated with the fast preset, published
+# while the full-quality job is still running
+PREVIEW_PRESET = "fast"
+PREVIEW_SECONDS = 30
+PREVIEW_SUFFIX = "_preview"
+# Stems are written at the model rate, or converted back to the input's rate
+STEM_SAMPLERATES = ("model", "input")
+# Progressive jobs: the fast preset answers the request, then a background job
+# re-separates with the upgrade preset and swaps the stems in place
+PROGRESSIVE_PRESET = "fast"
+UPGRADE_PRESET = "best"
+UPGRADE_DIRNAME = ".upgrades"
+
+def resolve_preset(preset=None, model_name=None):
     """
-    Hook to capture tqdm progress updates from Demucs.
+    Returns (preset name, settings dict) for a preset name.
+
+    An explicit `model_name` overrides the preset's model. Raises ValueError for
+    unknown presets.
     """
-    def __init__(self, callback, *args, **kwargs):
-        self.callback = callback
-        # Use the standard tqdm class directly
-        self.tqdm_obj = std_tqdm.tqdm(*args, **kwargs)
-        self.total = self.tqdm_obj.total
-
-    def __iter__(self):
-        """
-        Make the class iterable by delegating to the underlying tqdm object.
-        Required because __getattr__ does not delegate magic methods like __iter__.
-        """
-        # Iterate over the internal tqdm object
-        for item in self.tqdm_obj:
-            yield item
-            # After yield, the internal tqdm has updated (usually). 
-            # We trigger our callback here.
-            if self.callback and self.total:
-                percentage = (self.tqdm_obj.n / self.total) * 100
-                self.callback(percentage)
-
-    def __getattr__(self, name):
-        return getattr(self.tqdm_obj, name)
-
-class CancellationException(Exception):
-    pass
-
-def separate_audio(file_path, output_dir, model_name="htdemucs_ft", device="cpu", progress_callback=None, cancel_check=None, detected_key="Unknown", timestamp=0):
-    print(f"--- Starting Separation for {file_path} ---")
+    preset = preset or DEFAULT_PRESET
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown preset '{preset}'. Choose from: {', '.join(PRESETS)}")
+    settings = dict(PRESETS[preset])
+    if model_name:
+        settings["model"] = model_name
+    return preset, settings
 
-    # 1. LOAD MODEL
-    model = get_model(model_name)
-    model.to(device)
-    
-    # 2. MANUAL LOAD (The Fix: Force SoundFile backend)
+def normalize_stems(stems=None):
+    """
+    Validates a stem selection (list or comma separated string).
+
+    Returns the requested names in STEM_NAMES order, or None when all stems are
+    wanted. Raises ValueError for unknown stem names.
+    """
+    if not stems:
+        return None
+    if isinstance(stems, str):
+        stems = stems.split(",")
+    requested = [name.strip() for name in stems if name.strip()]
+    unknown = [name for name in requested if name not in STEM_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown stems {unknown}. Choose from: {', '.join(STEM_NAMES)}")
+    selected = [name for name in STEM_NAMES if name in requested]
+    return selected if len(selected) < len(STEM_NAMES) else None
+
+@dataclass(frozen=True, kw_only=True)
+class SeparationSettings:
+    """
+    The settings that determine the stems of a separation, and so its cache key.
+
+    Keyword-only and normalized on creation (preset resolved, stems validated and
+    ordered, precision and format resolved), so equal settings always hash to the
+    same key. `separate_audio` and `upgrade_track` build one from their arguments;
+    the API builds one to look up the cache before queueing a job.
+    """
+    preset: Optional[str] = None
+    model_name: Optional[str] = None
+    stems: Optional[Tuple[str, ...]] = None
+    precision: Optional[str] = None
+    device: str = "cpu"
+    output_format: Optional[str] = None
+    silence_threshold_db: Optional[float] = silence_skip.DEFAULT_THRESHOLD_DB
+    residual_other: bool = False
+    stem_samplerate: str = "model"
+    silent_stem_threshold_db: Optional[float] = None
+
+    def __post_init__(self):
+        if self.stem_samplerate not in STEM_SAMPLERATES:
+            raise ValueError(f"Unknown stem sample rate '{self.stem_samplerate}'. Choose from: {', '.join(STEM_SAMPLERATES)}")
+        preset, settings = resolve_preset(self.preset, self.model_name)
+        stems = normalize_stems(self.stems)
+        object.__setattr__(self, "preset", preset)
+        object.__setattr__(self, "model_name", settings["model"])
+        object.__setattr__(self, "stems", tuple(stems) if stems else None)
+        object.__setattr__(self, "precision", precision_modes.resolve(self.precision, self.device))
+        object.__setattr__(self, "output_format", stem_writer.resolve_format(self.output_format))
+        object.__setattr__(self, "residual_other", bool(self.residual_other))
+
+    @property
+    def inference(self):
+        """Inference settings of the preset (model, shifts, overlap)."""
+        return dict(resolve_preset(self.preset, self.model_name)[1])
+
+def compute_cache_key(file_path, settings):
+    """Result-cache key for this audio content and `settings` (SeparationSettings)."""
+    inference_settings = settings.inference
+    params = {"shifts": inference_settings["shifts"], "overlap": inference_settings["overlap"]}
+    if settings.stems:
+        params["stems"] = list(settings.stems)
+    if settings.precision != "fp32":
+        params["precision"] = settings.precision
+    if settings.output_format != stem_writer.DEFAULT_FORMAT:
+        params["format"] = settings.output_format
+    if settings.silence_threshold_db != silence_skip.DEFAULT_THRESHOLD_DB:
+        params["silence_db"] = settings.silence_threshold_db
+    if settings.residual_other:
+        params["residual_other"] = True
+    if settings.stem_samplerate != "model":
+        params["samplerate"] = settings.stem_samplerate
+    if settings.silent_stem_threshold_db is not None:
+        params["silent_stem_db"] = settings.silent_stem_threshold_db
+    return result_cache.make_key(result_cache.hash_audio_file(file_path), settings.model_name, params)
+
+def _make_infer(batcher, precision, backend=None):
+    """Forward function for the segment loop: optional shared batcher, precision mode and backend."""
+    forward = precision_modes.forward_for(precision)
+    if backend and backend != backends.DEFAULT_BACKEND:
+        if forward is not None:
+            print(f"Warning: {precision} inference runs eagerly, ignoring the {backend} backend")
+        else:
+            forward = backends.get_backend(backend).forward
+    if batcher is not None:
+        return functools.partial(batcher.infer, forward=forward)
+    return forward
+
+def _separate_in_memory(model, file_path, save_dir, settings, source_names, device, progress_callback, cancel_check, infer, output_format, checkpoint=None, seed=None, offset=0.0, duration=None, silence=None, residual_other=False, parallel=None, segment=None, batch_segments=1, output_samplerate=None, silent_stems=None):
+    """
+    Decodes the file (or `duration` seconds from `offset`), separates it in one pass and
+    writes the requested stems. With `residual_other`, "other" is the mixture minus
+    the inferred stems when that saves a sub-model pass (see inference.residual_plan).
+    `parallel` (a bound parallel.ChunkPool.apply) runs the inference in worker processes.
+    `segment`/`batch_segments` override the segment loop's defaults (see autotune.py).
+    `output_samplerate` converts the stems to that rate before they are written.
+    `silent_stems` (silent_stems.SilentStems) records silent stems instead of writing
+    them; their paths are still returned.
+    """
+    # 1. MANUAL LOAD (The Fix: bypass Torchaudio, see decoder.py)
     # We load the file into a Tensor manually to stop Demucs from using TorchCodec
-    print("Loading audio with SoundFile backend...") 
-    # Direct SoundFile load to bypass Torchaudio backend issues
+    print("Loading audio...") 
     try:
-        data, sr = sf.read(file_path)
-        # SoundFile returns (Time, Channels) or just (Time,)
-        # Demucs expects (Channels, Time)
-        
-        if len(data.shape) == 1:
-            # Mono: Add channel dim -> (1, Time)
-            wav = torch.from_numpy(data).float().unsqueeze(0)
-        else:
-             # Multi-channel: Transpose -> (Channels, Time)
-            wav = torch.from_numpy(data).float().t()
-            
+        # Decodes straight to float32 (soundfile, or ffmpeg for formats libsndfile lacks)
+        data, sr = decoder.read(file_path, offset=offset, duration=duration)
     except Exception as e:
-        print(f"Error loading audio with SoundFile: {e}")
+        print(f"Error loading audio: {e}")
         raise e
 
-    # 3. PREPARE TENSOR (Demucs needs [1, Channels, Time])
-    wav = wav.unsqueeze(0).to(device)
+    # 2. PREPARE TENSOR
+    # SoundFile returns (Time, Channels), Demucs expects (Channels, Time):
+    # a transposed view of the decoded buffer, no copy
+    wav = torch.from_numpy(data).t().to(device)
+    del data
 
-    # 4. INFERENCE (Apply model directly to Tensor)
+    # 3. INFERENCE (our own segment loop, see inference.py)
+    # Progress and cancellation are passed per call, so concurrent jobs sharing one
+    # model never see each other's callbacks.
     print("Running inference...") 
-    ref = wav.mean(0) 
-    wav = (wav - ref.mean()) / ref.std() 
+    # Normalize in place with the statistics over all samples (floored for constant mixes)
+    mean = wav.mean().item()
+    std = max(wav.std().item(), silence_skip.MIN_STD)
+    wav.sub_(mean).div_(std)
+    if silence is not None:
+        silence.set_normalization(mean, std)
+
+    # Bag members that don't contribute to the requested stems are skipped, and
+    # with a batcher the forward passes are shared with other concurrent jobs
+    inferred_names = inference.residual_plan(model, source_names) if residual_other else None
+    source_indices = [list(model.sources).index(name) for name in inferred_names or source_names]
+    if parallel is not None:
+        sources = parallel(
+            wav, sr, shifts=settings["shifts"], overlap=settings["overlap"],
+            source_indices=source_indices, progress_callback=progress_callback, cancel_check=cancel_check,
+            checkpoint=checkpoint, seed=seed, silence=silence, mean=mean, std=std,
+            stride=inference.segment_stride(model, settings["overlap"], segment),
+            segment=segment, batch_segments=batch_segments
+        )
+    else:
+        sources = inference.apply_segmented(
+            model, wav, shifts=settings["shifts"], overlap=settings["overlap"],
+            segment=segment, batch_segments=batch_segments, infer=infer,
+            progress_callback=progress_callback, cancel_check=cancel_check,
+            source_indices=source_indices, checkpoint=checkpoint, seed=seed, silence=silence
+        )
+    sources.mul_(std).add_(mean)
+    if inferred_names is not None:
+        # De-normalize the input in its own buffer and subtract the inferred stems:
+        # that buffer becomes the "other" stem, no extra allocation
+        wav.mul_(std).add_(mean)
+        sources = inference.add_residual(wav, sources, inferred_names, source_names)
+    # The input is no longer needed (or now owned by the residual stem); free it
+    # before the outputs are encoded
+    del wav
+
+    # 4. SAVE OUTPUTS (all stems encoded concurrently, see stem_writer.py)
+    if cancel_check and cancel_check():
+        raise CancellationException("Task cancelled by user")
+    if output_samplerate and output_samplerate != sr:
+        # One vectorized call over all stems and channels when they share a tensor
+        if isinstance(sources, torch.Tensor):
+            sources = resample.resample_tensor(sources, sr, output_samplerate)
+        else:
+            sources = [resample.resample_tensor(source, sr, output_samplerate) for source in sources]
+        sr = output_samplerate
+    silent = set()
+    if silent_stems is not None:
+        for name, source in zip(source_names, sources):
+            if silent_stems.update(name, source):
+                silent.add(name)
+                silent_stems.record(name, stem_writer.stem_path(save_dir, name, output_format), sr,
+                                    source.shape[0], source.shape[-1])
+    written = stem_writer.write_stems([source for name, source in zip(source_names, sources) if name not in silent],
+                                      [name for name in source_names if name not in silent], save_dir, sr, output_format)
+    generated_files = {name: written.get(name) or stem_writer.stem_path(save_dir, name, output_format)
+                       for name in source_names}
+
+    return generated_files
+
+def preview_dir(output_dir, file_path):
+    """Folder holding the preview stems of `file_path` (next to the full track folder)."""
+    filename = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(output_dir, filename + PREVIEW_SUFFIX)
+
+def separate_preview(file_path, output_dir, device="cpu", seconds=PREVIEW_SECONDS, stems=None, cancel_check=None, silence_threshold_db=silence_skip.DEFAULT_THRESHOLD_DB):
+    """
+    Separates the `seconds` around the middle of the track with the fast preset.
+
+    Uses the same centre window as analysis.analyze_track. Stems are written to
+    `preview_dir(output_dir, file_path)`; the caller removes that folder once the
+    full separation is available (see discard_preview).
+
+    Returns:
+        Dict[str, str]: {stem name: preview file path}
+    """
+    _, settings = resolve_preset(PREVIEW_PRESET)
+    offset, duration = analysis.center_window(decoder.probe(file_path).duration, seconds)
+    print(f"Separating {duration:.0f}s preview from {offset:.0f}s with {settings['model']}...")
+
+    model = model_registry.get_model(settings["model"], device)
+    source_names = normalize_stems(stems) or list(model.sources)
+    save_dir = preview_dir(output_dir, file_path)
+    os.makedirs(save_dir, exist_ok=True)
+    return _separate_in_memory(
+        model, resample.cached_input(file_path, model.samplerate), save_dir, settings, source_names, device, None, cancel_check, None, None,
+        offset=offset, duration=duration,
+        silence=silence_skip.SilenceDetector(silence_threshold_db) if silence_threshold_db is not None else None
+    )
+
+def discard_preview(output_dir, file_path):
+    shutil.rmtree(preview_dir(output_dir, file_path), ignore_errors=True)
+
+def read_metadata(save_dir):
+    with open(os.path.join(save_dir, "metadata.json")) as f:
+        return json.load(f)
+
+def write_metadata(save_dir, metadata):
+    """Replaces metadata.json atomically, so clients polling it never read a partial file."""
+    path = os.path.join(save_dir, "metadata.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(metadata, f)
+    os.replace(path + ".tmp", path)
+
+def update_metadata(save_dir, **fields):
+    metadata = read_metadata(save_dir)
+    metadata.update(fields)
+    write_metadata(save_dir, metadata)
+    return metadata
+
+def separate_audio(file_path, output_dir, model_name=None, device="cpu", progress_callback=None, cancel_check=None, detected_key="Unknown", timestamp=0, batcher=None, cache=None, cache_key=None, stream=None, preset=None, stems=None, precision=None, backend=None, output_format=None, checkpoint_root=None, silence_threshold_db=silence_skip.DEFAULT_THRESHOLD_DB, residual_other=False, parallel=None, autotune_segments=True, concurrent_jobs=1, stem_samplerate="model", silent_stem_threshold_db=None, input_samplerate=None):
+    """
+    Separates `file_path` into stems under `output_dir/<track name>/`.
+
+    `preset` picks the model and inference settings from PRESETS (default
+    DEFAULT_PRESET); an explicit `model_name` overrides the preset's model.
+
+    `stems` (e.g. ["drums"]) limits the output to those stems. With a bag of
+    specialised models such as htdemucs_ft only the needed sub-models run.
+
+    `precision` selects reduced-precision CPU inference ("int8" or "bf16", see
+    precision.py); the default is float32.
+
+    `backend` runs the forward passes through a compiled backend ("torchscript"
+    or "compile", see backends.py) instead of eager PyTorch.
+
+    `output_format` picks the stem encoding: PCM_16 (default), PCM_24, FLOAT or FLAC
+    (see stem_writer.py).
+
+    If `batcher` (batching.SegmentBatcher) is given, segments are run through it so
+    they can share forward passes with other concurrent separations.
+
+    If `cache` (result_cache.ResultCache) is given, identical audio separated with the
+    same settings returns the previously written stems without running inference.
+    `cache_key` can be passed when the caller already computed (and looked up) it;
+    the lookup here then only catches duplicates that finished while this job was queued.
+
+    `stream` selects bounded-memory block-by-block separation (see streaming.py);
+    None picks it automatically for tracks of STREAMING_MIN_SECONDS or longer.
+
+    `checkpoint_root` enables resumable jobs: finished segments are saved under
+    `<checkpoint_root>/.jobs/<cache key>/` and an interrupted job with the same input
+    and settings continues from there (see checkpoint.py).
+
+    Segments whose input is quieter than `silence_threshold_db` (dBFS) are not run
+    through the model and come out as silence (see silence.py); None disables this.
+    The skipped share is recorded in metadata.json as `silence_skipped_seconds`.
+
+    `residual_other` computes the "other" stem as mixture minus drums, bass and
+    vocals instead of running its own sub-model (one pass fewer with htdemucs_ft).
+    It trades quality for speed: everything the other stems miss or bleed ends up
+    in "other", so it is noticeably worse than the model's own estimate (see
+    benchmark_residual.py). Ignored when it would not save a pass.
+
+    `parallel` (parallel.ChunkPool) splits the track into overlapping chunks that
+    are separated in worker processes, for lower latency when the node has idle
+    cores. It is only used for tracks long enough to benefit (ChunkPool.worthwhile),
+    and such tracks are then separated in memory instead of streamed.
+
+    `autotune_segments` sizes the segment length and segments per forward pass to
+    the memory available to this job, with `concurrent_jobs` jobs sharing it (see
+    autotune.py). The choice is recorded in metadata.json.
+
+    Inputs at another rate than the model's (44.1 kHz) are resampled before
+    inference, through a cached copy next to the input (see resample.py).
+    `stem_samplerate` "model" writes the stems at the model rate, "input" converts
+    them back to the input's rate. `input_samplerate` is the rate of the original
+    upload when `file_path` is a copy transcoded at another rate (see
+    decoder.UploadTranscoder); by default it is read from `file_path`.
+
+    Stems whose RMS stays below `silent_stem_threshold_db` (dBFS) over the whole
+    track are not written: metadata.json lists them under `silent_stems` and the
+    API synthesizes their silence on request (see silent_stems.py). Their paths are
+    returned like the others but do not exist. None (default) writes every stem.
+    """
+    print(f"--- Starting Separation for {file_path} ---")
+    job = SeparationSettings(
+        preset=preset, model_name=model_name, stems=stems, precision=precision, device=device,
+        output_format=output_format, silence_threshold_db=silence_threshold_db, residual_other=residual_other,
+        stem_samplerate=stem_samplerate, silent_stem_threshold_db=silent_stem_threshold_db
+    )
+    preset, model_name, precision, output_format = job.preset, job.model_name, job.precision, job.output_format
+    stems = list(job.stems) if job.stems else None
+    settings = job.inference
+    print(f"Preset: {preset} ({model_name}, shifts={settings['shifts']}, overlap={settings['overlap']}, {precision})")
+
+    # 0. CACHE LOOKUP
+    if cache is not None:
+        precomputed = cache_key is not None
+        if not precomputed:
+            cache_key = compute_cache_key(file_path, job)
+        cached = cache.lookup(cache_key, count_miss=not precomputed)
+        if cached is not None:
+            print("Cache hit, reusing existing stems.")
+            return cached[0]
+
+    # Scratch directory for resumable jobs, keyed like the result cache
+    checkpoint = None
+    if checkpoint_root is not None:
+        if cache_key is None:
+            cache_key = compute_cache_key(file_path, job)
+        checkpoint = job_checkpoint.SegmentCheckpoint(
+            checkpoint_root, cache_key, {"model": model_name, "preset": preset, "stems": stems}
+        )
+    seed = job_checkpoint.job_seed(cache_key) if checkpoint is not None else None
+
+    # 1. LOAD MODEL (resident in the registry after the first request)
+    model = model_registry.get_model(model_name, device, precision_modes.weights_variant(precision))
+    infer = _make_infer(batcher, precision, backend)
+    source_names = stems or list(model.sources)
     
-    # --- Progress Hook ---
-    # Captures both `import tqdm` (module) and `from tqdm import tqdm` (class) usage
-    original_tqdm_val = getattr(demucs.apply, "tqdm", None)
-
-    # 1. Custom TQDM that sends updates to our callback
-    class CustomTqdm(std_tqdm.tqdm):
-        def __init__(self, *args, progress_callback=None, cancel_check=None, **kwargs):
-            # Force disable=False to ensure it runs even if no TTY is detected
-            kwargs['disable'] = False 
-            self.progress_callback = progress_callback
-            self.cancel_check = cancel_check
-            super().__init__(*args, **kwargs)
-
-        def update(self, n=1):
-            # Check cancellation BEFORE update
-            if self.cancel_check and self.cancel_check():
-                raise CancellationException("Task cancelled by user")
-
-            super().update(n)
-            # Debug print
-            # print(f"DEBUG: n={self.n}, total={self.total}") 
-            if self.progress_callback:
-                if self.total:
-                     percentage = (self.n / self.total) * 100
-                     self.progress_callback(percentage)
-                else:
-                     # Fallback if total is unknown?
-                     pass
-        
-    # 2. Universal Shim to handle "import tqdm" vs "from tqdm import tqdm"
-    class UniversalTqdmShim:
-        def __init__(self, callback, cancel_check):
-            self.callback = callback
-            self.cancel_check = cancel_check
-
-        def __call__(self, *args, **kwargs):
-            # Case: from tqdm import tqdm -> calls tqdm(...)
-            return CustomTqdm(*args, progress_callback=self.callback, cancel_check=self.cancel_check, **kwargs)
-
-        def tqdm(self, *args, **kwargs):
-            # Case: import tqdm -> calls tqdm.tqdm(...)
-            return CustomTqdm(*args, progress_callback=self.callback, cancel_check=self.cancel_check, **kwargs)
-            
-    try:
-        if progress_callback or cancel_check:
-            print("Installing TQDM Shim...")
-            # Replaces the 'tqdm' attribute in demucs.apply with our Shim
-            demucs.apply.tqdm = UniversalTqdmShim(progress_callback, cancel_check)
-
-        print("Calling apply_model...")
-        sources = apply_model(model, wav, shifts=1, split=True, overlap=0.25, progress=True) 
-        print("apply_model finished.")
-        
-    finally:
-        # Restore original logic
-        if original_tqdm_val is not None:
-             demucs.apply.tqdm = original_tqdm_val
-
-    sources = sources * ref.std() + ref.mean() 
-    sources = sources.squeeze(0) # Remove batch dim
-
-    # 5. SAVE OUTPUTS
+    # 2. OUTPUT FOLDER
     filename = os.path.splitext(os.path.basename(file_path))[0] 
     save_dir = os.path.join(output_dir, filename) 
     os.makedirs(save_dir, exist_ok=True)
 
-    generated_files = {} 
-    source_names = model.sources
-
-    for name, source in zip(source_names, sources): 
-        # Double check cancellation before write (optional but good)
-        if cancel_check and cancel_check():
-            raise CancellationException("Task cancelled by user")
+    # 3. SEPARATE (long tracks stream block by block to bound memory)
+    # at the model's sample rate
+    input_samplerate = input_samplerate or decoder.probe(file_path).samplerate
+    source_path = resample.cached_input(file_path, model.samplerate)
+    output_samplerate = input_samplerate if stem_samplerate == "input" else None
+    info = decoder.probe(source_path)
+    duration = info.duration
+    if parallel is not None and not parallel.worthwhile(duration):
+        parallel = None
+    if stream is None:
+        stream = duration >= STREAMING_MIN_SECONDS and parallel is None
+    silence = silence_skip.SilenceDetector(silence_threshold_db) if silence_threshold_db is not None else None
+    silent_stems = (silent_stem_check.SilentStems(silent_stem_threshold_db)
+                    if silent_stem_threshold_db is not None else None)
+    tuning = None
+    if autotune_segments:
+        # Audio held at once: one block when streaming, one chunk per worker process
+        audio_seconds = (streaming.BLOCK_SECONDS + streaming.BLOCK_OVERLAP_SECONDS if stream
+                         else chunk_pool.CHUNK_SECONDS + chunk_pool.OVERLAP_SECONDS if parallel is not None else duration)
+        tuning = autotune.tune(
+            model, model_name, precision_modes.weights_variant(precision), min(duration, audio_seconds),
+            info.samplerate, info.channels, len(source_names),
+            workers=parallel.workers if parallel is not None else concurrent_jobs
+        )
+        print(f"Autotune: segment {tuning.metadata(model)['segment_seconds']}s, "
+              f"{tuning.batch_segments} segment(s) per forward pass")
+    segment = tuning.segment if tuning is not None else None
+    batch_segments = tuning.batch_segments if tuning is not None else 1
+    try:
+        if stream:
+            print("Running streaming separation...")
+            generated_files = streaming.separate_file(
+                model, source_path, save_dir, source_names,
+                shifts=settings["shifts"], overlap=settings["overlap"],
+                infer=infer, device=device,
+                progress_callback=progress_callback, cancel_check=cancel_check,
+                output_format=output_format, checkpoint=checkpoint, seed=seed, silence=silence,
+                residual_other=residual_other, segment=segment, batch_segments=batch_segments,
+                silent_stems=silent_stems
+            )
+            if output_samplerate:
+                for path in generated_files.values():
+                    if os.path.exists(path):
+                        resample.convert_file(path, output_samplerate)
+                if silent_stems is not None:
+                    silent_stems.rescale(output_samplerate)
+        else:
+            if parallel is not None:
+                print(f"Splitting the track across {parallel.workers} worker processes...")
+                parallel = functools.partial(parallel.apply, model_name, precision=precision, backend=backend)
+            generated_files = _separate_in_memory(
+                model, source_path, save_dir, settings, source_names, device, progress_callback, cancel_check, infer, output_format,
+                checkpoint=checkpoint, seed=seed, silence=silence, residual_other=residual_other,
+                parallel=parallel, segment=segment, batch_segments=batch_segments,
+                output_samplerate=output_samplerate, silent_stems=silent_stems
+            )
+    except CancellationException:
+        # The user gave up on this job; don't keep its scratch data around
+        if checkpoint is not None:
+            checkpoint.discard()
+        raise
+    skipped_seconds = silence.skipped_seconds(duration) if silence is not None else 0.0
+    if skipped_seconds:
+        print(f"Skipped inference over {skipped_seconds:.1f}s of silence")
 
-        save_path = os.path.join(save_dir, f"{name}.wav") 
-        # Save using soundfile (safe) 
-        source_cpu = source.cpu().numpy().transpose(1, 0) 
-        sf.write(save_path, source_cpu, sr) 
-        generated_files[name] = save_path
-    
     # Save Metadata
-    import json
     metadata = {
         "filename": filename,
         "key": detected_key,
         "timestamp": timestamp, # Available from outer scope? Yes
-        "stems": list(generated_files.keys())
+        "stems": list(generated_files.keys()),
+        "preset": preset,
+        "model": model_name,
+        "precision": precision,
+        "format": output_format,
+        "silence_skipped_seconds": round(skipped_seconds, 1),
+        "residual_other": bool(residual_other and inference.residual_plan(model, source_names)),
+        "samplerate": output_samplerate or model.samplerate,
+        "input_samplerate": input_samplerate,
+        "version": 1
     }
-    with open(os.path.join(save_dir, "metadata.json"), "w") as f:
-        json.dump(metadata, f)
+    if tuning is not None:
+        metadata["autotune"] = tuning.metadata(model)
+    if silent_stems is not None:
+        metadata["silent_stems"] = silent_stems.stems
+        if silent_stems.stems:
+            print(f"Silent stems (not written): {', '.join(silent_stems.stems)}")
+    write_metadata(save_dir, metadata)
+
+    if cache is not None:
+        cache.store(cache_key, save_dir, generated_files)
+    if checkpoint is not None:
+        checkpoint.discard()
 
     return generated_files
 
+def upgrade_track(file_path, output_dir, track_dir, stems=None, precision=None, device="cpu", output_format=None, silence_threshold_db=silence_skip.DEFAULT_THRESHOLD_DB, residual_other=False, stem_samplerate="model", silent_stem_threshold_db=None, cache=None, **kwargs):
+    """
+    Re-separates `file_path` with UPGRADE_PRESET and swaps the result into `track_dir`.
+
+    The new stems are written to `<output_dir>/.upgrades/<track name>/` first. Each
+    stem then replaces its counterpart in `track_dir` with `os.replace` (readers get
+    either the old or the new file, never a partial one), and finally metadata.json
+    is rewritten with `version` incremented and `upgrade` set to "done". Clients poll
+    the version to know when to reload the stems.
+
+    Other arguments are passed to `separate_audio` (checkpoint_root, cancel_check,
+    batcher, ...). With `cache`, the folder's entry is dropped before the first stem
+    is swapped (the fast preset's key must not serve upgraded stems) and the folder
+    is registered under the upgrade preset's cache key once done.
+
+    Returns:
+        Dict[str, str]: {stem name: path in track_dir}
+    """
+    output_format = stem_writer.resolve_format(output_format)
+    precision = precision_modes.resolve(precision, device)
+    staged = separate_audio(
+        file_path, os.path.join(output_dir, UPGRADE_DIRNAME), device=device, preset=UPGRADE_PRESET, stems=stems,
+        precision=precision, output_format=output_format, silence_threshold_db=silence_threshold_db,
+        residual_other=residual_other, stem_samplerate=stem_samplerate,
+        silent_stem_threshold_db=silent_stem_threshold_db, **kwargs
+    )
+    staging_dir = os.path.dirname(next(iter(staged.values())))
+    previous = read_metadata(track_dir)
+    metadata = read_metadata(staging_dir)
+
+    if cache is not None:
+        cache.forget(track_dir)
+    swapped = {}
+    for name, path in staged.items():
+        target = os.path.join(track_dir, os.path.basename(path))
+        if os.path.exists(path):
+            os.replace(path, target)
+        swapped[name] = target
+    metadata.update(filename=previous["filename"], version=previous.get("version", 1) + 1, upgrade="done")
+    write_metadata(track_dir, metadata)
+    # Stems that turned out silent now: their old files go once the metadata lists them
+    for entry in (metadata.get("silent_stems") or {}).values():
+        try:
+            os.remove(os.path.join(track_dir, entry["file"]))
+        except FileNotFoundError:
+            pass
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    print(f"Upgraded {previous['filename']} to {UPGRADE_PRESET} (version {metadata['version']})")
 
+    if cache is not None:
+        cache_key = compute_cache_key(file_path, SeparationSettings(
+            preset=UPGRADE_PRESET, stems=stems, precision=precision, device=device, output_format=output_format,
+            silence_threshold_db=silence_threshold_db, residual_other=residual_other, stem_samplerate=stem_samplerate,
+            silent_stem_threshold_db=silent_stem_threshold_db
+        ))
+        cache.store(cache_key, track_dir, swapped)
+    return swapped
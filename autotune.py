@@ -0,0 +1,243 @@
+"""
+Drum Extractor Pro - Segment Autotuning Module
+==============================================
+
+Picks the segment length and segments-per-forward-pass for a job from the memory
+the host actually has.
+
+Why:
+    The segment loop always used the model's default segment length and one
+    segment per forward pass, whatever the node looked like. On small worker
+    nodes several concurrent jobs ran out of memory, and on big nodes the forward
+    passes were smaller than the memory allowed, paying per-call overhead.
+
+How:
+    1. Profile: the peak memory of one forward pass over one segment is measured
+       once per (model, weights variant) and stored as bytes per second of audio
+       in `<BACKEND_CACHE_DIR>/memory_profile.json`. The pass runs in a short-lived
+       spawned process that loads the model on its own, so the peak (VmHWM, reset
+       through /proc/self/clear_refs after loading) only covers that pass and never
+       resets or picks up the counters of jobs running in the server. Elsewhere
+       than Linux, or if the measurement fails, a default measured for htdemucs is
+       used.
+    2. Budget: available memory (MemAvailable, capped by the cgroup limit in
+       containers) times AUTOTUNE_MEMORY_FRACTION, split across the concurrent
+       workers, minus the job's own audio buffers (input plus stem accumulators).
+    3. Choice: as many segments per forward pass as fit in the budget, up to
+       AUTOTUNE_MAX_BATCH. HTDemucs always runs at its training length (shorter
+       inputs are padded to it), so its segment length is kept. Models that accept
+       any length get the longest segment that fits, between MIN_SEGMENT_SECONDS
+       and MAX_SEGMENT_SECONDS.
+
+    The result is a `Tuning`, which audio_processor records in metadata.json.
+
+Configuration:
+    AUTOTUNE_MEMORY_FRACTION: Share of the available memory jobs may plan for (default 0.7).
+    AUTOTUNE_MAX_BATCH: Upper bound for segments per forward pass (default 4).
+"""
+
+import json
+import multiprocessing
+import os
+import queue as queue_module
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+import torch
+from demucs.htdemucs import HTDemucs
+
+import backends
+import inference
+import model_registry
+
+MEMORY_FRACTION = float(os.environ.get("AUTOTUNE_MEMORY_FRACTION", "0.7"))
+MAX_BATCH_SEGMENTS = int(os.environ.get("AUTOTUNE_MAX_BATCH", "4"))
+MIN_SEGMENT_SECONDS = 4.0
+MAX_SEGMENT_SECONDS = 30.0
+# Peak of one htdemucs forward pass over a 7.8 s stereo segment (~340 MB), per second
+DEFAULT_BYTES_PER_SECOND = 45 * 1024 * 1024
+PROFILE_FILENAME = "memory_profile.json"
+MEASURE_TIMEOUT_SECONDS = 600
+
+_profile_lock = threading.Lock()
+_profiles: Optional[Dict[str, float]] = None
+
+
+class Tuning(NamedTuple):
+    segment: Optional[float]  # Seconds; None keeps the model's default
+    batch_segments: int
+    budget_bytes: Optional[int]
+    bytes_per_second: float
+
+    def metadata(self, model: torch.nn.Module) -> dict:
+        return {
+            "segment_seconds": round(float(self.segment or _first_model(model).segment), 2),
+            "batch_segments": self.batch_segments,
+            "memory_budget_mb": round(self.budget_bytes / 1024 / 1024) if self.budget_bytes is not None else None,
+        }
+
+
+def available_memory() -> Optional[int]:
+    """Bytes this process can still allocate, or None if unknown."""
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        try:
+            import psutil  # Optional dependency, used where /proc is missing
+            available = psutil.virtual_memory().available
+        except ImportError:
+            return None
+    # Containers: the cgroup limit applies long before the host runs out
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        with open("/sys/fs/cgroup/memory.current") as f:
+            current = int(f.read())
+        if limit != "max":
+            cgroup_free = max(0, int(limit) - current)
+            available = cgroup_free if available is None else min(available, cgroup_free)
+    except (OSError, ValueError):
+        pass
+    return available
+
+
+def _first_model(model: torch.nn.Module) -> torch.nn.Module:
+    return inference.sub_models(model)[0][0]
+
+
+def _fixed_segment(model: torch.nn.Module) -> bool:
+    """True if the model always runs at its training length (HTDemucs pads shorter inputs)."""
+    sub_model = _first_model(model)
+    return isinstance(sub_model, HTDemucs) and sub_model.use_train_segment
+
+
+def _read_status(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+    raise OSError(f"{field} not in /proc/self/status")
+
+
+def _measure(model: torch.nn.Module) -> float:
+    """Peak bytes per second of audio of one forward pass (Linux, only in a process doing nothing else)."""
+    sub_model = _first_model(model)
+    segment = float(sub_model.segment)
+    length = int(segment * sub_model.samplerate)
+    if hasattr(sub_model, "valid_length"):
+        length = sub_model.valid_length(length)
+    batch = torch.zeros(1, sub_model.audio_channels, length)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")  # Resets the VmHWM peak counter (of this process only)
+    baseline = _read_status("VmRSS:")
+    out = inference.forward(sub_model, batch)
+    peak = _read_status("VmHWM:") - baseline
+    del out
+    return max(peak, 1) / segment
+
+
+def _measure_worker(model_name: str, variant: str, queue) -> None:
+    try:
+        model = model_registry.get_model(model_name, "cpu", variant)
+        queue.put((True, _measure(model)))
+    except Exception as e:
+        queue.put((False, f"{type(e).__name__}: {e}"))
+
+
+def _measure_isolated(model_name: str, variant: str) -> float:
+    """Runs `_measure` in a fresh process, away from the threads of running jobs."""
+    # spawn: forking a process that already runs torch threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure_worker, args=(model_name, variant, queue), daemon=True)
+    process.start()
+    process.join(MEASURE_TIMEOUT_SECONDS)
+    if process.is_alive():
+        process.kill()
+        process.join()
+        raise OSError(f"memory profile of {model_name} timed out")
+    if process.exitcode != 0:
+        raise OSError(f"memory profile process exited with code {process.exitcode}")
+    ok, value = queue.get(timeout=5)
+    if not ok:
+        raise OSError(value)
+    return value
+
+
+def _profile_path() -> str:
+    return os.path.join(backends.ARTIFACT_DIR, PROFILE_FILENAME)
+
+
+def bytes_per_second(model_name: str, variant: str = "fp32") -> float:
+    """Memory profile of a registry model, measured on first use and kept on disk."""
+    global _profiles
+    key = f"{model_name}/{variant}"
+    with _profile_lock:
+        if _profiles is None:
+            try:
+                with open(_profile_path()) as f:
+                    _profiles = json.load(f)
+            except (OSError, ValueError):
+                _profiles = {}
+        if key in _profiles:
+            return _profiles[key]
+        try:
+            start = time.perf_counter()
+            value = _measure_isolated(model_name, variant)
+            print(f"Memory profile of {key}: {value / 1024 / 1024:.1f} MB per second of audio "
+                  f"(measured in {time.perf_counter() - start:.1f}s)")
+        except (OSError, queue_module.Empty) as e:
+            print(f"Warning: Could not measure memory profile of {key} ({e}); using the default")
+            return DEFAULT_BYTES_PER_SECOND
+        _profiles[key] = value
+        try:
+            os.makedirs(backends.ARTIFACT_DIR, exist_ok=True)
+            tmp_path = _profile_path() + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(_profiles, f, indent=2)
+            os.replace(tmp_path, _profile_path())
+        except OSError as e:
+            print(f"Warning: Could not save memory profile: {e}")
+        return value
+
+
+def tune(model: torch.nn.Module, model_name: str, variant: str, audio_seconds: float, samplerate: int,
+         channels: int, n_sources: int, workers: int = 1) -> Tuning:
+    """
+    Segment length and segments per forward pass for one job.
+
+    Args:
+        audio_seconds: Audio the job holds in memory at once (the track, or one
+            streaming block).
+        n_sources: Stems computed (accumulators kept alongside the input).
+        workers: Jobs or worker processes sharing the memory.
+    """
+    per_second = bytes_per_second(model_name, variant)
+    available = available_memory()
+    default_segment = float(_first_model(model).segment)
+    if available is None:
+        return Tuning(None, 1, None, per_second)
+
+    budget = int(available * MEMORY_FRACTION / max(1, workers))
+    # Input + running estimate + one sub-model's output + the shifted output being added
+    buffers = int(audio_seconds * samplerate * channels * 4 * (1 + 3 * n_sources))
+    forward_budget = budget - buffers
+
+    segment = None
+    if not _fixed_segment(model):
+        fitting = forward_budget / per_second
+        segment = min(MAX_SEGMENT_SECONDS, max(MIN_SEGMENT_SECONDS, fitting))
+        if abs(segment - default_segment) < 0.5:
+            segment = None
+    segment_bytes = per_second * (segment or default_segment)
+    batch_segments = int(max(1, min(MAX_BATCH_SEGMENTS, forward_budget // segment_bytes)))
+    if forward_budget < segment_bytes:
+        print(f"Warning: {budget / 1024 / 1024:.0f} MB memory budget is below what one segment needs "
+              f"({(buffers + segment_bytes) / 1024 / 1024:.0f} MB); the job may run out of memory")
+    return Tuning(segment, batch_segments, budget, per_second)
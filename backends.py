@@ -0,0 +1,204 @@
+"""
+Drum Extractor Pro - Inference Backend Module
+=============================================
+
+Pluggable forward-pass backends for the segment loop in inference.py.
+
+Why:
+    Eager PyTorch dispatches every operator from Python on each segment. A compiled
+    graph (TorchScript, torch.compile/Inductor) removes that overhead and can fuse
+    kernels, which matters on CPU nodes that separate many tracks. There is no ONNX
+    backend: the exporter rejects the complex STFT of htdemucs, so every shipped
+    model would run eagerly anyway.
+
+How:
+    Each backend exposes `forward(model, batch)`, the same signature as
+    `inference.forward`, so it plugs into `apply_segmented` and the batcher
+    unchanged. The first call for a (sub-model, input shape) pair builds the compiled
+    artifact and keeps it for later calls:
+    - "torchscript": `torch.jit.trace`, saved as `<artifact dir>/<digest>_<shape>.pt`.
+    - "compile": `torch.compile`; Inductor keeps its compiled kernels under
+      `<artifact dir>/inductor`.
+    The digest is a hash of the model weights, so artifacts survive restarts and are
+    rebuilt when the weights change. If a build fails, the backend logs it and runs
+    that model eagerly from then on, so "eager" is always the fallback.
+
+    `check_backend_parity.py` compares each backend with eager and reports throughput.
+
+Configuration:
+    BACKEND_CACHE_DIR: Where compiled artifacts are stored (default model_artifacts).
+"""
+
+import abc
+import contextlib
+import hashlib
+import io
+import os
+import threading
+import warnings
+import weakref
+from typing import Callable, Dict, Optional, Tuple
+
+import torch
+
+import inference
+
+BACKENDS = ("eager", "torchscript", "compile")
+DEFAULT_BACKEND = "eager"
+ARTIFACT_DIR = os.environ.get("BACKEND_CACHE_DIR", "model_artifacts")
+
+Runner = Callable[[torch.Tensor], torch.Tensor]
+
+_digests: "weakref.WeakKeyDictionary[torch.nn.Module, str]" = weakref.WeakKeyDictionary()
+_digest_lock = threading.Lock()
+
+
+def model_digest(model: torch.nn.Module) -> str:
+    """SHA-256 over the model's class and weights (memoized per model object)."""
+    with _digest_lock:
+        if model in _digests:
+            return _digests[model]
+    digest = hashlib.sha256(type(model).__qualname__.encode())
+    for name, value in model.state_dict().items():
+        digest.update(name.encode())
+        for tensor in (value if isinstance(value, (tuple, list)) else (value,)):
+            if isinstance(tensor, torch.Tensor):
+                if tensor.is_quantized:
+                    tensor = tensor.int_repr()
+                digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    with _digest_lock:
+        _digests[model] = digest.hexdigest()
+    return _digests[model]
+
+
+class Backend(abc.ABC):
+    """
+    Base class: subclasses implement `build` to compile a model for one input shape.
+
+    Args:
+        artifact_dir (str): Directory for compiled artifacts.
+    """
+
+    name = "base"
+
+    def __init__(self, artifact_dir: str = ARTIFACT_DIR):
+        self.artifact_dir = artifact_dir
+        self._runners: "weakref.WeakKeyDictionary[torch.nn.Module, Dict[Tuple[int, ...], Optional[Runner]]]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.builds = 0
+        self.fallbacks = 0
+
+    def forward(self, model: torch.nn.Module, batch: torch.Tensor) -> torch.Tensor:
+        """`inference.forward` replacement: batch (B, C, L) -> (B, S, C, L)."""
+        runner = self._runner(model, batch)
+        if runner is None:
+            return inference.forward(model, batch)
+        with torch.no_grad():
+            return runner(batch)
+
+    @abc.abstractmethod
+    def build(self, model: torch.nn.Module, example: torch.Tensor) -> Optional[Runner]:
+        """Compiled runner for `model` at the shape of `example`, or None to run it eagerly."""
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "builds": self.builds, "fallbacks": self.fallbacks}
+
+    def artifact_path(self, model: torch.nn.Module, example: torch.Tensor, ext: str) -> str:
+        shape = "x".join(str(n) for n in example.shape)
+        return os.path.join(self.artifact_dir, f"{model_digest(model)[:16]}_{shape}.{ext}")
+
+    def _runner(self, model: torch.nn.Module, batch: torch.Tensor) -> Optional[Runner]:
+        shape = tuple(batch.shape)
+        with self._lock:
+            per_model = self._runners.setdefault(model, {})
+            if shape in per_model:
+                return per_model[shape]
+
+        # Builds are slow and memory hungry: one at a time, others wait for the result.
+        with self._build_lock:
+            with self._lock:
+                if shape in per_model:
+                    return per_model[shape]
+            try:
+                runner = self.build(model, batch)
+                self.builds += 1
+            except Exception as e:
+                print(f"Warning: {self.name} backend failed for {type(model).__name__} {list(shape)}, "
+                      f"using eager: {type(e).__name__}: {e}")
+                runner = None
+                self.fallbacks += 1
+            with self._lock:
+                per_model[shape] = runner
+            return runner
+
+
+class EagerBackend(Backend):
+    name = "eager"
+
+    def forward(self, model, batch):
+        return inference.forward(model, batch)
+
+    def build(self, model, example):
+        return None
+
+
+class TorchScriptBackend(Backend):
+    name = "torchscript"
+
+    def build(self, model, example):
+        path = self.artifact_path(model, example, "pt")
+        if os.path.exists(path):
+            return torch.jit.load(path, map_location=example.device)
+
+        print(f"Tracing {type(model).__name__} for input {list(example.shape)}...")
+        # Shapes are fixed per artifact, so the tracer's shape-constant warnings (and
+        # the graph dump that comes with them) are expected
+        with torch.no_grad(), warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+            warnings.simplefilter("ignore")
+            traced = torch.jit.trace(model, example, check_trace=False)
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        traced.save(tmp_path)
+        os.replace(tmp_path, path)
+        return traced
+
+
+class CompileBackend(Backend):
+    name = "compile"
+
+    def __init__(self, artifact_dir: str = ARTIFACT_DIR):
+        super().__init__(artifact_dir)
+        self._compiled: "weakref.WeakKeyDictionary[torch.nn.Module, Callable]" = weakref.WeakKeyDictionary()
+
+    def build(self, model, example):
+        # Inductor's on-disk kernel cache makes later processes skip most of the compile
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(os.path.abspath(self.artifact_dir), "inductor"))
+        if model not in self._compiled:
+            self._compiled[model] = torch.compile(model, dynamic=False)
+        compiled = self._compiled[model]
+        print(f"Compiling {type(model).__name__} for input {list(example.shape)}...")
+        with torch.no_grad():
+            compiled(example)  # Triggers the compile for this shape
+        return compiled
+
+
+_BACKEND_CLASSES = {
+    "eager": EagerBackend,
+    "torchscript": TorchScriptBackend,
+    "compile": CompileBackend,
+}
+_instances: Dict[str, Backend] = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name: Optional[str] = None) -> Backend:
+    """Shared backend instance by name. Raises ValueError for unknown backends."""
+    name = name or DEFAULT_BACKEND
+    if name not in _BACKEND_CLASSES:
+        raise ValueError(f"Unknown backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = _BACKEND_CLASSES[name]()
+        return _instances[name]
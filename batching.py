@@ -0,0 +1,154 @@
+"""
+Drum Extractor Pro - Cross-Request Batching Module
+==================================================
+
+Collects segments from several concurrent separations into one forward pass.
+
+Why:
+    Each separation feeds the network segments with a batch dimension of 1. On CPU,
+    a larger batch amortizes per-call overhead and uses the matrix kernels more
+    efficiently, so several queued tracks separate faster together than one by one.
+
+How:
+    Jobs call `SegmentBatcher.infer(model, batch)` from their own threads (it has the
+    same signature as `inference.forward`, plus an optional per-job `forward`, e.g.
+    `precision.bf16_forward`). A single dispatcher thread waits up to
+    `max_wait_ms` after the first pending request for more segments of the same model,
+    forward function and shape, concatenates up to `max_batch` of them, runs one forward pass and
+    routes each slice of the output back to the job that submitted it.
+
+    Batching only pays off when several jobs are in flight, i.e. with
+    SEPARATION_SLOTS > 1.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+import torch
+
+import inference
+
+
+class _Request:
+    __slots__ = ("model", "batch", "forward", "future", "arrival")
+
+    def __init__(self, model: torch.nn.Module, batch: torch.Tensor, forward=None):
+        self.model = model
+        self.batch = batch
+        self.forward = forward
+        self.future: Future = Future()
+        self.arrival = time.monotonic()
+
+    def compatible(self, other: "_Request") -> bool:
+        # == rather than `is`: bound methods (e.g. a backend's forward) are new objects per access
+        return (self.model is other.model and self.forward == other.forward
+                and self.batch.shape[1:] == other.batch.shape[1:])
+
+
+class SegmentBatcher:
+    """
+    Shared batching front-end for model forward passes.
+
+    Args:
+        max_batch (int): Maximum number of segments per forward pass.
+        max_wait_ms (float): How long the oldest request may wait for companions.
+        infer (callable): Underlying forward function, defaults to `inference.forward`.
+        on_thread_start (callable): Called on the dispatcher thread before its first
+            forward pass (e.g. to set torch threads / CPU affinity).
+    """
+
+    def __init__(self, max_batch: int = 8, max_wait_ms: float = 50.0, infer=None, on_thread_start=None):
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max_wait_ms / 1000.0
+        self._infer = infer or inference.forward
+        self._on_thread_start = on_thread_start
+        self._pending: List[_Request] = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self.batches = 0
+        self.segments = 0
+
+    def infer(self, model: torch.nn.Module, batch: torch.Tensor, forward=None) -> torch.Tensor:
+        """
+        Blocking: queues `batch` (B, C, L) and returns this job's (B, S, C, L) output.
+
+        `forward` overrides the batcher's forward function for this request. It runs
+        on the dispatcher thread, so thread-local state such as autocast must be set
+        up inside it.
+        """
+        request = _Request(model, batch, forward)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="segment-batcher", daemon=True)
+                self._thread.start()
+            self._pending.append(request)
+            self._cond.notify_all()
+        return request.future.result()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "segments": self.segments,
+                "avg_batch": round(self.segments / self.batches, 2) if self.batches else 0.0,
+                "pending": len(self._pending),
+            }
+
+    def _collect_locked(self) -> List[_Request]:
+        """Waits for the oldest request's companions, then removes and returns a batch."""
+        while not self._pending:
+            self._cond.wait()
+        first = self._pending[0]
+        deadline = first.arrival + self.max_wait
+
+        while True:
+            group = [r for r in self._pending if r.compatible(first)]
+            if sum(r.batch.shape[0] for r in group) >= self.max_batch:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+
+        selected, size = [], 0
+        for request in group:
+            if selected and size + request.batch.shape[0] > self.max_batch:
+                break
+            selected.append(request)
+            size += request.batch.shape[0]
+        for request in selected:
+            self._pending.remove(request)
+        self.batches += 1
+        self.segments += size
+        return selected
+
+    def _loop(self) -> None:
+        if self._on_thread_start:
+            try:
+                self._on_thread_start()
+            except Exception as e:
+                print(f"Warning: Batcher thread setup failed: {e}")
+        while True:
+            with self._cond:
+                selected = self._collect_locked()
+
+            try:
+                model = selected[0].model
+                forward = selected[0].forward or self._infer
+                if len(selected) == 1:
+                    outputs = [forward(model, selected[0].batch)]
+                else:
+                    stacked = torch.cat([r.batch for r in selected])
+                    result = forward(model, stacked)
+                    outputs = torch.split(result, [r.batch.shape[0] for r in selected])
+            except BaseException as e:
+                for request in selected:
+                    request.future.set_exception(e)
+                continue
+
+            for request, output in zip(selected, outputs):
+                request.future.set_result(output)
@@ -0,0 +1,128 @@
+"""
+Peak-memory benchmark for the in-memory separation path.
+
+Separates the same track with the previous pipeline (float64 decode, copied
+normalization and de-normalization, full transposed copy per stem) and with the
+current `audio_processor._separate_in_memory`. Each run happens in a fresh
+process. The peak resident set size is reported above the baseline of the loaded
+model. On Linux the peak counter is reset after loading (/proc/self/clear_refs),
+elsewhere the peak of the whole process is reported.
+
+Usage:
+    python benchmark_memory.py [track.wav] [--minutes 10] [--preset fast]
+    (without a track, a 10-minute stereo 44.1 kHz noise file is generated)
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+import torch
+
+import audio_processor
+import inference
+import model_registry
+
+
+def _rss_peak_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 / 1024
+
+
+def _reset_peak():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def legacy_separate(model, file_path, save_dir, settings, source_names):
+    """The pipeline as it was before the memory rework, kept for comparison."""
+    data, sr = sf.read(file_path)
+    wav = torch.from_numpy(data).float().t() if data.ndim > 1 else torch.from_numpy(data).float().unsqueeze(0)
+    wav = wav.unsqueeze(0)
+    ref = wav.mean(0)
+    wav = (wav - ref.mean()) / ref.std()
+    sources = inference.apply_segmented(model, wav.squeeze(0), shifts=settings["shifts"],
+                                        overlap=settings["overlap"]).unsqueeze(0)
+    sources = sources * ref.std() + ref.mean()
+    sources = sources.squeeze(0)
+    for name, source in zip(source_names, sources):
+        sf.write(os.path.join(save_dir, f"{name}.wav"), source.cpu().numpy().transpose(1, 0), sr)
+
+
+def current_separate(model, file_path, save_dir, settings, source_names):
+    audio_processor._separate_in_memory(model, file_path, save_dir, settings, source_names, "cpu",
+                                        None, None, None, None)
+
+
+def _run(variant, file_path, preset, queue):
+    _, settings = audio_processor.resolve_preset(preset)
+    model = model_registry.get_model(settings["model"], "cpu")
+    exact = _reset_peak()
+    baseline = _rss_peak_mb()
+    with tempfile.TemporaryDirectory() as save_dir:
+        start = time.perf_counter()
+        separate = legacy_separate if variant == "before" else current_separate
+        separate(model, file_path, save_dir, settings, list(model.sources))
+        elapsed = time.perf_counter() - start
+    queue.put((variant, _rss_peak_mb() - baseline, elapsed, exact))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", help="Track to separate (default: generated noise)")
+    parser.add_argument("--minutes", type=float, default=10.0, help="Length of the generated track")
+    parser.add_argument("--preset", default="fast", choices=list(audio_processor.PRESETS))
+    args = parser.parse_args()
+
+    file_path = args.file
+    tmp_dir = None
+    if not file_path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        file_path = os.path.join(tmp_dir.name, "benchmark.wav")
+        print(f"Generating {args.minutes:.0f}-minute test track...")
+        frames = int(args.minutes * 60 * 44100)
+        with sf.SoundFile(file_path, "w", samplerate=44100, channels=2) as f:
+            for start in range(0, frames, 44100 * 60):
+                f.write((np.random.randn(min(44100 * 60, frames - start), 2) * 0.1).astype(np.float32))
+
+    info = sf.info(file_path)
+    print(f"{file_path}: {info.duration / 60:.1f} min, {info.samplerate} Hz, {info.channels} ch, preset {args.preset}")
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    results = {}
+    for variant in ("before", "after"):
+        process = context.Process(target=_run, args=(variant, file_path, args.preset, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"  {variant}: failed (exit code {process.exitcode})")
+            continue
+        name, peak, elapsed, exact = queue.get()
+        results[name] = peak
+        print(f"  {name:6s} peak RSS above model: {peak:8.0f} MB  ({elapsed:.1f}s)"
+              + ("" if exact else "  [whole-process peak]"))
+    if len(results) == 2 and results["after"] > 0:
+        print(f"  reduction: {results['before'] / results['after']:.2f}x")
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares CPU inference precisions (see precision.py) on the same inputs.
+
+For every input file and precision mode this reports the real-time factor
+(processing time / audio duration, lower is faster) and the SDR of each stem
+against the float32 output, i.e. how much the reduced precision changes the result.
+
+Usage:
+    python benchmark_precision.py track1.wav [track2.wav ...] [--preset balanced] [--seconds 30]
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+import soundfile as sf
+import torch
+
+import audio_processor
+import inference
+import model_registry
+import precision
+
+
+def load_mix(path, seconds=None):
+    """Normalized (Channels, Time) float32 tensor plus its duration in seconds."""
+    data, sr = sf.read(path, dtype="float32", always_2d=True,
+                       frames=int(seconds * sf.info(path).samplerate) if seconds else -1)
+    wav = torch.from_numpy(data).t().contiguous()
+    wav = (wav - wav.mean()) / wav.std()
+    return wav, data.shape[0] / sr
+
+
+def sdr(reference, estimate):
+    """Signal-to-distortion ratio in dB of `estimate` against `reference`."""
+    noise = ((reference - estimate) ** 2).sum().item()
+    signal = (reference ** 2).sum().item()
+    return 10 * np.log10((signal + 1e-12) / (noise + 1e-12))
+
+
+def run(model, wav, settings, forward):
+    random.seed(0)  # Same shift offsets for every mode
+    start = time.perf_counter()
+    sources = inference.apply_segmented(model, wav, shifts=settings["shifts"],
+                                        overlap=settings["overlap"], infer=forward)
+    return sources, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="Audio files to separate")
+    parser.add_argument("--preset", default=audio_processor.DEFAULT_PRESET, choices=list(audio_processor.PRESETS))
+    parser.add_argument("--precisions", nargs="+", default=list(precision.PRECISIONS), choices=precision.PRECISIONS)
+    parser.add_argument("--seconds", type=float, default=None, help="Only use the first N seconds of each file")
+    args = parser.parse_args()
+
+    _, settings = audio_processor.resolve_preset(args.preset)
+    modes = ["fp32"] + [p for p in args.precisions if p != "fp32"]
+    print(f"Preset {args.preset}: {settings}, torch threads: {torch.get_num_threads()}")
+
+    for path in args.files:
+        wav, duration = load_mix(path, args.seconds)
+        print(f"\n{path} ({duration:.1f}s)")
+        baseline = None
+        for mode in modes:
+            effective = precision.resolve(mode)
+            if effective != mode:
+                print(f"  {mode:5s} skipped (not supported here)")
+                continue
+            model = model_registry.get_model(settings["model"], "cpu", precision.weights_variant(mode))
+            sources, elapsed = run(model, wav, settings, precision.forward_for(mode))
+            line = f"  {mode:5s} RTF {elapsed / duration:.3f} ({elapsed:.1f}s)"
+            if baseline is None:
+                baseline = sources
+                base_elapsed = elapsed
+            else:
+                deltas = ", ".join(f"{name} {sdr(ref, est):.1f} dB"
+                                   for name, ref, est in zip(model.sources, baseline, sources))
+                line += f"  speedup {base_elapsed / elapsed:.2f}x  SDR vs fp32: {deltas}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Times the resampling stage (resample.py) for 48 kHz and 96 kHz uploads.
+
+For each input rate a stereo test signal is converted to the model rate (44.1 kHz):
+    soxr HQ / VHQ  - resample.resample_array with soxr (vectorized over channels)
+    julius         - the fallback without soxr (torch, whole array)
+    cached_input   - the full stage as separation uses it: decode the WAV block by
+                     block, resample with soxr's stream, write the float32 copy
+The last column is the share of inference work the conversion saves: the model runs
+over input_rate / 44100 times fewer samples.
+
+Usage:
+    python benchmark_resample.py [--seconds 240] [--rates 48000 96000] [--repeats 3]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+import torch
+
+import resample
+
+MODEL_SAMPLERATE = 44100
+
+
+def best_of(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=240.0, help="Length of the test signal")
+    parser.add_argument("--rates", nargs="+", type=int, default=[48000, 96000])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for rate in args.rates:
+        x = (rng.standard_normal((int(args.seconds * rate), 2)) * 0.1).astype(np.float32)
+        print(f"{rate} Hz -> {MODEL_SAMPLERATE} Hz, {args.seconds:.0f}s stereo "
+              f"(inference over {1 - MODEL_SAMPLERATE / rate:.0%} fewer samples)")
+        results = {}
+        if resample.soxr is not None:
+            for quality in ("HQ", "VHQ"):
+                results[f"soxr {quality}"] = best_of(
+                    lambda: resample.soxr.resample(x, rate, MODEL_SAMPLERATE, quality=quality), args.repeats)
+        import julius
+        tensor = torch.from_numpy(np.ascontiguousarray(x.T))
+        results["julius"] = best_of(lambda: julius.resample_frac(tensor, rate, MODEL_SAMPLERATE), args.repeats)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "input.wav")
+            sf.write(path, x, rate, subtype="FLOAT")
+
+            def stage():
+                resample.discard_cached(path)
+                resample.cached_input(path, MODEL_SAMPLERATE)
+            results["cached_input"] = best_of(stage, args.repeats)
+
+        for name, elapsed in results.items():
+            print(f"  {name:13s} {elapsed * 1000:8.1f} ms  {args.seconds / elapsed:7.0f}x realtime")
+
+
+if __name__ == "__main__":
+    main()
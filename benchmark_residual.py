@@ -0,0 +1,83 @@
+"""
+Measures the residual "other" stem (see inference.residual_plan) against full inference.
+
+Separates each file twice with the same shift offsets: once with every sub-model,
+once with "other" derived as mixture minus drums, bass and vocals. Reports the
+time saved and the SDR of the residual "other" against the model's own "other".
+With `--reference` (the true "other" stem of a multitrack, e.g. from MUSDB18)
+both estimates are also scored against the ground truth, which is the number
+that tells whether the residual is acceptable.
+
+Usage:
+    python benchmark_residual.py track.wav [--reference other.wav] [--preset balanced] [--seconds 30]
+"""
+
+import argparse
+import time
+
+import soundfile as sf
+import torch
+
+import audio_processor
+import inference
+import model_registry
+from benchmark_precision import sdr
+
+
+def separate(model, wav, mean, std, settings, source_names):
+    """De-normalized (Sources, Channels, Time) output for `source_names` and the elapsed time."""
+    start = time.perf_counter()
+    sources = inference.apply_segmented(
+        model, wav, shifts=settings["shifts"], overlap=settings["overlap"],
+        source_indices=[list(model.sources).index(name) for name in source_names], seed=0
+    )
+    elapsed = time.perf_counter() - start
+    return sources.mul_(std).add_(mean), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", help="Mixture to separate")
+    parser.add_argument("--reference", default=None, help="Ground-truth 'other' stem of the same mixture")
+    parser.add_argument("--preset", default=audio_processor.DEFAULT_PRESET, choices=list(audio_processor.PRESETS))
+    parser.add_argument("--seconds", type=float, default=None, help="Only use the first N seconds")
+    args = parser.parse_args()
+
+    _, settings = audio_processor.resolve_preset(args.preset)
+    model = model_registry.get_model(settings["model"], "cpu")
+    source_names = list(model.sources)
+    inferred_names = inference.residual_plan(model, source_names)
+    if inferred_names is None:
+        print(f"{settings['model']} has no sub-model dedicated to '{inference.RESIDUAL_SOURCE}': "
+              f"the residual saves nothing")
+        return
+
+    frames = int(args.seconds * sf.info(args.file).samplerate) if args.seconds else -1
+    data, sr = sf.read(args.file, dtype="float32", always_2d=True, frames=frames)
+    mix = torch.from_numpy(data).t().contiguous()
+    mean, std = mix.mean().item(), mix.std().item()
+    wav = (mix - mean) / std
+    duration = data.shape[0] / sr
+    print(f"{args.file} ({duration:.1f}s), preset {args.preset}: {settings}")
+
+    full, full_elapsed = separate(model, wav, mean, std, settings, source_names)
+    inferred, residual_elapsed = separate(model, wav, mean, std, settings, inferred_names)
+    residual = inference.add_residual(mix.clone(), inferred, inferred_names, source_names)
+
+    model_other = full[source_names.index(inference.RESIDUAL_SOURCE)]
+    residual_other = residual[source_names.index(inference.RESIDUAL_SOURCE)]
+    print(f"  full inference     {full_elapsed:7.1f}s  RTF {full_elapsed / duration:.3f}")
+    print(f"  residual 'other'   {residual_elapsed:7.1f}s  RTF {residual_elapsed / duration:.3f}  "
+          f"({1 - residual_elapsed / full_elapsed:.0%} time saved)")
+    print(f"  SDR residual vs model 'other': {sdr(model_other, residual_other):.1f} dB")
+
+    if args.reference:
+        ref_data, _ = sf.read(args.reference, dtype="float32", always_2d=True, frames=frames)
+        reference = torch.from_numpy(ref_data).t()
+        length = min(reference.shape[-1], model_other.shape[-1])
+        print(f"  SDR vs reference: model 'other' {sdr(reference[..., :length], model_other[..., :length]):.1f} dB, "
+              f"residual 'other' {sdr(reference[..., :length], residual_other[..., :length]):.1f} dB")
+
+
+if __name__ == "__main__":
+    main()
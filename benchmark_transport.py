@@ -0,0 +1,82 @@
+"""
+Compares the two ways parallel.ChunkPool moves audio to and from its worker processes.
+
+A worker receives a (Channels, Time) float32 chunk and returns a four-stem
+(Sources, Channels, Time) output, but skips the model, so only the transfer is timed:
+    pickle - the arrays travel through the pool's pipes (serialized both ways)
+    shm    - the arrays live in multiprocessing.shared_memory blocks and only
+             their names are sent (what ChunkPool uses by default)
+
+Usage:
+    python benchmark_transport.py [--seconds 30 60 300] [--repeats 5]
+"""
+
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import parallel
+
+SAMPLERATE = 44100
+CHANNELS = 2
+SOURCES = 4
+
+
+def _echo_pickle(chunk):
+    return np.broadcast_to(chunk, (SOURCES,) + chunk.shape).copy()
+
+
+def _echo_shm(descriptors):
+    shared_in, shared_out = (parallel.SharedArray.attach(d) for d in descriptors)
+    np.copyto(shared_out.array, shared_in.array)
+    shared_in.close()
+    shared_out.close()
+
+
+def transfer_pickle(executor, chunk):
+    return executor.submit(_echo_pickle, chunk).result()
+
+
+def transfer_shm(executor, chunk):
+    shared_in = parallel.SharedArray(chunk.shape)
+    shared_out = parallel.SharedArray((SOURCES,) + chunk.shape)
+    np.copyto(shared_in.array, chunk)
+    executor.submit(_echo_shm, (shared_in.descriptor, shared_out.descriptor)).result()
+    checksum = float(shared_out.array[-1, :, -1].sum())  # Parent reads the output in place
+    shared_in.close()
+    shared_out.close()
+    return checksum
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", nargs="+", type=float, default=[30, 60, 300], help="Chunk lengths to transfer")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    executor.submit(int).result()  # Start the worker before timing
+    try:
+        for seconds in args.seconds:
+            chunk = np.random.randn(CHANNELS, int(seconds * SAMPLERATE)).astype(np.float32)
+            megabytes = chunk.nbytes * (1 + SOURCES) / 1e6
+            print(f"{seconds:.0f}s chunk: {megabytes:.0f} MB moved per round trip (input + {SOURCES} stems)")
+            results = {}
+            for name, transfer in (("pickle", transfer_pickle), ("shm", transfer_shm)):
+                transfer(executor, chunk)  # Warm-up
+                start = time.perf_counter()
+                for _ in range(args.repeats):
+                    transfer(executor, chunk)
+                elapsed = (time.perf_counter() - start) / args.repeats
+                results[name] = elapsed
+                print(f"  {name:6s} {elapsed * 1000:8.1f} ms  {megabytes / elapsed:8.0f} MB/s")
+            print(f"  shared memory is {results['pickle'] / results['shm']:.1f}x faster")
+    finally:
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 
 block_cipher = None
 
+import os
 import sys
 from PyInstaller.utils.hooks import collect_submodules, collect_data_files
 
@@ -23,6 +24,9 @@ datas = [
     ('frontend', 'frontend'),
     ('ffmpeg.exe', '.'), 
 ]
+# Pre-fetched weights (python model_store.py fetch htdemucs htdemucs_ft), so the app starts offline
+if os.path.isdir('model_store'):
+    datas.append(('model_store', 'model_store'))
 datas += collect_data_files('demucs')
 datas += collect_data_files('torchaudio')
 
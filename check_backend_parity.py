@@ -0,0 +1,83 @@
+"""
+Checks compiled inference backends (see backends.py) against eager PyTorch.
+
+Runs the same segment batch through every sub-model of the selected model with
+eager PyTorch and with each backend, then reports the largest deviation and the
+throughput (segments per second, after the artifact is built). Exits non-zero
+if any backend is outside the tolerance.
+
+Usage:
+    python check_backend_parity.py [--model htdemucs] [--backends torchscript compile]
+                                   [--file track.wav] [--batch 1] [--repeats 3] [--atol 1e-3]
+"""
+
+import argparse
+import sys
+import time
+
+import soundfile as sf
+import torch
+from demucs.apply import TensorChunk
+
+import backends
+import inference
+import model_registry
+
+
+def segment_batch(model, batch_size, file_path=None):
+    """(B, C, valid_length) input: consecutive segments of `file_path`, or noise."""
+    segment_length = int(model.samplerate * model.segment)
+    length = model.valid_length(segment_length) if hasattr(model, "valid_length") else segment_length
+    if file_path:
+        data, _ = sf.read(file_path, dtype="float32", always_2d=True, frames=length * batch_size)
+        wav = torch.from_numpy(data).t().contiguous()
+        wav = (wav - wav.mean()) / wav.std()
+        chunks = [TensorChunk(wav, i * length, length).padded(length) for i in range(batch_size)]
+        return torch.stack(chunks)
+    torch.manual_seed(0)
+    return torch.randn(batch_size, model.audio_channels, length)
+
+
+def timed(forward, model, batch, repeats):
+    forward(model, batch)  # Warm-up (and artifact build for compiled backends)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        out = forward(model, batch)
+    return out, repeats * batch.shape[0] / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="htdemucs")
+    parser.add_argument("--backends", nargs="+", default=[b for b in backends.BACKENDS if b != "eager"],
+                        choices=backends.BACKENDS)
+    parser.add_argument("--file", default=None, help="Audio file to take segments from (default: noise)")
+    parser.add_argument("--batch", type=int, default=1, help="Segments per forward pass")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--atol", type=float, default=1e-3, help="Max allowed absolute difference")
+    args = parser.parse_args()
+
+    model = model_registry.get_model(args.model, "cpu")
+    failed = False
+    for index, (sub_model, _) in enumerate(inference.sub_models(model)):
+        batch = segment_batch(sub_model, args.batch, args.file)
+        reference, eager_rate = timed(inference.forward, sub_model, batch, args.repeats)
+        print(f"{args.model} sub-model {index}: input {list(batch.shape)}")
+        print(f"  {'eager':12s} {eager_rate:7.2f} segments/s")
+        for name in args.backends:
+            backend = backends.get_backend(name)
+            fallbacks = backend.fallbacks
+            out, rate = timed(backend.forward, sub_model, batch, args.repeats)
+            if backend.fallbacks > fallbacks:
+                print(f"  {name:12s} not available (fell back to eager, see warning above)")
+                continue
+            diff = (out - reference).abs().max().item()
+            ok = diff <= args.atol
+            failed |= not ok
+            print(f"  {name:12s} {rate:7.2f} segments/s  {rate / eager_rate:.2f}x  "
+                  f"max |diff| {diff:.2e}  {'OK' if ok else 'FAIL'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Drum Extractor Pro - CPU Thread Topology Module
+===============================================
+
+Decides how many torch threads each inference worker uses and which cores it runs on.
+
+Why:
+    Every thread that runs a forward pass uses torch's default intra-op thread
+    count, which is all cores. With N concurrent separations, N thread pools each
+    try to use the whole machine and oversubscribe it. Context switches and cache
+    thrashing then eat the gain from running jobs in parallel.
+
+How:
+    The usable cores (the process affinity mask) are split evenly between the
+    inference workers. Each worker thread calls `torch.set_num_threads` for its
+    share when it starts. The intra-op setting is per calling thread with torch's
+    OpenMP backend. With pinning enabled, each worker is also restricted to a
+    disjoint core set (`os.sched_setaffinity` on the thread, Linux only). The OpenMP
+    threads it spawns inherit that set. The inter-op pool is process-wide and is
+    sized once at startup.
+
+Configuration:
+    INFERENCE_THREADS: Intra-op threads per worker (default 0 = cores / workers).
+    INTEROP_THREADS: torch inter-op threads (default 0 = leave torch's default).
+    PIN_WORKERS: 1 pins each worker to its own core set (default 0).
+"""
+
+import os
+import threading
+from typing import List, Optional, Sequence
+
+import torch
+
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", "0"))
+INTEROP_THREADS = int(os.environ.get("INTEROP_THREADS", "0"))
+PIN_WORKERS = os.environ.get("PIN_WORKERS", "0") == "1"
+
+
+def available_cores() -> List[int]:
+    """CPU ids this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ThreadLayout:
+    """
+    Thread budget and optional core sets for `workers` concurrent inference threads.
+
+    Args:
+        workers (int): Number of threads running forward passes concurrently.
+        threads_per_worker (int): Intra-op threads per worker (0 = split cores evenly).
+        interop_threads (int): Process-wide inter-op threads (0 = torch default).
+        pin (bool): Restrict each worker to a disjoint set of cores.
+        cores (Sequence[int]): Cores to distribute (defaults to `available_cores()`).
+    """
+
+    def __init__(self, workers: int = 1, threads_per_worker: int = 0, interop_threads: int = 0,
+                 pin: bool = False, cores: Optional[Sequence[int]] = None):
+        self.cores = list(cores) if cores is not None else available_cores()
+        self.workers = max(1, int(workers))
+        self.threads_per_worker = threads_per_worker or max(1, len(self.cores) // self.workers)
+        self.interop_threads = interop_threads
+        self.pin = pin and hasattr(os, "sched_setaffinity")
+        self.core_sets = self._split_cores() if self.pin else None
+        self._interop_applied = False
+
+    def _split_cores(self) -> List[List[int]]:
+        # Consecutive ids keep a worker's threads on neighbouring cores (shared caches).
+        # With more threads requested than cores, sets wrap around and overlap.
+        n = len(self.cores)
+        return [[self.cores[(slot * self.threads_per_worker + i) % n] for i in range(min(self.threads_per_worker, n))]
+                for slot in range(self.workers)]
+
+    def apply_process(self) -> None:
+        """Sets the process-wide inter-op pool. Must run before any parallel torch work."""
+        if self._interop_applied or not self.interop_threads:
+            return
+        self._interop_applied = True
+        try:
+            torch.set_num_interop_threads(self.interop_threads)
+        except RuntimeError as e:
+            # Raised once torch has already started inter-op work
+            print(f"Warning: Could not set inter-op threads: {e}")
+
+    def apply_worker(self, slot: int) -> None:
+        """Configures the calling thread as inference worker `slot`."""
+        if self.core_sets:
+            # pid 0 = calling thread; OpenMP threads spawned later inherit the mask
+            os.sched_setaffinity(0, self.core_sets[slot % self.workers])
+        torch.set_num_threads(self.threads_per_worker)
+
+    def apply_shared(self) -> None:
+        """Configures a thread that runs forward passes for all workers (e.g. the batcher)."""
+        if self.core_sets:
+            os.sched_setaffinity(0, sorted({core for cores in self.core_sets for core in cores}))
+        torch.set_num_threads(min(len(self.cores), self.threads_per_worker * self.workers))
+
+    def report(self) -> str:
+        """Human-readable summary of the layout, printed at startup."""
+        lines = [
+            f"CPU layout: {len(self.cores)} usable cores, {self.workers} inference worker(s) "
+            f"x {self.threads_per_worker} intra-op thread(s)",
+            f"  inter-op threads: {self.interop_threads or torch.get_num_interop_threads()}"
+            + ("" if self.interop_threads else " (torch default)"),
+        ]
+        if self.threads_per_worker * self.workers > len(self.cores):
+            lines.append("  Warning: more threads than cores, workers will compete for CPU")
+        if self.core_sets:
+            for slot, cores in enumerate(self.core_sets):
+                lines.append(f"  worker {slot}: cores {_format_cores(cores)}")
+        else:
+            lines.append("  pinning: off")
+        return "\n".join(lines)
+
+
+def _format_cores(cores: Sequence[int]) -> str:
+    """[0, 1, 2, 5] -> "0-2,5"."""
+    ranges = []
+    for core in sorted(cores):
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+_configured = threading.local()
+
+
+def configure_current_thread(layout: ThreadLayout, slot: int = 0) -> None:
+    """Applies `layout` to the calling thread once (for callers without a worker pool)."""
+    if getattr(_configured, "layout", None) is layout:
+        return
+    layout.apply_process()
+    layout.apply_worker(slot)
+    _configured.layout = layout
@@ -0,0 +1,321 @@
+"""
+Drum Extractor Pro - Audio Decoder Module
+=========================================
+
+One streaming decoder front-end for every path that reads audio.
+
+Why:
+    Separation read its input with `sf.read`, analysis and time stretching with
+    `librosa.load`, and mixing with pydub, each decoding the whole file into memory
+    first. Which compressed formats worked depended on the libsndfile version
+    (MP3 needs 1.1+, M4A/AAC is never supported) or on librosa's audioread
+    fallback, which is slow for MP3.
+
+How:
+    `blocks()` yields float32 (Frames, Channels) blocks of a file, optionally from
+    an offset, for a limited length, overlapping, down/up-mixed to a channel count
+    and at a requested sample rate. Two backends:
+        soundfile - formats libsndfile opens, read with `SoundFile.blocks`
+                    (sample rate conversion through soxr, streamed)
+        ffmpeg    - everything else: an ffmpeg subprocess decodes (and resamples)
+                    to raw float32 on a pipe, which is read block by block
+    `read()` collects the blocks into one array and `probe()` returns the sample
+    rate, channel count, length and (soundfile) sample subtype.
+
+    `UploadTranscoder` decodes an upload while its bytes are still arriving: the
+    API feeds it each received chunk, ffmpeg decodes from stdin into a float32 WAV
+    next to the upload, and every later step reads that WAV through soundfile
+    (seekable, exact length). Given a sample rate, the same ffmpeg run resamples to
+    it, so the model-rate copy (resample.cached_input) is that file and no second
+    one is written. Outputs beyond the 4 GiB RIFF limit become RF64 (`-rf64 auto`).
+    Containers that cannot be decoded from a pipe (MP4 with its index at the end)
+    are decoded from the stored file after the upload.
+
+Configuration:
+    AUDIO_DECODER: "auto" (default: soundfile when it can open the file, ffmpeg
+        otherwise), "soundfile" or "ffmpeg".
+    FFMPEG_BINARY: ffmpeg executable (default "ffmpeg" on PATH); ffprobe is
+        expected next to it.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+DECODERS = ("auto", "soundfile", "ffmpeg")
+DECODER = os.environ.get("AUDIO_DECODER", "auto")
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+# Uploads with these extensions are read by soundfile directly, never transcoded
+NATIVE_EXTENSIONS = {".wav", ".flac", ".aif", ".aiff"}
+DEFAULT_BLOCK_FRAMES = 1 << 16
+
+
+class DecoderError(Exception):
+    pass
+
+
+class AudioInfo(NamedTuple):
+    samplerate: int
+    channels: int
+    frames: int  # Exact for soundfile, derived from the container duration for ffmpeg
+    backend: str
+    subtype: Optional[str] = None  # soundfile subtype ("PCM_24", "FLOAT", ...); None for ffmpeg
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.samplerate
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG_BINARY) is not None
+
+
+def _ffprobe_binary() -> str:
+    directory, name = os.path.split(FFMPEG_BINARY)
+    return os.path.join(directory, name.replace("ffmpeg", "ffprobe"))
+
+
+def _backend(file_path: str) -> str:
+    if DECODER not in DECODERS:
+        raise DecoderError(f"Unknown decoder '{DECODER}'. Choose from: {', '.join(DECODERS)}")
+    if DECODER != "auto":
+        return DECODER
+    try:
+        sf.info(file_path)
+        return "soundfile"
+    except RuntimeError:  # soundfile.LibsndfileError
+        if ffmpeg_available():
+            return "ffmpeg"
+        raise DecoderError(f"Cannot decode {os.path.basename(file_path)}: libsndfile does not support "
+                           f"the format and {FFMPEG_BINARY} is not installed")
+
+
+def probe(file_path: str) -> AudioInfo:
+    """Sample rate, channel count and length of `file_path`."""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    if _backend(file_path) == "soundfile":
+        info = sf.info(file_path)
+        return AudioInfo(info.samplerate, info.channels, info.frames, "soundfile", info.subtype)
+    result = subprocess.run(
+        [_ffprobe_binary(), "-v", "error", "-select_streams", "a:0",
+         "-show_entries", "stream=sample_rate,channels:format=duration", "-of", "json", file_path],
+        capture_output=True, text=True
+    )
+    try:
+        probed = json.loads(result.stdout)
+        stream = probed["streams"][0]
+        samplerate = int(stream["sample_rate"])
+        return AudioInfo(samplerate, int(stream["channels"]),
+                         int(round(float(probed["format"]["duration"]) * samplerate)), "ffmpeg")
+    except (ValueError, KeyError, IndexError):
+        raise DecoderError(f"ffprobe could not read {os.path.basename(file_path)}: {result.stderr.strip()}")
+
+
+def _mix_channels(block: np.ndarray, channels: int) -> np.ndarray:
+    if block.shape[1] == channels:
+        return block
+    if channels == 1:
+        return block.mean(axis=1, keepdims=True)
+    if block.shape[1] == 1:
+        return np.repeat(block, channels, axis=1)
+    raise DecoderError(f"Cannot convert {block.shape[1]} channels to {channels}")
+
+
+def _resample_chunks(chunks: Iterable[np.ndarray], in_rate: int, out_rate: int, channels: int) -> Iterator[np.ndarray]:
+    try:
+        import soxr  # Installed with librosa
+    except ImportError:
+        raise DecoderError("Sample rate conversion needs the 'soxr' package (or ffmpeg)")
+    import resample  # Imports this module
+    stream = soxr.ResampleStream(in_rate, out_rate, channels, dtype="float32", quality=resample.QUALITY)
+    for chunk in chunks:
+        out = stream.resample_chunk(chunk)
+        if len(out):
+            yield out
+    out = stream.resample_chunk(np.zeros((0, channels), dtype=np.float32), last=True)
+    if len(out):
+        yield out
+
+
+def _ffmpeg_chunks(file_path: str, offset: float, duration: Optional[float], samplerate: int,
+                   channels: int, chunk_frames: int) -> Iterator[np.ndarray]:
+    command = [FFMPEG_BINARY, "-v", "error", "-nostdin"]
+    if offset:
+        command += ["-ss", f"{offset:.6f}"]
+    command += ["-i", file_path]
+    if duration is not None:
+        command += ["-t", f"{duration:.6f}"]
+    command += ["-map", "0:a:0", "-f", "f32le", "-ac", str(channels), "-ar", str(samplerate), "pipe:1"]
+    frame_bytes = channels * 4
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors)
+        try:
+            while True:
+                buffer = bytearray(chunk_frames * frame_bytes)
+                view = memoryview(buffer)
+                filled = 0
+                while filled < len(buffer):
+                    n = process.stdout.readinto(view[filled:])
+                    if not n:
+                        break
+                    filled += n
+                usable = filled - filled % frame_bytes
+                if usable:
+                    yield np.frombuffer(buffer, dtype="<f4", count=usable // 4).reshape(-1, channels)
+                if filled < len(buffer):
+                    break
+            if process.wait() != 0:
+                errors.seek(0)
+                raise DecoderError(f"ffmpeg failed on {os.path.basename(file_path)}: "
+                                   f"{errors.read().decode(errors='replace').strip()}")
+        finally:
+            # Also reached when the consumer stops early: don't leave ffmpeg running
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+
+def _reblock(chunks: Iterable[np.ndarray], block_frames: int, overlap: int) -> Iterator[np.ndarray]:
+    """Regroups arbitrary chunks into blocks of `block_frames` sharing `overlap` frames (like SoundFile.blocks)."""
+    pending: Optional[np.ndarray] = None
+    emitted = False
+    for chunk in chunks:
+        pending = chunk if pending is None or not len(pending) else np.concatenate([pending, chunk])
+        while len(pending) >= block_frames:
+            # Overlapping blocks would share memory; consumers normalize blocks in place
+            yield pending[:block_frames].copy() if overlap else pending[:block_frames]
+            emitted = True
+            pending = pending[block_frames - overlap:]
+    if pending is not None and (len(pending) > overlap or (not emitted and len(pending))):
+        yield pending
+
+
+def blocks(file_path: str, block_frames: int = DEFAULT_BLOCK_FRAMES, overlap: int = 0, offset: float = 0.0,
+           duration: Optional[float] = None, samplerate: Optional[int] = None,
+           channels: Optional[int] = None) -> Iterator[np.ndarray]:
+    """
+    Decodes `file_path` into float32 (Frames, Channels) blocks.
+
+    Args:
+        block_frames: Frames per block (the last block may be shorter).
+        overlap: Frames each block repeats from the end of the previous one.
+        offset / duration: Seconds to skip / to decode (None = to the end).
+        samplerate / channels: Output format (None = the file's own).
+    """
+    backend = _backend(file_path)
+    info = probe(file_path)
+    samplerate = samplerate or info.samplerate
+    channels = channels or info.channels
+
+    if backend == "ffmpeg":
+        chunks = _ffmpeg_chunks(file_path, offset, duration, samplerate, channels, max(1, block_frames - overlap))
+        yield from _reblock(chunks, block_frames, overlap)
+        return
+
+    with sf.SoundFile(file_path) as f:
+        start = int(round(offset * f.samplerate))
+        frames = -1 if duration is None else int(round(duration * f.samplerate))
+        if start:
+            f.seek(min(start, f.frames))
+        if samplerate == f.samplerate:
+            for block in f.blocks(blocksize=block_frames, overlap=overlap, frames=frames,
+                                  dtype="float32", always_2d=True):
+                yield _mix_channels(block, channels)
+            return
+        chunks = (_mix_channels(block, channels)
+                  for block in f.blocks(blocksize=DEFAULT_BLOCK_FRAMES, frames=frames, dtype="float32", always_2d=True))
+        yield from _reblock(_resample_chunks(chunks, f.samplerate, samplerate, channels), block_frames, overlap)
+
+
+def read(file_path: str, offset: float = 0.0, duration: Optional[float] = None, samplerate: Optional[int] = None,
+         channels: Optional[int] = None) -> Tuple[np.ndarray, int]:
+    """Decodes (a window of) `file_path` into one float32 (Frames, Channels) array. Returns (data, samplerate)."""
+    info = probe(file_path)
+    if info.backend == "soundfile" and samplerate in (None, info.samplerate):
+        # Native rate: one allocation, no block copies
+        data, sr = sf.read(file_path, start=int(round(offset * info.samplerate)),
+                           frames=-1 if duration is None else int(round(duration * info.samplerate)),
+                           dtype="float32", always_2d=True)
+        return _mix_channels(data, channels or info.channels), sr
+    parts = list(blocks(file_path, offset=offset, duration=duration, samplerate=samplerate, channels=channels))
+    channels = channels or info.channels
+    data = np.concatenate(parts) if parts else np.zeros((0, channels), dtype=np.float32)
+    return data, samplerate or info.samplerate
+
+
+class UploadTranscoder:
+    """
+    Decodes an upload to a float32 WAV at `out_path` while it is being received.
+
+    Call `feed()` with every received chunk, then `finish()` with the stored upload.
+    `abort()` stops ffmpeg and removes the partial output. With `samplerate`, the
+    WAV is resampled to that rate; otherwise it keeps the upload's rate.
+    """
+
+    def __init__(self, out_path: str, samplerate: Optional[int] = None):
+        self.out_path = str(out_path)
+        self.samplerate = samplerate
+        self.failed = False
+        self._errors = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            [FFMPEG_BINARY, "-v", "error", "-y", "-i", "pipe:0"] + self._output_args(),
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._errors
+        )
+
+    def _output_args(self) -> list:
+        args = ["-map", "0:a:0", "-c:a", "pcm_f32le"]
+        if self.samplerate:
+            args += ["-ar", str(self.samplerate)]
+        # Float32 stereo passes 4 GiB after ~3.4 hours at 44.1 kHz; RIFF sizes are 32-bit
+        return args + ["-f", "wav", "-rf64", "auto", self.out_path]
+
+    @staticmethod
+    def wanted(filename: str) -> bool:
+        """True if uploads named `filename` should be transcoded (compressed, ffmpeg present)."""
+        return (DECODER != "soundfile" and ffmpeg_available()
+                and os.path.splitext(filename)[1].lower() not in NATIVE_EXTENSIONS)
+
+    def feed(self, data: bytes) -> None:
+        """Blocking: hands `data` to ffmpeg (returns once ffmpeg has taken it)."""
+        if self.failed:
+            return
+        try:
+            self._process.stdin.write(data)
+        except (BrokenPipeError, OSError):
+            self.failed = True  # ffmpeg gave up; finish() retries from the stored file
+
+    def finish(self, stored_path: str) -> bool:
+        """Completes the decode; falls back to decoding `stored_path`. Returns True if out_path is usable."""
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        ok = self._process.wait() == 0 and not self.failed
+        if not ok:
+            self._errors.seek(0)
+            print(f"Streaming decode failed ({self._errors.read().decode(errors='replace').strip()}), "
+                  f"decoding the stored upload instead")
+            ok = subprocess.run(
+                [FFMPEG_BINARY, "-v", "error", "-nostdin", "-y", "-i", str(stored_path)] + self._output_args(),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            ).returncode == 0
+        self._errors.close()
+        if not ok and os.path.exists(self.out_path):
+            os.remove(self.out_path)
+        return ok
+
+    def abort(self) -> None:
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        self._errors.close()
+        if os.path.exists(self.out_path):
+            os.remove(self.out_path)
@@ -12,6 +12,8 @@ const mixer = document.getElementById('mixer');
 const mixerControls = document.getElementById('mixer-controls');
 const keyBadge = document.getElementById('key-badge');
 const keyText = keyBadge.querySelector('span');
+const previewBadge = document.getElementById('preview-badge');
+const previewText = previewBadge.querySelector('span');
 const masterPlayBtn = document.getElementById('master-play');
 const masterStopBtn = document.getElementById('master-stop');
 const backBtn = document.getElementById('back-btn');
@@ -27,6 +29,7 @@ let soloTrack = null;
 let currentTrackName = "";
 let currentUploadController = null;
 let pollInterval = null; // For progress polling
+let previewLoaded = false; // Preview stems are playing while the full separation runs
 
 const stemOrder = ['drums', 'bass', 'vocals', 'other'];
 const MAX_FILE_SIZE = 200 * 1024 * 1024; // 200 MB
@@ -423,7 +426,7 @@ function generateUUID() { // Simple UUID generator
     });
 }
 
-function updateProgressUI(percent, status, startTime) {
+function updateProgressUI(percent, status, startTime, queuePosition) {
     percent = Math.max(0, Math.min(100, percent));
     progressBar.style.width = `${percent}%`;
 
@@ -442,6 +445,11 @@ function updateProgressUI(percent, status, startTime) {
         }
     }
 
+    if (status === 'queued' && queuePosition) {
+        progressText.innerText = `QUEUED (#${queuePosition})...`;
+        return;
+    }
+
     progressText.innerText = `${status.toUpperCase()}... ${Math.round(percent)}%${timeText}`;
 }
 
@@ -454,8 +462,17 @@ async function startProgressPolling(taskId) {
         try {
             const res = await fetch(`${API_URL}/progress/${taskId}`);
             if (res.ok) {
-                const data = await res.json(); // { progress: int, status: str }
-                updateProgressUI(data.progress, data.status, startTime);
+                const data = await res.json(); // { progress: int, status: str, queue_position?: int, preview?: stems }
+                updateProgressUI(data.progress, data.status, startTime, data.queue_position);
+                if (data.preview && !previewLoaded) {
+                    // Start playback early with the fast centre-window preview
+                    previewLoaded = true;
+                    loadTrackUI("Preview", null, data.preview);
+                }
+                if (previewLoaded) {
+                    previewText.innerText = `FULL TRACK ${Math.round(data.progress || 0)}%`;
+                    previewBadge.classList.add('visible');
+                }
             }
         } catch (e) {
             console.error("Polling error", e);
@@ -468,6 +485,8 @@ function stopProgressPolling() {
         clearInterval(pollInterval);
         pollInterval = null;
     }
+    previewLoaded = false;
+    previewBadge.classList.remove('visible');
     progressContainer.style.display = 'none';
     progressBar.style.width = '0%';
     progressText.innerText = 'INITIALIZING...';
@@ -536,7 +555,9 @@ async function handleFile(file) {
         // Start Polling
         startProgressPolling(taskId);
 
-        const res = await fetch(`${API_URL}/separate?task_id=${taskId}`, {
+        const presetSelect = document.getElementById('preset-select');
+        const preset = presetSelect ? presetSelect.value : 'balanced';
+        const res = await fetch(`${API_URL}/separate?task_id=${taskId}&preset=${preset}`, {
             method: 'POST',
             body: formData,
             signal: signal
@@ -566,7 +587,8 @@ async function handleFile(file) {
         const trackId = data.id || file.name.replace(/\.[^/.]+$/, "");
         saveToHistory(trackId, data.key || 'Unknown', data.stems);
 
-        // Render
+        // Render (replaces the preview stems if they were playing)
+        if (previewLoaded) stopAll();
         loadTrackUI(trackId, data.key, data.stems);
 
     } catch (err) {
@@ -714,7 +736,14 @@ async function initMixer(stems) {
             autoCenter: true,
         });
 
-        players[name].load(stems[name].playback);
+        if (stems[name].silent) {
+            // Silent stem (synthesized by the server): flat peaks and the known duration,
+            // so Wavesurfer neither fetches nor decodes the whole file up front
+            channel.classList.add('silent');
+            players[name].load(stems[name].playback, [[0]], stems[name].duration);
+        } else {
+            players[name].load(stems[name].playback);
+        }
 
         // Force state to ensure sound works
         players[name].on('ready', () => {
@@ -0,0 +1,329 @@
+"""
+Drum Extractor Pro - Inference Engine Module
+============================================
+
+Segment loop used to run a Demucs model over a full track.
+
+Why:
+    `demucs.apply.apply_model` hides its segment loop and always feeds the network
+    one segment of one track at a time. Owning the loop lets us hand segments to a
+    shared batcher (several tracks per forward pass) and report progress per job.
+
+How:
+    Mirrors `apply_model`: bag-of-models weighting, the random "shift trick", and
+    overlap-add of fixed-length segments with a triangular crossfade window.
+    Segments are pushed through an `infer(model, batch)` callable in groups, so the
+    forward pass itself can be batched locally or across requests. With a
+    `checkpoint` (see checkpoint.py), finished segment outputs are saved in groups
+    and reused on resume. With a `silence` detector (see silence.py), segments whose input is
+    silent are not run at all.
+    `residual_plan`/`add_residual` derive "other" as mixture minus the other
+    sources, which saves the pass of its dedicated sub-model in htdemucs_ft.
+
+Shapes:
+    mix: (Channels, Time) -> returns (Sources, Channels, Time), Sources being the
+    requested subset of `model.sources`.
+"""
+
+import random
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import torch
+from demucs.apply import BagOfModels, TensorChunk
+from demucs.utils import center_trim
+
+from checkpoint import SEGMENTS_PER_SAVE
+
+InferFn = Callable[[torch.nn.Module, torch.Tensor], torch.Tensor]
+# Source that can be derived as mixture minus the others (see residual_plan)
+RESIDUAL_SOURCE = "other"
+
+
+class CancellationException(Exception):
+    pass
+
+
+def forward(model: torch.nn.Module, batch: torch.Tensor) -> torch.Tensor:
+    """Default `infer`: plain eager forward pass. batch: (B, C, L) -> (B, S, C, L)."""
+    with torch.no_grad():
+        return model(batch)
+
+
+def sub_models(model: torch.nn.Module) -> List[Tuple[torch.nn.Module, Sequence[float]]]:
+    """Returns (sub_model, per-source weights) pairs for a bag or a single model."""
+    if isinstance(model, BagOfModels):
+        return list(zip(model.models, model.weights))
+    return [(model, [1.0] * len(model.sources))]
+
+
+def segment_window(segment_length: int, device, transition_power: float = 1.0) -> torch.Tensor:
+    """Triangular overlap-add window, peaking in the middle of the segment (same as demucs)."""
+    weight = torch.cat([torch.arange(1, segment_length // 2 + 1, device=device),
+                        torch.arange(segment_length - segment_length // 2, 0, -1, device=device)])
+    return (weight / weight.max()) ** transition_power
+
+
+class _Progress:
+    """Counts processed segments across sub-models and shifts for one job."""
+
+    def __init__(self, total: int, callback=None, cancel_check=None):
+        self.total = max(1, total)
+        self.done = 0
+        self.callback = callback
+        self.cancel_check = cancel_check
+
+    def check_cancel(self):
+        if self.cancel_check and self.cancel_check():
+            raise CancellationException("Task cancelled by user")
+
+    def advance(self, n: int):
+        self.done += n
+        if self.callback:
+            self.callback(min(100.0, self.done / self.total * 100))
+
+
+def _segment_geometry(model, length: int, segment: Optional[float], overlap: float):
+    if segment is None:
+        segment = model.segment
+    segment_length = int(model.samplerate * segment)
+    stride = int((1 - overlap) * segment_length)
+    offsets = list(range(0, length, stride))
+    return segment_length, offsets
+
+
+def segment_stride(model: torch.nn.Module, overlap: float, segment: Optional[float] = None) -> int:
+    """Distance in samples between consecutive segment offsets (of the first bag member)."""
+    sub_model = sub_models(model)[0][0]
+    segment_length, _ = _segment_geometry(sub_model, 0, segment, overlap)
+    return int((1 - overlap) * segment_length)
+
+
+def _run_segments(model, mix, overlap, segment, batch_segments, infer, device, progress, source_indices,
+                  checkpoint=None, silence=None, silent_frames=None, mix_offset=0, saved_sources=None):
+    """
+    Overlap-add over fixed-length segments of `mix` for a single (non-bag) model.
+
+    `silent_frames` is `silence.scan()` of the original mix; sample `i` of `mix`
+    is sample `i + mix_offset` there (the shift trick runs on an offset view).
+
+    With a `checkpoint`, the outputs of every SEGMENTS_PER_SAVE consecutive segments
+    are saved as one group, restricted to the positions `saved_sources` of the
+    requested sources (default: all). Sources left out must not matter to the
+    caller (zero bag weight); they come back as silence when a group is reloaded.
+    """
+    length = mix.shape[-1]
+    segment_length, offsets = _segment_geometry(model, length, segment, overlap)
+    if hasattr(model, "valid_length"):
+        valid_length = model.valid_length(segment_length)
+    else:
+        valid_length = segment_length
+
+    channels = mix.shape[0]
+    out = torch.zeros(len(source_indices), channels, length, device=mix.device)
+    sum_weight = torch.zeros(length, device=mix.device)
+    window = segment_window(segment_length, mix.device)
+
+    if silence is not None:
+        # Silent segments (model padding context included) are filled in directly
+        # and still crossfade with their neighbours in the overlap-add below
+        active = []
+        for offset in offsets:
+            chunk_length = min(segment_length, length - offset)
+            context = (valid_length - chunk_length) // 2 + 1  # TensorChunk.padded reads this far around
+            skipped = silence.is_silent(silent_frames, mix_offset + offset - context,
+                                        mix_offset + offset + chunk_length + context)
+            silence.count(skipped)
+            if not skipped:
+                active.append(offset)
+                continue
+            weight = window[:chunk_length]
+            out[..., offset:offset + chunk_length] += weight * silence.value
+            sum_weight[offset:offset + chunk_length] += weight
+        progress.advance(len(offsets) - len(active))
+        offsets = active
+
+    if saved_sources is None:
+        saved_sources = list(range(len(source_indices)))
+
+    def add(offset, chunk_out, positions=slice(None)):
+        weight = window[:chunk_out.shape[-1]]
+        out[positions, :, offset:offset + chunk_out.shape[-1]] += weight * chunk_out
+        sum_weight[offset:offset + chunk_out.shape[-1]] += weight
+
+    # Saved groups span whole forward-pass groups
+    per_save = -(-SEGMENTS_PER_SAVE // batch_segments) * batch_segments
+    for save_start in range(0, len(offsets), per_save):
+        save_group = offsets[save_start:save_start + per_save]
+        # A tuned segment length changes the outputs stored per offset
+        key = f"g{save_group[0]}n{len(save_group)}" + ("" if segment is None else f"l{segment_length}")
+        if checkpoint is not None and checkpoint.has(key):
+            # Finished before an interruption: reuse the saved outputs
+            for offset, chunk_out in zip(save_group, checkpoint.load(key)):
+                add(offset, chunk_out.to(mix.device), saved_sources)
+            progress.advance(len(save_group))
+            continue
+
+        finished = []
+        for start in range(0, len(save_group), batch_segments):
+            progress.check_cancel()
+            group = save_group[start:start + batch_segments]
+            chunks = [TensorChunk(mix, offset, segment_length) for offset in group]
+            batch = torch.stack([chunk.padded(valid_length) for chunk in chunks]).to(device)
+            result = infer(model, batch)
+            if list(source_indices) != list(range(result.shape[1])):
+                result = result[:, source_indices]
+            for offset, chunk, chunk_out in zip(group, chunks, result):
+                chunk_out = center_trim(chunk_out, chunk.length).to(mix.device)
+                add(offset, chunk_out)
+                if checkpoint is not None:
+                    finished.append(chunk_out[saved_sources])
+            del batch, result
+            progress.advance(len(group))
+        if checkpoint is not None:
+            checkpoint.save(key, finished)
+        del finished
+
+    out /= sum_weight
+    return out
+
+
+def needed_sub_models(model: torch.nn.Module, source_indices: Sequence[int]):
+    """
+    (sub_model, weights) pairs that contribute to at least one requested source.
+
+    In htdemucs_ft every sub-model has a one-hot weight row (each one specialises in a
+    single source), so asking for drums only needs one of the four sub-models.
+    """
+    return [(sub_model, weights) for sub_model, weights in sub_models(model)
+            if any(weights[k] for k in source_indices)]
+
+
+def residual_plan(model: torch.nn.Module, source_names: Sequence[str],
+                  residual: str = RESIDUAL_SOURCE) -> Optional[List[str]]:
+    """
+    Sources to infer when `residual` is derived as mixture minus the other sources.
+
+    Returns None when that saves no work: `residual` not requested, or no bag member
+    dedicated to it (a single model computes every source in the same pass anyway).
+    """
+    sources = list(model.sources)
+    if residual not in source_names or residual not in sources:
+        return None
+    inferred = [name for name in sources if name != residual]
+    requested = [sources.index(name) for name in source_names]
+    if len(needed_sub_models(model, [sources.index(name) for name in inferred])) >= \
+            len(needed_sub_models(model, requested)):
+        return None
+    return inferred
+
+
+def add_residual(mix: torch.Tensor, inferred: torch.Tensor, inferred_names: Sequence[str],
+                 source_names: Sequence[str], residual: str = RESIDUAL_SOURCE) -> List[torch.Tensor]:
+    """
+    Turns the de-normalized `mix` (Channels, Time) into the residual source, in place:
+    mix minus every inferred source. Returns the sources in `source_names` order.
+    """
+    for source in inferred:
+        mix.sub_(source)
+    by_name = dict(zip(inferred_names, inferred))
+    by_name[residual] = mix
+    return [by_name[name] for name in source_names]
+
+
+def count_segments(model: torch.nn.Module, length: int, shifts: int = 1,
+                   overlap: float = 0.25, segment: Optional[float] = None,
+                   source_indices: Optional[Sequence[int]] = None) -> int:
+    """Total number of forward-pass segments `apply_segmented` will run."""
+    if source_indices is None:
+        source_indices = range(len(model.sources))
+    total = 0
+    max_shift = int(0.5 * model.samplerate) if shifts else 0
+    for sub_model, _ in needed_sub_models(model, source_indices):
+        _, offsets = _segment_geometry(sub_model, length + max_shift, segment, overlap)
+        total += len(offsets) * max(1, shifts)
+    return total
+
+
+def apply_segmented(model: torch.nn.Module, mix: torch.Tensor, shifts: int = 1,
+                    overlap: float = 0.25, segment: Optional[float] = None,
+                    batch_segments: int = 1, infer: Optional[InferFn] = None,
+                    device=None, progress_callback=None, cancel_check=None,
+                    source_indices: Optional[Sequence[int]] = None,
+                    checkpoint=None, seed: Optional[int] = None, silence=None) -> torch.Tensor:
+    """
+    Runs `model` over the whole (normalized) mix.
+
+    Args:
+        model: Demucs model or BagOfModels.
+        mix: (Channels, Time) tensor.
+        shifts: Number of random time shifts to average (0 disables the shift trick).
+        overlap: Overlap between consecutive segments (0-1).
+        segment: Segment length in seconds (defaults to the model's own).
+        batch_segments: Segments handed to `infer` per call.
+        infer: Callable (model, (B, C, L)) -> (B, S, C, L). Defaults to `forward`.
+        device: Device for the forward pass (defaults to `mix.device`).
+        progress_callback: Called with a percentage (0-100) after each group.
+        cancel_check: Returns True to abort with CancellationException.
+        source_indices: Indices into `model.sources` to compute (default: all). Bag
+            members with zero weight for every requested source are skipped.
+        checkpoint: Optional checkpoint.SegmentCheckpoint (or scoped view) to save
+            finished segments to and resume from.
+        seed: Seeds the random shift offsets (default: the global `random` state).
+            Must be fixed for checkpointed jobs so a resumed run uses the same shifts.
+        silence: Optional silence.SilenceDetector built with the statistics `mix` was
+            normalized with. Segments with a silent input are skipped and filled with
+            silence; the detector counts them.
+
+    Returns:
+        torch.Tensor: (len(source_indices), Channels, Time) separated sources.
+    """
+    infer = infer or forward
+    device = device or mix.device
+    length = mix.shape[-1]
+    if source_indices is None:
+        source_indices = list(range(len(model.sources)))
+    progress = _Progress(count_segments(model, length, shifts, overlap, segment, source_indices),
+                         progress_callback, cancel_check)
+
+    rng = random.Random(seed) if seed is not None else random
+    silent_frames = silence.scan(mix) if silence is not None else None
+    estimates = None
+    totals = [0.0] * len(source_indices)
+    for index, (sub_model, weights) in enumerate(needed_sub_models(model, source_indices)):
+        sub_model.eval()
+        sub_checkpoint = checkpoint.scoped(f"m{index}") if checkpoint is not None else None
+        # Only sources this member contributes to are worth saving (one of four in htdemucs_ft)
+        saved_sources = [i for i, k in enumerate(source_indices) if weights[k]]
+        if shifts:
+            # Shift trick: pad by up to 0.5 s, run on a randomly offset view, undo the offset.
+            max_shift = int(0.5 * sub_model.samplerate)
+            padded = TensorChunk(mix).padded(length + 2 * max_shift)
+            out = torch.zeros(len(source_indices), mix.shape[0], length, device=mix.device)
+            for shift in range(shifts):
+                offset = rng.randint(0, max_shift)
+                shifted = TensorChunk(padded, offset, length + max_shift - offset)
+                shifted_out = _run_segments(sub_model, shifted, overlap, segment,
+                                            batch_segments, infer, device, progress, source_indices,
+                                            sub_checkpoint.scoped(f"s{shift}") if sub_checkpoint is not None else None,
+                                            silence, silent_frames, offset - max_shift, saved_sources)
+                out += shifted_out[..., max_shift - offset:]
+                del shifted_out
+            del padded
+            out /= shifts
+        else:
+            out = _run_segments(sub_model, mix, overlap, segment,
+                                batch_segments, infer, device, progress, source_indices, sub_checkpoint,
+                                silence, silent_frames, saved_sources=saved_sources)
+
+        for i, k in enumerate(source_indices):
+            out[i] *= weights[k]
+            totals[i] += weights[k]
+        if estimates is None:
+            estimates = out
+        else:
+            estimates += out
+            del out
+
+    for i in range(estimates.shape[0]):
+        estimates[i] /= totals[i]
+    return estimates
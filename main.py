@@ -1,11 +1,28 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, FileResponse
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.datastructures import Headers
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 import shutil
 import os
 from pathlib import Path
 import audio_processor
+import decoder
+import model_registry
+import scheduler
+import batching
+import result_cache
+import precision
+import cpu_topology
+import backends
+import stem_writer
+import checkpoint
+import silence
+import silent_stems
+import parallel
+import autotune
+import resample
 import analysis # Refactored import
 import urllib.parse
 
@@ -25,6 +42,46 @@ TEMP_INPUT_DIR = Path("temp_inputs")
 # Switching to local directory for easier StaticFiles mounting
 OUTPUT_DIR = Path("processed_tracks")
 MAX_FILE_SIZE = 200 * 1024 * 1024  # 200 MB in bytes
+# Models loaded into the registry at startup (comma separated, empty to disable)
+PREWARM_MODELS = os.environ.get("PREWARM_MODELS", "htdemucs_ft").split(",")
+# Number of separations allowed to run inference at the same time; the rest wait in a FIFO queue
+SEPARATION_SLOTS = int(os.environ.get("SEPARATION_SLOTS", "1"))
+# Cross-request batching: max segments per forward pass (1 disables) and how long to wait for companions
+INFERENCE_BATCH_SIZE = int(os.environ.get("INFERENCE_BATCH_SIZE", "1"))
+INFERENCE_BATCH_WAIT_MS = float(os.environ.get("INFERENCE_BATCH_WAIT_MS", "50"))
+# Size budget for cached separation results in OUTPUT_DIR (least-recently-used folders are deleted beyond it)
+RESULT_CACHE_BUDGET_MB = int(os.environ.get("RESULT_CACHE_BUDGET_MB", "10240"))
+# Preview pass: seconds around the middle of the track separated with the fast preset
+# before the full job, exposed via /progress (0 disables; skipped for tracks shorter than twice this)
+PREVIEW_SECONDS = float(os.environ.get("PREVIEW_SECONDS", str(audio_processor.PREVIEW_SECONDS)))
+# Resumable jobs: finished segments are saved under OUTPUT_DIR/.jobs/ until the job completes.
+# Off by default (scratch writes of about the float32 stems' size per job, see checkpoint.py);
+# progressive upgrades always checkpoint, since they are preempted routinely
+JOB_CHECKPOINTS = os.environ.get("JOB_CHECKPOINTS", "0") == "1"
+# Scratch data of interrupted jobs nobody resumed is deleted after this many hours
+JOB_CHECKPOINT_MAX_AGE_HOURS = float(os.environ.get("JOB_CHECKPOINT_MAX_AGE_HOURS", "48"))
+# CPU inference precision: fp32, int8 (dynamic quantization) or bf16 (autocast), see precision.py
+INFERENCE_PRECISION = precision.resolve(os.environ.get("INFERENCE_PRECISION", "fp32"))
+# Forward-pass backend: eager, torchscript or compile (compiled artifacts cached on disk, see backends.py)
+INFERENCE_BACKEND = backends.get_backend(os.environ.get("INFERENCE_BACKEND", "eager")).name
+# Silence skipping: segments whose input RMS is below SILENCE_THRESHOLD_DB (dBFS) are not run
+# through the model and come out silent (see silence.py)
+SILENCE_THRESHOLD_DB = (float(os.environ.get("SILENCE_THRESHOLD_DB", str(silence.DEFAULT_THRESHOLD_DB)))
+                        if os.environ.get("SILENCE_SKIP", "1") == "1" else None)
+# Intra-track parallelism: worker processes (each holding a model) that split one long track
+# into chunks while no other job is running or queued (0 disables, see parallel.py)
+PARALLEL_WORKERS = int(os.environ.get("PARALLEL_WORKERS", "0"))
+# Segment length / segments per forward pass sized to the free memory per job (see autotune.py)
+AUTOTUNE_SEGMENTS = os.environ.get("AUTOTUNE_SEGMENTS", "1") == "1"
+# Uploads are resampled to the model rate for inference; stems stay at it ("model")
+# or are converted back to the upload's rate ("input"), see resample.py
+STEM_SAMPLERATE = os.environ.get("STEM_SAMPLERATE", "model")
+if STEM_SAMPLERATE not in audio_processor.STEM_SAMPLERATES:
+    raise ValueError(f"STEM_SAMPLERATE must be one of: {', '.join(audio_processor.STEM_SAMPLERATES)}")
+# Silent stems: stems whose RMS stays below SILENT_STEM_THRESHOLD_DB (dBFS) over the whole track
+# are listed in metadata.json instead of written, and synthesized on request (see silent_stems.py)
+SILENT_STEM_THRESHOLD_DB = (float(os.environ.get("SILENT_STEM_THRESHOLD_DB", str(silent_stems.DEFAULT_THRESHOLD_DB)))
+                            if os.environ.get("SILENT_STEMS", "1") == "1" else None)
 
 # Ensure directories exist
 TEMP_INPUT_DIR.mkdir(exist_ok=True)
@@ -34,22 +91,260 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 # Format: { task_id: { "progress": int(0-100), "status": str } }
 PROGRESS_STORE = {}
 
+# --- Separation Scheduler ---
+# Dedicated inference slots instead of the default executor, so concurrent uploads
+# queue up rather than oversubscribing the CPU.
+# Each slot gets its share of the cores (see cpu_topology.py) instead of all of them.
+CPU_LAYOUT = cpu_topology.ThreadLayout(
+    workers=SEPARATION_SLOTS,
+    threads_per_worker=cpu_topology.INFERENCE_THREADS,
+    interop_threads=cpu_topology.INTEROP_THREADS,
+    pin=cpu_topology.PIN_WORKERS
+)
+CPU_LAYOUT.apply_process()
+SEPARATION_SCHEDULER = scheduler.SeparationScheduler(slots=SEPARATION_SLOTS, on_worker_start=CPU_LAYOUT.apply_worker)
+# Shared by all slots so segments of concurrent jobs can share a forward pass.
+# Its dispatcher thread runs every forward pass, so it gets all the workers' cores.
+SEGMENT_BATCHER = (
+    batching.SegmentBatcher(max_batch=INFERENCE_BATCH_SIZE, max_wait_ms=INFERENCE_BATCH_WAIT_MS,
+                            on_thread_start=CPU_LAYOUT.apply_shared)
+    if INFERENCE_BATCH_SIZE > 1 else None
+)
+# Idle cores go to a single job: its chunks are separated by PARALLEL_WORKERS processes
+PARALLEL_POOL = parallel.ChunkPool(PARALLEL_WORKERS) if PARALLEL_WORKERS > 1 else None
+
+# --- Result Cache ---
+# Re-uploads of identical audio reuse the stems already in OUTPUT_DIR
+RESULT_CACHE = result_cache.ResultCache(OUTPUT_DIR, RESULT_CACHE_BUDGET_MB * 1024 * 1024)
+
 # --- Mount Static Files ---
+def byte_range(header, size):
+    """
+    (start, end) of a single-range `Range: bytes=...` header for a body of `size` bytes.
+
+    None for a missing, malformed or multi-range header (the whole body is sent);
+    raises HTTPException 416 when the range lies beyond the body.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, sep, last = header[len("bytes="):].strip().partition("-")
+    if not sep or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if first:
+        start, end = int(first), min(size, int(last) + 1) if last else size
+    else:
+        # Suffix range: the last N bytes
+        start, end = max(0, size - int(last)), size
+    if start >= size or start >= end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def silent_stem_response(track, filename, download=False, range_header=None):
+    """Synthesized response for a stem listed as silent in the track's metadata, or None."""
+    try:
+        metadata = audio_processor.read_metadata(OUTPUT_DIR / track)
+    except (OSError, ValueError):
+        return None
+    entry = silent_stems.find(metadata, filename)
+    if entry is None:
+        return None
+    output_format = metadata.get("format", stem_writer.DEFAULT_FORMAT)
+    size = silent_stems.content_length(entry, output_format)
+    headers = {"Accept-Ranges": "bytes"}
+    if download:
+        headers["Content-Disposition"] = f"attachment; filename={filename}"
+    requested = byte_range(range_header, size)
+    start, end = requested or (0, size)
+    headers["Content-Length"] = str(end - start)
+    if requested:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return StreamingResponse(silent_stems.render(entry, output_format, start, end),
+                             status_code=206 if requested else 200,
+                             media_type=stem_writer.media_type(filename), headers=headers)
+
+class StemFiles(StaticFiles):
+    """Static output files, plus the silent stems that were not written (see silent_stems.py)."""
+
+    async def get_response(self, path, scope):
+        try:
+            return await super().get_response(path, scope)
+        except StarletteHTTPException as e:
+            track, _, filename = path.replace("\\", "/").partition("/")
+            if e.status_code != 404 or ".." in path or not filename or "/" in filename:
+                raise
+            response = silent_stem_response(track, filename, range_header=Headers(scope=scope).get("range"))
+            if response is None:
+                raise
+            return response
+
 # Serve the output directory at /files results in:
 # http://host:port/files/track_name/stem.wav
-app.mount("/files", StaticFiles(directory=OUTPUT_DIR), name="files")
+app.mount("/files", StemFiles(directory=OUTPUT_DIR), name="files")
 app.mount("/frontend", StaticFiles(directory="frontend", html=True), name="frontend")
 
+@app.on_event("startup")
+async def prewarm_models():
+    """Loads the default models in the background so the first upload skips the load."""
+    print(CPU_LAYOUT.report())
+    removed = checkpoint.prune_jobs(OUTPUT_DIR, JOB_CHECKPOINT_MAX_AGE_HOURS)
+    if removed:
+        print(f"Removed {removed} stale job checkpoint(s)")
+    import asyncio
+    loop = asyncio.get_event_loop()
+    # Not awaited: the server accepts requests while weights load, and a request
+    # for the same model simply waits on the registry's load lock.
+    loop.run_in_executor(None, prewarm_and_profile)
+
+def prewarm_and_profile():
+    variant = precision.weights_variant(INFERENCE_PRECISION)
+    registry = model_registry.get_registry()
+    registry.prewarm(PREWARM_MODELS, "cpu", variant)
+    if not AUTOTUNE_SEGMENTS:
+        return
+    # Measure the memory profiles now rather than during the first upload
+    for name in PREWARM_MODELS:
+        name = name.strip()
+        if name:
+            try:
+                autotune.bytes_per_second(name, variant)
+            except Exception as e:
+                print(f"Warning: Failed to profile model {name}: {e}")
+
+@app.on_event("shutdown")
+def stop_parallel_pool():
+    if PARALLEL_POOL is not None:
+        PARALLEL_POOL.shutdown()
+
+@app.get("/models")
+async def get_model_stats():
+    """Returns which models are resident and the registry hit/miss counters."""
+    return model_registry.get_registry().stats()
+
+@app.get("/presets")
+async def get_presets():
+    """Lists the separation presets accepted by /separate?preset=..."""
+    return {"default": audio_processor.DEFAULT_PRESET, "presets": audio_processor.PRESETS}
+
+@app.get("/cache")
+async def get_cache_stats():
+    """Returns result-cache hit/miss counters and size."""
+    return RESULT_CACHE.stats()
+
+def build_stem_urls(base_url, stems_dict, metadata=None):
+    """
+    Builds playback/download URLs for each stem. The track folder is taken from the stem path.
+    Stems listed as silent in the track's `metadata` are marked `silent` with their duration,
+    so clients can skip fetching them.
+    """
+    silent = (metadata or {}).get("silent_stems") or {}
+    response_stems = {}
+    for stem_name, abs_path in stems_dict.items():
+        filename = os.path.basename(abs_path)
+        track_name = os.path.basename(os.path.dirname(abs_path))
+
+        # Playback URL (Static Files - for Wavesurfer)
+        playback_url = f"{base_url}/files/{track_name}/{filename}"
+
+        # Download URL (Force Download - for Buttons)
+        download_url = f"{base_url}/download?track={track_name}&file={filename}"
+
+        response_stems[stem_name] = {
+            "playback": playback_url,
+            "download": download_url
+        }
+        if stem_name in silent:
+            response_stems[stem_name].update(silent=True, duration=round(silent_stems.duration(silent[stem_name]), 3))
+    return response_stems
+
+def cleanup_finished_task(task_id, input_path):
+    """Drops the progress entry and the uploaded input file after a successful job."""
+    if task_id in PROGRESS_STORE:
+        del PROGRESS_STORE[task_id]
+
+    if input_path and input_path.exists():
+        try:
+            input_path.unlink()
+        except Exception as e:
+            print(f"Warning: Failed to delete input file {input_path}: {e}")
+        resample.discard_cached(input_path)
+
+def schedule_upgrade(task_id, input_path, track_dir, stems, output_format, residual_other):
+    """
+    Queues the background upgrade of a progressive job's stems to UPGRADE_PRESET.
+
+    It runs on the separation scheduler as a background job: only on idle capacity,
+    and preempted (resuming from its checkpoint later) as soon as a regular upload
+    waits. Deletes the input file when done. Returns the updated track metadata.
+    """
+    metadata = audio_processor.update_metadata(track_dir, upgrade="pending")
+
+    def run_upgrade():
+        return audio_processor.upgrade_track(
+            str(input_path), str(OUTPUT_DIR), track_dir, stems=stems,
+            precision=INFERENCE_PRECISION, backend=INFERENCE_BACKEND, output_format=output_format,
+            silence_threshold_db=SILENCE_THRESHOLD_DB, residual_other=residual_other, stem_samplerate=STEM_SAMPLERATE,
+            input_samplerate=metadata.get("input_samplerate"),
+            silent_stem_threshold_db=SILENT_STEM_THRESHOLD_DB, detected_key=metadata.get("key", "Unknown"), timestamp=metadata.get("timestamp", 0),
+            batcher=SEGMENT_BATCHER, cancel_check=SEPARATION_SCHEDULER.check_preempt,
+            checkpoint_root=str(OUTPUT_DIR),
+            autotune_segments=AUTOTUNE_SEGMENTS, concurrent_jobs=SEPARATION_SLOTS,
+            cache=RESULT_CACHE
+        )
+
+    def upgrade_finished(future):
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Upgrade of {track_dir} failed: {e}")
+            try:
+                audio_processor.update_metadata(track_dir, upgrade="failed")
+            except OSError:
+                pass  # Track folder deleted meanwhile
+        try:
+            input_path.unlink(missing_ok=True)
+        except Exception as e:
+            print(f"Warning: Failed to delete input file {input_path}: {e}")
+        resample.discard_cached(input_path)
+
+    SEPARATION_SCHEDULER.submit(f"{task_id}:upgrade", run_upgrade, background=True).add_done_callback(upgrade_finished)
+    return metadata
+
+def progressive_fields(base_url, stems_dict, metadata):
+    """Response fields of a progressive job: where to poll for the upgraded version."""
+    track_name = os.path.basename(os.path.dirname(next(iter(stems_dict.values()))))
+    return {
+        "version": metadata.get("version", 1),
+        "upgrade": metadata.get("upgrade"),
+        "metadata": f"{base_url}/files/{track_name}/metadata.json"
+    }
+
 @app.get("/progress/{task_id}")
 async def get_progress(task_id: str):
-    """Returns the progress of a specific task."""
-    return PROGRESS_STORE.get(task_id, {"progress": 0, "status": "pending"})
+    """
+    Returns the progress of a specific task, including its queue position while queued
+    and `preview` stem URLs as soon as the preview pass has finished.
+    """
+    info = dict(PROGRESS_STORE.get(task_id, {"progress": 0, "status": "pending"}))
+    position = SEPARATION_SCHEDULER.position(task_id)
+    if position is not None:
+        info["queue_position"] = position
+    return info
+
+@app.get("/queue")
+async def get_queue_stats():
+    """Returns the separation scheduler's slot and queue counters."""
+    stats = SEPARATION_SCHEDULER.stats()
+    if SEGMENT_BATCHER is not None:
+        stats["batching"] = SEGMENT_BATCHER.stats()
+    return stats
 
 @app.post("/cancel/{task_id}")
 async def cancel_task(task_id: str):
     """Cancels a running task."""
     if task_id in PROGRESS_STORE:
         PROGRESS_STORE[task_id]["status"] = "cancelled"
+        # Drop the job if it is still waiting for an inference slot
+        SEPARATION_SCHEDULER.cancel(task_id)
         return {"message": "Cancellation requested"}
     return JSONResponse(status_code=404, content={"message": "Task not found"})
 
@@ -57,12 +352,23 @@ async def cancel_task(task_id: str):
 async def separate_audio_endpoint(
     request: Request, 
     file: UploadFile = File(...), 
-    task_id: str = None
+    task_id: str = None,
+    preset: str = None,
+    stems: str = None,
+    output_format: str = None,
+    residual_other: bool = False,
+    progressive: bool = False
 ):
     """
     Accepts an audio file, separates it, and returns download URLs.
     Now includes Key Analysis and Progress Tracking.
     Running in thread pool to prevent blocking.
+    `preset` (fast / balanced / best) trades separation quality for speed.
+    `stems` (comma separated, e.g. "drums") limits the output to those stems.
+    `output_format` (PCM_16 / PCM_24 / FLOAT / FLAC) selects the stem encoding.
+    `residual_other` derives "other" as mixture minus the other stems (faster, lower quality).
+    `progressive` returns stems of the fast preset right away and upgrades them in place
+    in the background (see schedule_upgrade); `version` in metadata.json tells when.
     """
     import asyncio
     loop = asyncio.get_event_loop()
@@ -76,6 +382,13 @@ async def separate_audio_endpoint(
     if content_length and int(content_length) > MAX_FILE_SIZE:
          raise HTTPException(status_code=413, detail="File too large. Max size is 200MB.")
 
+    try:
+        preset, _ = audio_processor.resolve_preset(audio_processor.PROGRESSIVE_PRESET if progressive else preset)
+        stems = audio_processor.normalize_stems(stems)
+        output_format = stem_writer.resolve_format(output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     input_path = None # Scope for cleanup
 
     try:
@@ -95,34 +408,103 @@ async def separate_audio_endpoint(
         
         input_path = TEMP_INPUT_DIR / safe_filename
         
+        # Compressed uploads are decoded by ffmpeg while they are copied, into a
+        # float32 WAV at the model rate that every later step reads (see decoder.py)
+        decoded_path = input_path.with_suffix(".wav")
+        transcoder = (decoder.UploadTranscoder(decoded_path, audio_processor.MODEL_SAMPLERATE)
+                      if decoder.UploadTranscoder.wanted(original_name) else None)
+        # Rate of the upload itself, when the file separated is a transcoded copy
+        input_samplerate = None
+
         # Check actual read size just in case
         file_size = 0
-        with open(input_path, "wb") as buffer:
-            while True:
-                # Check for cancellation during upload
-                if PROGRESS_STORE.get(task_id, {}).get("status") == "cancelled":
-                     raise audio_processor.CancellationException("Cancelled during upload")
-
-                chunk = await file.read(1024 * 1024) # Read 1MB chunks
-                if not chunk:
-                    break
-                file_size += len(chunk)
-                if file_size > MAX_FILE_SIZE:
-                    input_path.unlink(missing_ok=True) # Delete partial file
-                    raise HTTPException(status_code=413, detail="File too large. Max size is 200MB.")
-                buffer.write(chunk)
+        try:
+            with open(input_path, "wb") as buffer:
+                while True:
+                    # Check for cancellation during upload
+                    if PROGRESS_STORE.get(task_id, {}).get("status") == "cancelled":
+                         raise audio_processor.CancellationException("Cancelled during upload")
+
+                    chunk = await file.read(1024 * 1024) # Read 1MB chunks
+                    if not chunk:
+                        break
+                    file_size += len(chunk)
+                    if file_size > MAX_FILE_SIZE:
+                        input_path.unlink(missing_ok=True) # Delete partial file
+                        raise HTTPException(status_code=413, detail="File too large. Max size is 200MB.")
+                    buffer.write(chunk)
+                    if transcoder is not None:
+                        await loop.run_in_executor(None, transcoder.feed, chunk)
+        except BaseException:
+            if transcoder is not None:
+                transcoder.abort()
+            raise
+        if transcoder is not None:
+            if await loop.run_in_executor(None, transcoder.finish, str(input_path)):
+                try:
+                    input_samplerate = (await loop.run_in_executor(None, decoder.probe, str(input_path))).samplerate
+                except Exception as e:
+                    print(f"Could not probe {original_name}: {e}")
+                input_path.unlink(missing_ok=True)
+                input_path = decoded_path
+            else:
+                print(f"Could not decode {original_name} with ffmpeg; keeping the original upload")
         
         # Check cancellation before switching to analyzing
         if PROGRESS_STORE.get(task_id, {}).get("status") == "cancelled":
              raise audio_processor.CancellationException("Cancelled after upload")
 
         PROGRESS_STORE[task_id]["status"] = "analyzing"
+        base_url = str(request.base_url).rstrip("/")
 
-        # 2. Analyze Audio (Key) - Run in Thread
+        # 2. Result Cache - identical audio already separated with the same settings
+        try:
+            cache_key = await loop.run_in_executor(
+                None, audio_processor.compute_cache_key, str(input_path), audio_processor.SeparationSettings(
+                    preset=preset, stems=stems, precision=INFERENCE_PRECISION, output_format=output_format,
+                    silence_threshold_db=SILENCE_THRESHOLD_DB, residual_other=residual_other,
+                    stem_samplerate=STEM_SAMPLERATE, silent_stem_threshold_db=SILENT_STEM_THRESHOLD_DB
+                )
+            )
+        except Exception as e:
+            print(f"Cache key computation failed: {e}")
+            cache_key = None
+
+        cached = RESULT_CACHE.lookup(cache_key) if cache_key else None
+        if cached is not None:
+            stems_dict, metadata = cached
+            print(f"Task {task_id}: cache hit, returning existing stems.")
+            upgrading = (progressive and metadata.get("preset") == audio_processor.PROGRESSIVE_PRESET
+                         and metadata.get("upgrade") != "pending")
+            if upgrading:
+                track_dir = os.path.dirname(next(iter(stems_dict.values())))
+                metadata = schedule_upgrade(task_id, input_path, track_dir, stems, output_format, residual_other)
+            cleanup_finished_task(task_id, None if upgrading else input_path)
+            content = {
+                "status": "success",
+                "key": metadata.get("key", "Unknown"),
+                "stems": build_stem_urls(base_url, stems_dict, metadata),
+                "preset": metadata.get("preset", preset),
+                "cached": True
+            }
+            if progressive:
+                content.update(progressive_fields(base_url, stems_dict, metadata))
+            return JSONResponse(content=content)
+
+        # 3. Analyze Audio (Key) - Run in Thread
+        # The input is resampled to the model rate once here; analysis and every
+        # separation pass read that copy (see resample.py)
+        try:
+            analysis_path = await loop.run_in_executor(
+                None, resample.cached_input, str(input_path), audio_processor.MODEL_SAMPLERATE
+            )
+        except Exception as e:
+            print(f"Resampling failed: {e}")
+            analysis_path = str(input_path)
         # analysis.analyze_track returns (bpm, key)
         try:
              # run_in_executor(None, ...) uses the default thread pool
-             _, detected_key = await loop.run_in_executor(None, analysis.analyze_track, str(input_path))
+             _, detected_key = await loop.run_in_executor(None, analysis.analyze_track, analysis_path)
         except Exception as e:
              print(f"Analysis failed: {e}")
              detected_key = "Unknown"
@@ -131,8 +513,8 @@ async def separate_audio_endpoint(
         if PROGRESS_STORE.get(task_id, {}).get("status") == "cancelled":
              raise audio_processor.CancellationException("Cancelled after analysis")
 
-        # 3. Process Audio (Separation) - Run in Thread
-        PROGRESS_STORE[task_id]["status"] = "separating"
+        # 4. Process Audio (Separation) - Queued on the separation scheduler
+        PROGRESS_STORE[task_id]["status"] = "queued"
         
         def update_progress(p):
             # Callback to update progress store
@@ -145,58 +527,85 @@ async def separate_audio_endpoint(
             status = PROGRESS_STORE.get(task_id, {}).get("status")
             return status == "cancelled"
 
-        stems_dict = await loop.run_in_executor(
-            None, 
-            lambda: audio_processor.separate_audio(
+        def run_preview():
+            # Phase 1: a short centre window with the fast model, so playback can start early
+            if PROGRESS_STORE.get(task_id, {}).get("status") != "cancelled":
+                PROGRESS_STORE[task_id]["status"] = "previewing"
+            try:
+                preview_files = audio_processor.separate_preview(
+                    str(input_path), str(OUTPUT_DIR), seconds=PREVIEW_SECONDS, stems=stems,
+                    cancel_check=check_cancelled, silence_threshold_db=SILENCE_THRESHOLD_DB
+                )
+            except audio_processor.CancellationException:
+                raise
+            except Exception as e:
+                # The full separation still runs; the preview is a nice-to-have
+                print(f"Preview failed: {e}")
+                return
+            if task_id in PROGRESS_STORE:
+                PROGRESS_STORE[task_id]["preview"] = build_stem_urls(base_url, preview_files)
+
+        def run_separation():
+            # Runs on a scheduler slot once the job reaches the head of the queue
+            if check_cancelled():
+                raise audio_processor.CancellationException("Cancelled while queued")
+            # (Progressive jobs run the fast preset anyway)
+            if not progressive and PREVIEW_SECONDS > 0 and decoder.probe(str(input_path)).duration >= 2 * PREVIEW_SECONDS:
+                run_preview()
+            # Phase 2: the full track with the requested preset
+            if task_id in PROGRESS_STORE and not check_cancelled():
+                PROGRESS_STORE[task_id]["status"] = "separating"
+            # Only this job on the box: let it use the worker processes as well
+            load = SEPARATION_SCHEDULER.stats()
+            pool = PARALLEL_POOL if PARALLEL_POOL and load["running"] + load["queued"] <= 1 else None
+            return audio_processor.separate_audio(
                 str(input_path), 
                 str(OUTPUT_DIR),
                 progress_callback=update_progress,
                 cancel_check=check_cancelled,
                 detected_key=detected_key,
-                timestamp=timestamp
+                timestamp=timestamp,
+                batcher=SEGMENT_BATCHER,
+                preset=preset,
+                stems=stems,
+                precision=INFERENCE_PRECISION,
+                backend=INFERENCE_BACKEND,
+                output_format=output_format,
+                checkpoint_root=str(OUTPUT_DIR) if JOB_CHECKPOINTS and cache_key else None,
+                silence_threshold_db=SILENCE_THRESHOLD_DB,
+                residual_other=residual_other,
+                parallel=pool,
+                autotune_segments=AUTOTUNE_SEGMENTS,
+                concurrent_jobs=SEPARATION_SLOTS,
+                stem_samplerate=STEM_SAMPLERATE,
+                input_samplerate=input_samplerate,
+                silent_stem_threshold_db=SILENT_STEM_THRESHOLD_DB,
+                cache=RESULT_CACHE if cache_key else None,
+                cache_key=cache_key
             )
-        )
-        
-        # 4. Construct Response
-        track_name = os.path.splitext(safe_filename)[0]
-        base_url = str(request.base_url).rstrip("/")
-        
-        response_stems = {}
-        for stem_name, abs_path in stems_dict.items():
-            filename = os.path.basename(abs_path)
-            
-            # Playback URL (Static Files - for Wavesurfer)
-            playback_url = f"{base_url}/files/{track_name}/{filename}"
-            
-            # Download URL (Force Download - for Buttons)
-            download_url = f"{base_url}/download?track={track_name}&file={filename}"
-            
-            # Check for file existence before returning (sanity check)
-            # if not os.path.exists(abs_path): ...
-
-            response_stems[stem_name] = {
-                "playback": playback_url,
-                "download": download_url
-            }
 
-        # Cleanup progress
-        if task_id in PROGRESS_STORE:
-            del PROGRESS_STORE[task_id]
-
-        # Cleanup input file (Success case)
-        if input_path and input_path.exists():
-            try:
-                input_path.unlink()
-            except Exception as e:
-                print(f"Warning: Failed to delete input file {input_path}: {e}")
+        stems_dict = await asyncio.wrap_future(SEPARATION_SCHEDULER.submit(task_id, run_separation))
+        
+        # 5. Construct Response
+        track_dir = os.path.dirname(next(iter(stems_dict.values())))
+        response_stems = build_stem_urls(base_url, stems_dict, audio_processor.read_metadata(track_dir))
 
-        return JSONResponse(content={
+        audio_processor.discard_preview(str(OUTPUT_DIR), str(input_path))
+        content = {
             "status": "success", 
             "key": detected_key,
-            "stems": response_stems
-        })
+            "stems": response_stems,
+            "preset": preset
+        }
+        if progressive:
+            # The upgrade job re-reads the input and deletes it when done
+            metadata = schedule_upgrade(task_id, input_path, track_dir, stems, output_format, residual_other)
+            content.update(progressive_fields(base_url, stems_dict, metadata))
+        cleanup_finished_task(task_id, None if progressive else input_path)
+
+        return JSONResponse(content=content)
     
-    except audio_processor.CancellationException:
+    except (audio_processor.CancellationException, scheduler.CancelledBeforeStart):
         print(f"Task {task_id} cancelled. Cleaning up...")
         if task_id in PROGRESS_STORE:
             del PROGRESS_STORE[task_id]
@@ -208,6 +617,7 @@ async def separate_audio_endpoint(
                 print(f"Deleted input file: {input_path}")
             except Exception as e:
                 print(f"Error deleting input file: {e}")
+            resample.discard_cached(input_path)
 
         # Delete output directory (if created)
         # Convert input filename to output folder name logic
@@ -220,6 +630,7 @@ async def separate_audio_endpoint(
                      print(f"Deleted output dir: {output_subdir}")
                  except Exception as e:
                      print(f"Error deleting output dir: {e}")
+             audio_processor.discard_preview(str(OUTPUT_DIR), str(input_path))
         
         return JSONResponse(status_code=499, content={"message": "Task cancelled"})
 
@@ -230,15 +641,17 @@ async def separate_audio_endpoint(
     except Exception as e:
         if task_id in PROGRESS_STORE:
             del PROGRESS_STORE[task_id]
+        if input_path:
+            audio_processor.discard_preview(str(OUTPUT_DIR), str(input_path))
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/download")
-async def download_file(track: str, file: str):
+async def download_file(track: str, file: str, request: Request):
     """
     Force download of a file.
-    Usage: /download?track=song_name&file=drums.wav
+    Usage: /download?track=song_name&file=drums.wav (or drums.flac)
     """
     # Security: basic traversal prevention
     if ".." in track or ".." in file:
@@ -247,12 +660,16 @@ async def download_file(track: str, file: str):
     file_path = OUTPUT_DIR / track / file
     
     if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
+        # Silent stems are not stored; their silence is synthesized
+        response = silent_stem_response(track, file, download=True, range_header=request.headers.get("range"))
+        if response is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        return response
         
     return FileResponse(
         path=file_path, 
         filename=file,
-        media_type="audio/wav",
+        media_type=stem_writer.media_type(file),
         headers={"Content-Disposition": f"attachment; filename={file}"}
     )
 
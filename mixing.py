@@ -22,6 +22,22 @@ import librosa
 import soundfile as sf
 import numpy as np
 
+import decoder
+
+# Bytes per sample of the pydub segment for a soundfile subtype: 8-bit sources are
+# widened to 16 bits; 24-bit, float and lossy decodes (no subtype) are held in 32-bit
+# integers (pydub stores 3-byte samples as 4 bytes anyway)
+_SAMPLE_WIDTHS = {"PCM_S8": 2, "PCM_U8": 2, "PCM_16": 2}
+
+def load_segment(file_path: str) -> AudioSegment:
+    """Decodes `file_path` through decoder.py into a pydub AudioSegment at the source's sample width."""
+    width = _SAMPLE_WIDTHS.get(decoder.probe(file_path).subtype, 4)
+    data, sr = decoder.read(file_path)
+    full_scale = 2 ** (8 * width - 1) - 1
+    pcm = np.round(np.clip(data, -1.0, 1.0).astype(np.float64) * full_scale).astype(np.int32)
+    raw = pcm.astype("<i2" if width == 2 else "<i4").tobytes()
+    return AudioSegment(raw, frame_rate=sr, sample_width=width, channels=pcm.shape[1])
+
 def optimize_bpm_target(source_bpm: float, target_bpm: float) -> float:
     """
     Finds the optimal 'effective' target BPM by checking octave (x2, x0.5) relationships.
@@ -72,8 +88,9 @@ def time_stretch_audio(file_path: str, target_bpm: float, source_bpm: float) ->
     if abs(rate - 1.0) < 0.01:
         return file_path
         
-    # Load with Librosa
-    y, sr = librosa.load(file_path, sr=None)
+    # Decode to mono (see decoder.py)
+    data, sr = decoder.read(file_path, channels=1)
+    y = data[:, 0]
     
     # Time Stretch
     # rate > 1.0 means faster (shorter duration)
@@ -158,9 +175,9 @@ def create_mix(drums_path: str, backing_path: str) -> str:
     """
     
     # Load separate segments
-    # Pydub automatically handles format detection
-    drums = AudioSegment.from_file(drums_path)
-    backing = AudioSegment.from_file(backing_path)
+    # decoder.py handles format detection (soundfile, or ffmpeg for compressed files)
+    drums = load_segment(drums_path)
+    backing = load_segment(backing_path)
 
     # Logic: Drums are the "Subject". usage scenario: Replacing drums on a song.
     # We will trim mixing to the length of the drums.
@@ -216,7 +233,7 @@ def create_multitrack_mix(stems_paths: Dict[str, str], current_playing_stems: Li
     for name in current_playing_stems:
         path = stems_paths.get(name)
         if path and os.path.exists(path):
-            seg = AudioSegment.from_file(path)
+            seg = load_segment(path)
             files_loaded.append(seg)
             if mixed is None:
                 mixed = seg
@@ -235,7 +252,7 @@ def create_multitrack_mix(stems_paths: Dict[str, str], current_playing_stems: Li
         
     # 2. Layer Sample (Drum Kit)
     if sample_path and os.path.exists(sample_path):
-        sample = AudioSegment.from_file(sample_path)
+        sample = load_segment(sample_path)
         
         if mixed is None:
              # Only sample selected. Return it directly (or loop it?)
@@ -0,0 +1,167 @@
+"""
+Drum Extractor Pro - Model Registry Module
+==========================================
+
+Keeps loaded Demucs models resident between separation jobs.
+
+Why:
+    `get_model("htdemucs_ft")` deserializes a bag of four fine-tuned sub-models.
+    Doing that on every `/separate` call adds several seconds of pure loading time
+    before inference even starts.
+
+How:
+    Models are cached per (model_name, device, weights variant) in an OrderedDict
+    that doubles as an LRU list. The variant is "fp32" or "int8" (see precision.py).
+    The footprint of each entry is estimated from its parameter and buffer sizes;
+    when the total exceeds the memory budget, the least-recently-used entries are
+    dropped. The most recently requested model is always kept, even if it alone
+    exceeds the budget.
+
+    Weights come from the local model store when it has them (see model_store.py),
+    otherwise from demucs' download cache.
+
+Configuration:
+    MODEL_CACHE_BUDGET_MB: Memory budget for resident models (default 2048).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import torch
+import model_store
+import precision
+
+DEFAULT_BUDGET_MB = int(os.environ.get("MODEL_CACHE_BUDGET_MB", "2048"))
+
+RegistryKey = Tuple[str, str, str]
+
+
+def estimate_model_bytes(model: torch.nn.Module) -> int:
+    """Approximate resident size of a model (parameters + buffers) in bytes."""
+    total = 0
+    # state_dict rather than parameters(): quantized layers keep their packed
+    # int8 weights outside the parameter list
+    for value in model.state_dict().values():
+        for tensor in (value if isinstance(value, (tuple, list)) else (value,)):
+            if isinstance(tensor, torch.Tensor):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelRegistry:
+    """
+    Process-wide LRU cache of loaded models keyed by (model_name, device, variant).
+
+    Thread-safe: concurrent requests for the same key share a single load,
+    requests for different keys load in parallel.
+    """
+
+    def __init__(self, budget_bytes: int, loader=None):
+        self.budget_bytes = budget_bytes
+        self._loader = loader or model_store.load_model
+        self._models: "OrderedDict[RegistryKey, torch.nn.Module]" = OrderedDict()
+        self._sizes: Dict[RegistryKey, int] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[RegistryKey, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_name: str, device: str = "cpu", variant: str = "fp32") -> torch.nn.Module:
+        """Returns the resident model for (model_name, device, variant), loading it if needed."""
+        key = (model_name, str(device), variant)
+
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given key; the others wait and then hit the cache.
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    self.hits += 1
+                    return self._models[key]
+
+            start = time.perf_counter()
+            model = self._loader(model_name)
+            model.to(device)
+            model.eval()
+            model = precision.convert_model(model, variant)
+            size = estimate_model_bytes(model)
+            print(f"Loaded model {model_name} ({variant}) on {device} in {time.perf_counter() - start:.2f}s "
+                  f"({size / 1024 / 1024:.0f} MB)")
+
+            with self._lock:
+                self.misses += 1
+                self._models[key] = model
+                self._sizes[key] = size
+                self._evict_locked(keep=key)
+            return model
+
+    def prewarm(self, model_names: Iterable[str], device: str = "cpu", variant: str = "fp32") -> None:
+        """Loads the given models ahead of the first request. Failures are logged, not raised."""
+        for name in model_names:
+            name = name.strip()
+            if not name:
+                continue
+            try:
+                self.get(name, device, variant)
+            except Exception as e:
+                print(f"Warning: Failed to prewarm model {name}: {e}")
+
+    def evict(self, model_name: str, device: Optional[str] = None) -> None:
+        """Drops a model from the registry (all devices if device is None, all variants)."""
+        with self._lock:
+            for key in list(self._models):
+                if key[0] == model_name and (device is None or key[1] == str(device)):
+                    self._drop_locked(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._models):
+                self._drop_locked(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "models": [f"{name}@{device}" + ("" if variant == "fp32" else f"/{variant}")
+                           for name, device, variant in self._models],
+                "resident_mb": round(sum(self._sizes.values()) / 1024 / 1024, 1),
+                "budget_mb": round(self.budget_bytes / 1024 / 1024, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _evict_locked(self, keep: RegistryKey) -> None:
+        # Oldest entries sit at the front of the OrderedDict.
+        while sum(self._sizes.values()) > self.budget_bytes and len(self._models) > 1:
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            print(f"Evicting model {oldest[0]} ({oldest[2]}) from {oldest[1]} (memory budget exceeded)")
+            self._drop_locked(oldest)
+
+    def _drop_locked(self, key: RegistryKey) -> None:
+        self._models.pop(key, None)
+        self._sizes.pop(key, None)
+        if key[1].startswith("cuda") and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+# Shared instance used by audio_processor and main
+_registry = ModelRegistry(DEFAULT_BUDGET_MB * 1024 * 1024)
+
+
+def get_registry() -> ModelRegistry:
+    return _registry
+
+
+def get_model(model_name: str, device: str = "cpu", variant: str = "fp32") -> torch.nn.Module:
+    """Convenience wrapper around the shared registry."""
+    return _registry.get(model_name, device, variant)
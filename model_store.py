@@ -0,0 +1,308 @@
+"""
+Drum Extractor Pro - Local Model Store Module
+=============================================
+
+Pre-fetched, checksummed model weights that load without network access.
+
+Why:
+    `demucs.pretrained.get_model` resolves weights through the HuggingFace hub or
+    the demucs download cache. Air-gapped deployments and the PyInstaller build
+    (build_app.spec) have no network, so the first load failed there. Where it
+    works it is slow: each sub-model is unpickled from a package that is read
+    into memory in full and copied into a freshly initialised network.
+
+How:
+    `python model_store.py fetch htdemucs htdemucs_ft` loads each model once
+    through demucs (online, or from a local repo with --repo) and converts it into
+    `<store>/<name>/`:
+        manifest.json  - model class, constructor arguments, bag weights, segment
+                         length and the SHA-256 of every weight file
+        <i>.pt         - plain state_dict of bag member i (torch.save)
+    `load_model` rebuilds the network from the manifest without the random weight
+    initialisation: a torch function mode (`_SkipInit`), active only on the loading
+    thread, turns the init calls into no-ops, so modules other threads build
+    meanwhile are initialised as usual. (Building on the meta device instead costs
+    about 2 s per process: the meta kernels of normal_ and cumsum import
+    torch._dynamo.) It maps the weight files with `torch.load(mmap=True)` and
+    assigns the mapped tensors to the model (`load_state_dict(assign=True)`), so
+    weights are paged in on first use instead of being read and copied up front.
+
+    Checksums are computed when a model is fetched. A load only checks that every
+    weight file has its stored size: hashing (MODEL_STORE_VERIFY=1, or
+    `python model_store.py verify` after copying a store) reads every checkpoint
+    in full. Models that are not in the store fall back to demucs unless the store
+    is offline-only.
+
+    `python model_store.py bench htdemucs_ft` measures the cold start (fresh process,
+    import and load) through demucs and through the store.
+
+Configuration:
+    MODEL_STORE_DIR: Store location (default `model_store/` next to the code, or
+        inside the PyInstaller bundle).
+    MODEL_STORE_OFFLINE: 1 never falls back to demucs' download path (default 0).
+    MODEL_STORE_VERIFY: 1 also checks the weight checksums on every load (default 0).
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from fractions import Fraction
+from typing import List, Optional, Tuple
+
+import torch
+from demucs.apply import BagOfModels
+from torch.overrides import TorchFunctionMode
+
+_BASE_DIR = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+STORE_DIR = os.environ.get("MODEL_STORE_DIR", os.path.join(_BASE_DIR, "model_store"))
+OFFLINE = os.environ.get("MODEL_STORE_OFFLINE", "0") == "1"
+VERIFY = os.environ.get("MODEL_STORE_VERIFY", "0") == "1"
+MANIFEST_FILENAME = "manifest.json"
+FORMAT_VERSION = 1
+HASH_BLOCK_BYTES = 1 << 22
+
+# Random initialisers skipped while a stored model is built (its weights are assigned next)
+_INIT_FUNCTIONS = frozenset(
+    [getattr(torch.Tensor, name) for name in ("normal_", "uniform_")]
+    + [getattr(torch.nn.init, name) for name in ("uniform_", "normal_", "trunc_normal_", "kaiming_uniform_",
+                                                  "kaiming_normal_", "xavier_uniform_", "xavier_normal_",
+                                                  "orthogonal_")]
+)
+
+
+class ModelStoreError(Exception):
+    pass
+
+
+def _encode(value):
+    # Segment lengths of the pretrained models are Fractions
+    if isinstance(value, Fraction):
+        return {"__fraction__": str(value)}
+    raise TypeError(f"Cannot store {type(value).__name__} in a model manifest")
+
+
+def _decode(obj):
+    if "__fraction__" in obj:
+        return Fraction(obj["__fraction__"])
+    return obj
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def model_dir(name: str, store_dir: Optional[str] = None) -> str:
+    return os.path.join(store_dir or STORE_DIR, name)
+
+
+def has_model(name: str, store_dir: Optional[str] = None) -> bool:
+    return os.path.exists(os.path.join(model_dir(name, store_dir), MANIFEST_FILENAME))
+
+
+def list_models(store_dir: Optional[str] = None) -> List[str]:
+    store_dir = store_dir or STORE_DIR
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(name for name in os.listdir(store_dir) if has_model(name, store_dir))
+
+
+def save_model(name: str, model: torch.nn.Module, store_dir: Optional[str] = None) -> str:
+    """Converts a loaded demucs model or bag into a store entry. Returns its directory."""
+    bag = model if isinstance(model, BagOfModels) else None
+    members = list(bag.models) if bag is not None else [model]
+    target = model_dir(name, store_dir)
+    tmp_dir = target + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    entries = []
+    for index, member in enumerate(members):
+        args, kwargs = member._init_args_kwargs  # Recorded by demucs' @capture_init
+        filename = f"{index}.pt"
+        path = os.path.join(tmp_dir, filename)
+        torch.save({key: value.detach().cpu().contiguous() for key, value in member.state_dict().items()}, path)
+        entries.append({
+            "class": f"{type(member).__module__}.{type(member).__qualname__}",
+            "args": list(args),
+            "kwargs": kwargs,
+            "segment": member.segment,
+            "file": filename,
+            "size": os.path.getsize(path),
+            "sha256": file_sha256(path),
+        })
+    manifest = {
+        "name": name,
+        "format": FORMAT_VERSION,
+        "bag": bag is not None,
+        "weights": bag.weights if bag is not None else None,
+        "models": entries,
+        "created": time.time(),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2, default=_encode)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_dir, target)
+    return target
+
+
+def verify_model(name: str, store_dir: Optional[str] = None) -> List[str]:
+    """Returns the weight files of a store entry whose checksum does not match (empty if intact)."""
+    manifest = _read_manifest(name, store_dir)
+    directory = model_dir(name, store_dir)
+    return [entry["file"] for entry in manifest["models"]
+            if not os.path.exists(os.path.join(directory, entry["file"]))
+            or file_sha256(os.path.join(directory, entry["file"])) != entry["sha256"]]
+
+
+class _SkipInit(TorchFunctionMode):
+    """
+    Turns the random initialisers into no-ops while a network is built. Torch function
+    modes are thread-local: modules built by other threads meanwhile are initialised
+    as usual.
+    """
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        if func in _INIT_FUNCTIONS:
+            return args[0] if args else kwargs["tensor"]
+        return func(*args, **kwargs)
+
+
+def _check_sizes(name: str, manifest: dict, directory: str) -> None:
+    """Cheap load-time check (no reads): every weight file exists with its stored size."""
+    for entry in manifest["models"]:
+        path = os.path.join(directory, entry["file"])
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            raise ModelStoreError(f"Weight file {entry['file']} of {name} is missing; fetch it again")
+        if "size" in entry and size != entry["size"]:
+            raise ModelStoreError(f"Weight file {entry['file']} of {name} has {size} bytes, "
+                                  f"expected {entry['size']}; fetch it again")
+
+
+def _read_manifest(name: str, store_dir: Optional[str] = None) -> dict:
+    path = os.path.join(model_dir(name, store_dir), MANIFEST_FILENAME)
+    try:
+        with open(path) as f:
+            manifest = json.load(f, object_hook=_decode)
+    except OSError as e:
+        raise ModelStoreError(f"Model '{name}' is not in the store ({path}): {e}")
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ModelStoreError(f"Model '{name}' was stored in format {manifest.get('format')}, "
+                              f"expected {FORMAT_VERSION}; fetch it again")
+    return manifest
+
+
+def _model_class(path: str):
+    module_name, _, class_name = path.rpartition(".")
+    if not module_name.startswith("demucs."):
+        raise ModelStoreError(f"Refusing to load non-demucs model class {path}")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def load_from_store(name: str, store_dir: Optional[str] = None, verify: bool = VERIFY) -> torch.nn.Module:
+    """Builds the model from its store entry, with memory-mapped weights."""
+    manifest = _read_manifest(name, store_dir)
+    directory = model_dir(name, store_dir)
+    _check_sizes(name, manifest, directory)
+    if verify:
+        corrupt = verify_model(name, store_dir)
+        if corrupt:
+            raise ModelStoreError(f"Checksum mismatch for {name}: {', '.join(corrupt)}; fetch it again")
+
+    members = []
+    for entry in manifest["models"]:
+        with _SkipInit():
+            member = _model_class(entry["class"])(*entry["args"], **entry["kwargs"])
+        state = torch.load(os.path.join(directory, entry["file"]), map_location="cpu", mmap=True, weights_only=True)
+        # nn.Module's own loader: demucs' Demucs class overrides it without `assign`
+        torch.nn.Module.load_state_dict(member, state, assign=True)
+        member.segment = entry["segment"]
+        members.append(member.eval())
+    if not manifest["bag"]:
+        return members[0]
+    return BagOfModels(members, manifest["weights"]).eval()
+
+
+def load_model(name: str) -> torch.nn.Module:
+    """Registry loader: the local store first, then demucs' own download/cache path."""
+    if has_model(name):
+        return load_from_store(name)
+    if OFFLINE:
+        raise ModelStoreError(f"Model '{name}' is not in the store at {STORE_DIR} and MODEL_STORE_OFFLINE=1. "
+                              f"Run 'python model_store.py fetch {name}' on a machine with network access "
+                              f"and copy the store over.")
+    from demucs.pretrained import get_model as load_pretrained_model
+    return load_pretrained_model(name)
+
+
+def _cold_start(name: str, source: str) -> Tuple[float, float]:
+    """(process total, load only) seconds for a fresh interpreter to load `name`."""
+    loader = ("from model_store import load_from_store as load" if source == "store"
+              else "from demucs.pretrained import get_model as load")
+    code = f"import time; t = time.perf_counter(); {loader}; load({name!r}); print(time.perf_counter() - t)"
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise ModelStoreError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return time.perf_counter() - start, float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local model store: fetch, verify and benchmark weights.")
+    parser.add_argument("--store", default=None, help=f"Store directory (default {STORE_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fetch = commands.add_parser("fetch", help="Load models through demucs and convert them into the store")
+    fetch.add_argument("names", nargs="+")
+    fetch.add_argument("--repo", default=None, help="Local demucs model repo instead of the network")
+    commands.add_parser("list", help="List stored models")
+    verify = commands.add_parser("verify", help="Check the stored weight files against their checksums")
+    verify.add_argument("names", nargs="*")
+    bench = commands.add_parser("bench", help="Measure cold-start load time, demucs vs store")
+    bench.add_argument("names", nargs="+")
+    args = parser.parse_args()
+    if args.store:
+        os.environ["MODEL_STORE_DIR"] = args.store  # Also for the bench subprocesses
+
+    if args.command == "fetch":
+        from pathlib import Path
+        from demucs.pretrained import get_model as load_pretrained_model
+        for name in args.names:
+            model = load_pretrained_model(name, repo=Path(args.repo) if args.repo else None)
+            path = save_model(name, model, args.store)
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            print(f"{name}: stored in {path} ({size / 1024 / 1024:.0f} MB)")
+    elif args.command == "list":
+        for name in list_models(args.store):
+            print(name)
+    elif args.command == "verify":
+        failed = False
+        for name in args.names or list_models(args.store):
+            corrupt = verify_model(name, args.store)
+            failed |= bool(corrupt)
+            print(f"{name}: {'OK' if not corrupt else 'CORRUPT ' + ', '.join(corrupt)}")
+        sys.exit(1 if failed else 0)
+    elif args.command == "bench":
+        for name in args.names:
+            for source in ("demucs", "store"):
+                try:
+                    total, load = _cold_start(name, source)
+                    print(f"{name} via {source:6s}: import + load {load:6.2f}s, process total {total:6.2f}s")
+                except ModelStoreError as e:
+                    print(f"{name} via {source:6s}: failed ({e})")
+
+
+if __name__ == "__main__":
+    main()
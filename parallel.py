@@ -0,0 +1,299 @@
+"""
+Drum Extractor Pro - Parallel Chunk Module
+==========================================
+
+Splits one track across a pool of worker processes.
+
+Why:
+    A single separation runs its forward passes one after another, and one forward
+    pass only scales to a handful of cores. A long track on a big node therefore
+    leaves most cores idle whenever no other job is queued.
+
+How:
+    The normalized mix is cut into overlapping chunks of CHUNK_SECONDS (plus
+    OVERLAP_SECONDS shared with the next chunk). Each chunk goes to a process pool
+    whose workers each keep their own copy of the model (loaded through their own
+    model registry on first use) and run the regular segment loop on it. The
+    outputs are merged in the parent with complementary linear ramps over the
+    overlaps, the same crossfade the streaming path uses between blocks. Chunk
+    starts are rounded to the model's segment stride, so inside a chunk the segment
+    grid matches a single-process run and only the chunk edges differ.
+
+    Workers are spawned once and reused. Each worker gets `cores / workers` torch
+    threads. Progress is reported per finished chunk. Cancellation drops the chunks
+    that have not started; chunks already running finish in the background.
+
+    Audio crosses the process boundary through `multiprocessing.shared_memory`:
+    for each chunk in flight the parent fills an input block and allocates an
+    output block, and the task sent to the worker only carries their names. The
+    worker maps both, runs the model on the input in place and copies the stems
+    into the output block, which the parent merges and frees. Pickling the arrays
+    instead would serialize them into the pipe and deserialize them on the other
+    side (two extra copies each way plus pipe throughput). At most two chunks per
+    worker are in flight, so the blocks stay small.
+
+Configuration:
+    PARALLEL_WORKERS in main.py (0 disables the pool).
+    PARALLEL_TRANSPORT: "shm" (default) or "pickle".
+"""
+
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+import cpu_topology
+import inference
+
+CHUNK_SECONDS = 30.0
+OVERLAP_SECONDS = 5.0
+# Shorter tracks are not worth splitting (see ChunkPool.worthwhile)
+MIN_SECONDS = 90.0
+TRANSPORTS = ("shm", "pickle")
+DEFAULT_TRANSPORT = os.environ.get("PARALLEL_TRANSPORT", "shm")
+
+
+class SharedArray:
+    """
+    float32 array in a `multiprocessing.shared_memory` block.
+
+    The creating process owns the block and unlinks it in `close()`; other
+    processes `attach()` by descriptor (name and shape, a few bytes to pickle).
+    All views (`array`, `tensor()`) must be dropped before `close()`.
+    """
+
+    def __init__(self, shape: Sequence[int], name: Optional[str] = None):
+        self.shape = tuple(int(n) for n in shape)
+        size = max(1, math.prod(self.shape) * 4)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.array = np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)
+
+    @classmethod
+    def attach(cls, descriptor: Tuple[str, Tuple[int, ...]]) -> "SharedArray":
+        name, shape = descriptor
+        return cls(shape, name)
+
+    @property
+    def descriptor(self) -> Tuple[str, Tuple[int, ...]]:
+        return self.shm.name, self.shape
+
+    def tensor(self) -> torch.Tensor:
+        return torch.from_numpy(self.array)
+
+    def close(self) -> None:
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _init_worker(threads: int) -> None:
+    torch.set_num_threads(threads)
+
+
+def _separate_chunk(task: dict):
+    """
+    Runs in a worker process: separates one normalized chunk.
+
+    With the shared-memory transport the chunk is read from and the output written
+    to the blocks named in the task, and only the silence counts are returned.
+    """
+    import model_registry
+    import precision as precision_modes
+    import backends
+    import silence as silence_skip
+
+    model = model_registry.get_model(task["model_name"], "cpu", precision_modes.weights_variant(task["precision"]))
+    forward = precision_modes.forward_for(task["precision"])
+    if forward is None and task["backend"] and task["backend"] != backends.DEFAULT_BACKEND:
+        forward = backends.get_backend(task["backend"]).forward
+    detector = None
+    if task["silence"] is not None:
+        threshold_db, mean, std = task["silence"]
+        detector = silence_skip.SilenceDetector(threshold_db)
+        detector.set_normalization(mean, std)
+
+    shared_in = shared_out = None
+    if "input" in task:
+        shared_in = SharedArray.attach(task["input"])
+        chunk = shared_in.tensor()
+    else:
+        chunk = torch.from_numpy(task["chunk"])
+    try:
+        sources = inference.apply_segmented(
+            model, chunk, shifts=task["shifts"], overlap=task["overlap"], segment=task["segment"],
+            batch_segments=task["batch_segments"], infer=forward,
+            source_indices=task["source_indices"], seed=task["seed"], silence=detector
+        )
+        del chunk
+        counts = (detector.skipped, detector.segments) if detector is not None else (0, 0)
+        if shared_in is None:
+            return sources.numpy(), counts
+        shared_out = SharedArray.attach(task["output"])
+        np.copyto(shared_out.array, sources.numpy())
+        del sources
+        return None, counts
+    finally:
+        for block in (shared_in, shared_out):
+            if block is not None:
+                block.close()
+
+
+class ChunkPool:
+    """
+    Process pool separating chunks of a single track in parallel.
+
+    Args:
+        workers (int): Worker processes, each holding its own model copy.
+        threads_per_worker (int): Torch intra-op threads per worker (0 = cores / workers).
+        transport (str): "shm" passes chunk audio through shared memory, "pickle"
+            sends it through the pool's pipes (see benchmark_transport.py).
+    """
+
+    def __init__(self, workers: int, threads_per_worker: int = 0, transport: str = DEFAULT_TRANSPORT):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport '{transport}'. Choose from: {', '.join(TRANSPORTS)}")
+        self.workers = max(1, int(workers))
+        self.threads_per_worker = threads_per_worker or max(1, len(cpu_topology.available_cores()) // self.workers)
+        self.transport = transport
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.chunks = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs torch threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.threads_per_worker,)
+                )
+            return self._executor
+
+    def worthwhile(self, duration: float) -> bool:
+        """True if a `duration`-second track is long enough to split across the workers."""
+        return self.workers > 1 and duration >= MIN_SECONDS
+
+    def apply(self, model_name: str, mix: torch.Tensor, samplerate: int, source_indices: Sequence[int],
+              shifts: int = 1, overlap: float = 0.25, precision: str = "fp32", backend: Optional[str] = None,
+              progress_callback=None, cancel_check=None, checkpoint=None, seed: Optional[int] = None,
+              silence=None, mean: float = 0.0, std: float = 1.0, stride: int = 0,
+              segment: Optional[float] = None, batch_segments: int = 1) -> torch.Tensor:
+        """
+        `inference.apply_segmented` over chunks of the normalized `mix` (Channels, Time),
+        run in the worker processes. Returns (len(source_indices), Channels, Time).
+
+        Finished chunks are saved to `checkpoint` (keys "c<index>"). `silence` gets
+        the skip counts of all chunks; `mean`/`std` are the normalization statistics.
+        `stride` (inference.segment_stride) aligns the chunk starts to the segment grid;
+        `segment`/`batch_segments` are passed on to the workers' segment loop.
+        """
+        channels, length = mix.shape
+        n_sources = len(source_indices)
+        overlap_frames = int(OVERLAP_SECONDS * samplerate)
+        hop = int(CHUNK_SECONDS * samplerate)
+        if stride:
+            hop = max(1, round(hop / stride)) * stride
+        n_chunks = max(1, math.ceil(max(length - overlap_frames, 1) / hop))
+        starts = [index * hop for index in range(n_chunks)]
+        ends = [length if index == n_chunks - 1 else min(length, start + hop + overlap_frames)
+                for index, start in enumerate(starts)]
+        out = torch.zeros(n_sources, channels, length)
+        ramp = torch.linspace(0.0, 1.0, overlap_frames) if overlap_frames else None
+
+        def merge(index, chunk_out):
+            start, end = starts[index], ends[index]
+            if overlap_frames and index > 0:
+                chunk_out[..., :overlap_frames] *= ramp
+            if overlap_frames and index < n_chunks - 1:
+                chunk_out[..., -overlap_frames:] *= 1 - ramp
+            out[..., start:end] += chunk_out
+
+        todo = []
+        for index in range(n_chunks):
+            if checkpoint is not None and checkpoint.has(f"c{index}"):
+                merge(index, checkpoint.load(f"c{index}"))
+            else:
+                todo.append(index)
+        done_count = n_chunks - len(todo)
+
+        def submit(index):
+            start, end = starts[index], ends[index]
+            task = {
+                "model_name": model_name, "precision": precision, "backend": backend,
+                "shifts": shifts, "overlap": overlap, "source_indices": list(source_indices),
+                "segment": segment, "batch_segments": batch_segments,
+                "seed": seed + index if seed is not None else None,
+                "silence": (silence.threshold_db, mean, std) if silence is not None else None,
+            }
+            blocks = ()
+            if self.transport == "shm":
+                # Only the block names travel through the pool's pipes
+                blocks = (SharedArray((channels, end - start)), SharedArray((n_sources, channels, end - start)))
+                np.copyto(blocks[0].array, mix[:, start:end].numpy())
+                task["input"], task["output"] = blocks[0].descriptor, blocks[1].descriptor
+            else:
+                task["chunk"] = mix[:, start:end].contiguous().numpy()
+            return executor.submit(_separate_chunk, task), blocks
+
+        executor = self._get_executor()
+        self.jobs += 1
+        # A bounded number of chunks in flight keeps the transfer buffers small
+        max_in_flight = 2 * self.workers
+        pending = {}
+        try:
+            while todo or pending:
+                while todo and len(pending) < max_in_flight:
+                    index = todo.pop(0)
+                    future, blocks = submit(index)
+                    pending[future] = (index, blocks)
+                finished, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                if cancel_check and cancel_check():
+                    raise inference.CancellationException("Task cancelled by user")
+                for future in finished:
+                    index, blocks = pending.pop(future)
+                    try:
+                        result, (skipped, segments) = future.result()
+                        chunk_out = blocks[1].tensor() if blocks else torch.from_numpy(result)
+                        if checkpoint is not None:
+                            checkpoint.save(f"c{index}", chunk_out)
+                        merge(index, chunk_out)
+                        del chunk_out
+                    finally:
+                        for block in blocks:
+                            block.close()
+                    if silence is not None:
+                        silence.skipped += skipped
+                        silence.segments += segments
+                    done_count += 1
+                    self.chunks += 1
+                    if progress_callback:
+                        progress_callback(done_count / n_chunks * 100)
+        finally:
+            for future, (_, blocks) in pending.items():
+                future.cancel()
+                # Unlinking only removes the name: a worker still using a block keeps its mapping
+                for block in blocks:
+                    block.close()
+        return out
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "threads_per_worker": self.threads_per_worker,
+                "jobs": self.jobs, "chunks": self.chunks}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
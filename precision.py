@@ -0,0 +1,85 @@
+"""
+Drum Extractor Pro - Inference Precision Module
+===============================================
+
+Reduced-precision CPU inference modes.
+
+Why:
+    Separation runs on CPU-only nodes, where the float32 matrix multiplications of
+    the transformer layers dominate the run time. Lower-precision arithmetic trades
+    a little separation quality for throughput.
+
+How:
+    - "fp32": the reference float32 forward pass.
+    - "int8": dynamic quantization of the Linear/LSTM layers
+      (`torch.ao.quantization.quantize_dynamic`). Weights are stored as int8 and
+      activations are quantized on the fly. The quantized copy is a separate model,
+      so the registry keeps it under its own key.
+    - "bf16": bfloat16 autocast around the forward pass. It uses the float32 weights
+      and needs a CPU with native bf16 support (AVX512-BF16 / AMX). Elsewhere it falls
+      back to fp32.
+
+    `benchmark_precision.py` reports real-time factor and SDR against fp32.
+"""
+
+import copy
+from typing import Callable
+
+import torch
+
+PRECISIONS = ("fp32", "int8", "bf16")
+DEFAULT_PRECISION = "fp32"
+
+
+def bf16_supported() -> bool:
+    """True if this CPU runs bfloat16 kernels natively."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve(precision=None, device="cpu") -> str:
+    """
+    Validates `precision` and returns the mode that will actually run on `device`.
+
+    Raises ValueError for unknown modes. Reduced precision is CPU-only; unsupported
+    combinations fall back to fp32 with a warning.
+    """
+    precision = precision or DEFAULT_PRECISION
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Choose from: {', '.join(PRECISIONS)}")
+    if precision != "fp32" and not str(device).startswith("cpu"):
+        print(f"Warning: {precision} inference is CPU-only, using fp32 on {device}")
+        return "fp32"
+    if precision == "bf16" and not bf16_supported():
+        print("Warning: CPU has no native bfloat16 support, using fp32")
+        return "fp32"
+    return precision
+
+
+def weights_variant(precision: str) -> str:
+    """Registry variant holding the weights for `precision` (bf16 reuses fp32 weights)."""
+    return "int8" if precision == "int8" else "fp32"
+
+
+def convert_model(model: torch.nn.Module, variant: str) -> torch.nn.Module:
+    """Returns the model for a weights variant; "int8" builds a quantized copy."""
+    if variant == "fp32":
+        return model
+    if variant == "int8":
+        return torch.ao.quantization.quantize_dynamic(
+            copy.deepcopy(model).cpu(), {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8
+        )
+    raise ValueError(f"Unknown weights variant '{variant}'")
+
+
+def bf16_forward(model: torch.nn.Module, batch: torch.Tensor) -> torch.Tensor:
+    """`inference.forward` under bfloat16 autocast; the output is returned as float32."""
+    with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16):
+        return model(batch).float()
+
+
+def forward_for(precision: str) -> Callable:
+    """Forward function implementing `precision` (None means the plain forward pass)."""
+    return bf16_forward if precision == "bf16" else None
@@ -0,0 +1,157 @@
+"""
+Drum Extractor Pro - Resampling Module
+======================================
+
+Converts uploads to the model's sample rate before inference (and stems back, if
+asked).
+
+Why:
+    The separation fed the audio at whatever rate the file had and wrote the stems
+    at that rate. Demucs models are trained at 44.1 kHz, so a 48 kHz upload ran
+    about 9% more segments than needed and a 96 kHz one more than twice as many,
+    and both ran off the training distribution (the model sees every frequency
+    scaled by the rate ratio).
+
+How:
+    `cached_input` writes a float32 WAV of the input at the model rate to
+    RESAMPLE_CACHE_DIR (`<name>-<path hash>.sr44100.wav`), never next to the input,
+    which may be a file in the user's library, and returns its path. The conversion streams
+    through `decoder.blocks`, so memory stays bounded, and uses soxr's polyphase
+    resampler (vectorized over channels, streamed with `ResampleStream`). The
+    copy is reused by every later reader of the track: analysis, the preview, the
+    full separation (streaming reads it twice), and progressive upgrades. Callers
+    delete it when done with the input (`discard_cached`).
+
+    `resample_tensor` converts (..., Time) tensors in one call, e.g. separated stems
+    back to the upload's rate. It treats all leading dimensions as channels of one
+    soxr call. `convert_file` does the same for stem files written by the
+    streaming path, block by block. Without soxr, julius (installed with demucs)
+    resamples whole arrays instead.
+
+    Compare the resamplers with `python benchmark_resample.py`.
+
+Configuration:
+    RESAMPLE_QUALITY: soxr quality, "QQ", "LQ", "MQ", "HQ" (default) or "VHQ".
+    RESAMPLE_CACHE_DIR: Directory of the resampled copies (default "temp_inputs").
+    STEM_SAMPLERATE in main.py: "model" (stems at 44.1 kHz, default) or "input".
+"""
+
+import glob
+import hashlib
+import os
+import threading
+import time
+from typing import Dict
+
+import numpy as np
+import soundfile as sf
+import torch
+
+import decoder
+
+QUALITY = os.environ.get("RESAMPLE_QUALITY", "HQ")
+CACHE_DIR = os.environ.get("RESAMPLE_CACHE_DIR", "temp_inputs")
+CACHED_SUFFIX = ".sr"
+
+try:
+    import soxr
+except ImportError:  # Optional: julius is the fallback
+    soxr = None
+
+_locks_guard = threading.Lock()
+_locks: Dict[str, threading.Lock] = {}
+
+
+def resample_array(x: np.ndarray, in_rate: int, out_rate: int) -> np.ndarray:
+    """Resamples a float32 (Time, Channels) array."""
+    if in_rate == out_rate:
+        return x
+    if soxr is not None:
+        return soxr.resample(x, in_rate, out_rate, quality=QUALITY)
+    import julius
+    return julius.resample_frac(torch.from_numpy(np.ascontiguousarray(x.T)), in_rate, out_rate).numpy().T
+
+
+def resample_tensor(x: torch.Tensor, in_rate: int, out_rate: int) -> torch.Tensor:
+    """Resamples a (..., Time) tensor; leading dimensions are processed in one vectorized call."""
+    if in_rate == out_rate:
+        return x
+    if soxr is None or x.device.type != "cpu":
+        import julius
+        return julius.resample_frac(x, in_rate, out_rate)
+    flat = x.reshape(-1, x.shape[-1])
+    out = soxr.resample(flat.numpy().T, in_rate, out_rate, quality=QUALITY)
+    return torch.from_numpy(np.ascontiguousarray(out.T)).reshape(*x.shape[:-1], -1)
+
+
+def _cached_prefix(file_path: str) -> str:
+    # The hash of the full path keeps inputs with the same name in different folders apart
+    stem, _ = os.path.splitext(os.path.basename(str(file_path)))
+    digest = hashlib.sha1(os.path.abspath(str(file_path)).encode()).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, f"{stem}-{digest}")
+
+
+def cached_path(file_path: str, samplerate: int) -> str:
+    return f"{_cached_prefix(file_path)}{CACHED_SUFFIX}{samplerate}.wav"
+
+
+def _lock_for(path: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def cached_input(file_path: str, samplerate: int) -> str:
+    """
+    Path of `file_path` at `samplerate`: the file itself if it already has that rate,
+    otherwise a resampled float32 WAV in CACHE_DIR (created on first use).
+    """
+    info = decoder.probe(file_path)
+    if info.samplerate == samplerate:
+        return file_path
+    path = cached_path(file_path, samplerate)
+    with _lock_for(path):
+        if os.path.exists(path):
+            return path
+        start = time.perf_counter()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = path + ".tmp"
+        # RIFF sizes are 32-bit: copies past 4 GiB are written as RF64
+        size = info.frames * samplerate // info.samplerate * info.channels * 4
+        with sf.SoundFile(tmp_path, "w", samplerate=samplerate, channels=info.channels,
+                          format="RF64" if size >= 0xFFFFFFFF - 1024 else "WAV", subtype="FLOAT") as out:
+            if soxr is not None or info.backend == "ffmpeg":
+                for block in decoder.blocks(file_path, samplerate=samplerate):
+                    out.write(block)
+            else:
+                data, _ = decoder.read(file_path)
+                out.write(resample_array(data, info.samplerate, samplerate))
+        os.replace(tmp_path, path)
+        print(f"Resampled {os.path.basename(file_path)} from {info.samplerate} to {samplerate} Hz "
+              f"in {time.perf_counter() - start:.2f}s")
+    return path
+
+
+def discard_cached(file_path: str) -> None:
+    """Deletes the resampled copies of `file_path`."""
+    for path in glob.glob(glob.escape(_cached_prefix(file_path)) + CACHED_SUFFIX + "*.wav"):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Warning: Failed to delete resampled input {path}: {e}")
+
+
+def convert_file(path: str, samplerate: int) -> None:
+    """Rewrites the audio file `path` (format and subtype kept) at `samplerate`."""
+    info = sf.info(path)
+    if info.samplerate == samplerate:
+        return
+    tmp_path = path + ".tmp"
+    with sf.SoundFile(tmp_path, "w", samplerate=samplerate, channels=info.channels,
+                      format=info.format, subtype=info.subtype) as out:
+        if soxr is not None:
+            for block in decoder.blocks(path, samplerate=samplerate):
+                out.write(block)
+        else:
+            data, _ = decoder.read(path)
+            out.write(resample_array(data, info.samplerate, samplerate))
+    os.replace(tmp_path, path)
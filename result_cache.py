@@ -0,0 +1,194 @@
+"""
+Drum Extractor Pro - Result Cache Module
+========================================
+
+Content-addressed cache of separation results in `processed_tracks/`.
+
+Why:
+    Users re-upload the same songs, and every upload gets a fresh timestamped name,
+    so identical audio was separated again from scratch.
+
+How:
+    The key is a SHA-256 over the decoded PCM (float32, independent of container,
+    tags and filename) combined with the model name and separation parameters.
+    An index file (`.cache_index.json`) inside the output directory maps keys to the
+    track folder holding the stems. Lookups verify the folder still exists (it may
+    have been removed through `/delete`), and the least-recently-used folders are
+    deleted when the indexed total exceeds the size budget.
+
+    A track folder belongs to at most one key: storing a folder under a new key
+    drops the entry that indexed it before (a progressive upgrade re-keys the fast
+    result to the upgrade preset), so sizes are counted once and evicting a key
+    never deletes stems another key still points to.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import decoder
+
+INDEX_FILENAME = ".cache_index.json"
+HASH_BLOCK_FRAMES = 1 << 18
+
+
+def hash_audio_file(file_path: str) -> str:
+    """SHA-256 of the decoded float32 PCM plus sample rate and channel count."""
+    digest = hashlib.sha256()
+    info = decoder.probe(file_path)
+    digest.update(f"{info.samplerate}:{info.channels}:".encode())
+    for block in decoder.blocks(file_path, block_frames=HASH_BLOCK_FRAMES):
+        digest.update(memoryview(np.ascontiguousarray(block)).cast("B"))
+    return digest.hexdigest()
+
+
+def make_key(audio_hash: str, model_name: str, params: Optional[dict] = None) -> str:
+    """Combines the audio hash with everything that influences the separated output."""
+    payload = json.dumps({"audio": audio_hash, "model": model_name, "params": params or {}},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResultCache:
+    """
+    Index of separated track folders under `root`, keyed by content hash.
+
+    Args:
+        root (str): Output directory containing one folder per track.
+        budget_bytes (int): Maximum total size of indexed folders before eviction.
+    """
+
+    def __init__(self, root: str, budget_bytes: int):
+        self.root = str(root)
+        self.budget_bytes = budget_bytes
+        self.index_path = os.path.join(self.root, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = self._load_index()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: str, count_miss: bool = True) -> Optional[Tuple[Dict[str, str], dict]]:
+        """
+        Returns (stems {name: path}, metadata) for a cached result, or None.
+
+        `count_miss=False` is for re-checks of a key that was already counted as a miss
+        (e.g. right before running a queued job, in case a duplicate upload finished first).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            result = self._resolve(entry) if entry else None
+            if result is None:
+                if entry:
+                    # Folder was deleted or damaged outside the cache
+                    del self._entries[key]
+                    self._save_index()
+                if count_miss:
+                    self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            self.hits += 1
+            self._save_index()
+            return result
+
+    def store(self, key: str, save_dir: str, files: Dict[str, str]) -> None:
+        """Registers a finished track folder and evicts old entries beyond the budget."""
+        track = os.path.basename(os.path.normpath(save_dir))
+        with self._lock:
+            self._drop_track_locked(track)
+            self._entries[key] = {
+                "track": track,
+                "files": {name: os.path.basename(path) for name, path in files.items()},
+                "size": _dir_size(save_dir),
+                "last_used": time.time(),
+            }
+            self._evict_locked(keep=key)
+            self._save_index()
+
+    def forget(self, save_dir: str) -> None:
+        """Drops the entry of a track folder without deleting it (its stems are about to change)."""
+        with self._lock:
+            if self._drop_track_locked(os.path.basename(os.path.normpath(save_dir))):
+                self._save_index()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_mb": round(sum(e["size"] for e in self._entries.values()) / 1024 / 1024, 1),
+                "budget_mb": round(self.budget_bytes / 1024 / 1024, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _resolve(self, entry: dict) -> Optional[Tuple[Dict[str, str], dict]]:
+        track_dir = os.path.join(self.root, entry["track"])
+        metadata_path = os.path.join(track_dir, "metadata.json")
+        try:
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Silent stems have no file, the API synthesizes them (see silent_stems.py)
+        silent = metadata.get("silent_stems") or {}
+        stems = {}
+        for name, filename in entry["files"].items():
+            path = os.path.join(track_dir, filename)
+            if not os.path.exists(path) and name not in silent:
+                return None
+            stems[name] = path
+        return stems, metadata
+
+    def _drop_track_locked(self, track: str) -> bool:
+        keys = [key for key, entry in self._entries.items() if entry["track"] == track]
+        for key in keys:
+            del self._entries[key]
+        return bool(keys)
+
+    def _evict_locked(self, keep: str) -> None:
+        total = sum(e["size"] for e in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]["last_used"]):
+            if total <= self.budget_bytes:
+                break
+            if key == keep:
+                continue
+            entry = self._entries.pop(key)
+            total -= entry["size"]
+            track_dir = os.path.join(self.root, entry["track"])
+            print(f"Evicting cached result {entry['track']} (cache budget exceeded)")
+            shutil.rmtree(track_dir, ignore_errors=True)
+
+    def _load_index(self) -> Dict[str, dict]:
+        try:
+            with open(self.index_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Older indexes could list one folder under two keys: keep the most recently used
+        latest = {}
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]["last_used"]):
+            latest[entry["track"]] = key
+        return {key: entries[key] for key in latest.values()}
+
+    def _save_index(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.index_path)
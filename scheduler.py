@@ -0,0 +1,184 @@
+"""
+Drum Extractor Pro - Separation Scheduler Module
+================================================
+
+Bounded worker pool for Demucs inference jobs.
+
+Why:
+    Demucs inference is CPU and memory heavy, and torch already parallelizes a single
+    forward pass across cores. Running many separations at once through the default
+    thread pool makes them fight over the same cores and RAM, so total throughput
+    collapses as concurrency rises.
+
+How:
+    A fixed number of inference slots (worker threads) pull jobs from a FIFO queue.
+    Jobs waiting in the queue can report their position and can be cancelled before
+    they start. Results are delivered through `concurrent.futures.Future`, which the
+    FastAPI layer awaits with `asyncio.wrap_future`.
+
+    Background jobs (e.g. progressive quality upgrades) only use idle capacity: one
+    runs at a time, and only while no regular job is waiting. A running background
+    job polls `check_preempt` (as its cancel check); once a regular job is waiting it
+    raises `Preempted`, the background job goes back to the head of its queue and the
+    slot serves the regular job. Background jobs are expected to resume from their
+    checkpoints when they run again.
+"""
+
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, Optional
+
+
+class CancelledBeforeStart(Exception):
+    pass
+
+
+class Preempted(Exception):
+    """Raised inside a background job to hand its slot to a waiting regular job."""
+
+
+class _Job:
+    __slots__ = ("job_id", "task_id", "fn", "future", "state", "background")
+
+    def __init__(self, job_id: int, task_id: str, fn: Callable, background: bool = False):
+        self.job_id = job_id
+        self.task_id = task_id
+        self.fn = fn
+        self.future: Future = Future()
+        self.state = "queued"
+        self.background = background
+
+
+class SeparationScheduler:
+    """
+    FIFO job queue served by `slots` worker threads.
+
+    Args:
+        slots (int): Number of jobs allowed to run inference concurrently.
+        on_worker_start (callable): Called with the slot index on each worker thread
+            before it takes its first job (e.g. to set torch threads / CPU affinity).
+    """
+
+    def __init__(self, slots: int = 1, on_worker_start: Optional[Callable[[int], None]] = None):
+        self.slots = max(1, int(slots))
+        self._on_worker_start = on_worker_start
+        self._queue: Deque[_Job] = deque()
+        self._background: Deque[_Job] = deque()
+        self._running: Dict[int, _Job] = {}
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._workers = []
+        self.completed = 0
+        self.preemptions = 0
+
+    def submit(self, task_id: str, fn: Callable, background: bool = False) -> Future:
+        """
+        Queues `fn()` for execution and returns a Future for its result.
+
+        `background` jobs run only on idle capacity and may be preempted (see
+        check_preempt); `fn` is then called again from the start later.
+        """
+        job = _Job(next(self._ids), task_id, fn, background)
+        with self._cond:
+            self._ensure_workers_locked()
+            (self._background if background else self._queue).append(job)
+            self._cond.notify_all()
+        return job.future
+
+    def check_preempt(self) -> bool:
+        """Cancel check for background jobs: raises Preempted while regular jobs wait."""
+        with self._cond:
+            waiting = bool(self._queue)
+        if waiting:
+            raise Preempted("A regular job is waiting")
+        return False
+
+    def position(self, task_id: str) -> Optional[int]:
+        """1-based position in the queue, 0 if running, None if unknown."""
+        with self._cond:
+            for job in self._running.values():
+                if job.task_id == task_id:
+                    return 0
+            for index, job in enumerate(self._queue):
+                if job.task_id == task_id:
+                    return index + 1
+            for index, job in enumerate(self._background):
+                if job.task_id == task_id:
+                    return len(self._queue) + index + 1
+        return None
+
+    def cancel(self, task_id: str) -> bool:
+        """Removes queued (not yet running) jobs for task_id. Returns True if any were removed."""
+        removed = []
+        with self._cond:
+            for queue in (self._queue, self._background):
+                for job in list(queue):
+                    if job.task_id == task_id:
+                        queue.remove(job)
+                        removed.append(job)
+        for job in removed:
+            job.state = "cancelled"
+            job.future.set_exception(CancelledBeforeStart(f"Task {task_id} cancelled while queued"))
+        return bool(removed)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "running": len(self._running),
+                "queued": len(self._queue),
+                "background_queued": len(self._background),
+                "preemptions": self.preemptions,
+                "completed": self.completed,
+            }
+
+    def _ensure_workers_locked(self) -> None:
+        while len(self._workers) < self.slots:
+            slot = len(self._workers)
+            worker = threading.Thread(
+                target=self._worker_loop, args=(slot,), name=f"separation-slot-{slot}", daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _worker_loop(self, slot: int) -> None:
+        if self._on_worker_start:
+            try:
+                self._on_worker_start(slot)
+            except Exception as e:
+                print(f"Warning: Worker {slot} setup failed: {e}")
+        while True:
+            with self._cond:
+                while not self._queue and not self._background_ready_locked():
+                    self._cond.wait()
+                job = self._queue.popleft() if self._queue else self._background.popleft()
+                job.state = "running"
+                self._running[job.job_id] = job
+
+            # A preempted background job was started before: its future is already running
+            if job.future.running() or job.future.set_running_or_notify_cancel():
+                try:
+                    result = job.fn()
+                except Preempted:
+                    with self._cond:
+                        job.state = "queued"
+                        self._running.pop(job.job_id, None)
+                        self._background.appendleft(job)
+                        self.preemptions += 1
+                    continue
+                except BaseException as e:
+                    job.future.set_exception(e)
+                else:
+                    job.future.set_result(result)
+
+            with self._cond:
+                job.state = "done"
+                self._running.pop(job.job_id, None)
+                self.completed += 1
+                if job.background:
+                    self._cond.notify_all()
+
+    def _background_ready_locked(self) -> bool:
+        return bool(self._background) and not any(job.background for job in self._running.values())
@@ -0,0 +1,107 @@
+"""
+Drum Extractor Pro - Silence Skipping Module
+============================================
+
+Skips the forward pass for segments whose input is silent.
+
+Why:
+    Many uploads have long silent intros or outros, or silent gaps between songs,
+    and the network still ran over every segment of them. Separating silence only
+    produces (near) silence, at the full cost of a forward pass.
+
+How:
+    Before inference the normalized mix is scanned in frames of FRAME_SAMPLES with a
+    vectorized RMS (max over channels), in chunks so no full-size temporary is made.
+    A frame is silent when its RMS is below the threshold (dBFS of the original
+    audio). The segment loop in inference.py then skips every segment whose input
+    span, including the model's padding context, lies entirely in silent frames:
+    its output is set to the normalized value of digital silence for every stem,
+    so the stems are 0 there after de-normalization. Skipped segments still
+    take part in the overlap-add with their regular window weight, so the
+    transition into and out of a skipped region is crossfaded like any other
+    segment boundary.
+
+    Segments touching non-silent frames always run, so skipping only ever replaces
+    inference over audio quieter than the threshold.
+
+    A constant mix (e.g. an all-zero upload) has std 0. Its std is floored at
+    MIN_STD, which makes the normalized mix 0 and every frame silent, so no
+    segment runs and the stems come out as digital silence.
+
+Configuration:
+    SILENCE_SKIP / SILENCE_THRESHOLD_DB in main.py.
+"""
+
+import torch
+
+DEFAULT_THRESHOLD_DB = -60.0
+FRAME_SAMPLES = 1024
+# Floor for the normalization std: a constant mix has std 0
+MIN_STD = 1e-8
+SCAN_CHUNK_FRAMES = 1024
+
+
+class SilenceDetector:
+    """
+    Finds silent frames of a normalized mix and counts the segments skipped.
+
+    `set_normalization` must be called with the statistics the mix was normalized
+    with before it is scanned. One detector is used for a whole job (all blocks of
+    a streamed track), so its counters cover the job.
+
+    Args:
+        threshold_db (float): Frames with an RMS below this (dBFS, before
+            normalization) are silent.
+    """
+
+    def __init__(self, threshold_db: float = DEFAULT_THRESHOLD_DB):
+        self.threshold_db = threshold_db
+        self.value = 0.0
+        self.threshold = 10 ** (threshold_db / 20)
+        self.segments = 0
+        self.skipped = 0
+
+    def set_normalization(self, mean: float, std: float) -> None:
+        """Digital silence and the threshold, in normalized units."""
+        std = max(std, MIN_STD)
+        self.value = -mean / std
+        self.threshold = 10 ** (self.threshold_db / 20) / std
+
+    def scan(self, mix: torch.Tensor) -> torch.Tensor:
+        """Bool tensor with one entry per FRAME_SAMPLES frame of `mix` (Channels, Time)."""
+        channels, length = mix.shape
+        n_frames = -(-length // FRAME_SAMPLES)
+        silent = torch.empty(n_frames, dtype=torch.bool, device=mix.device)
+        chunk = SCAN_CHUNK_FRAMES * FRAME_SAMPLES
+        for start in range(0, length, chunk):
+            block = mix[:, start:start + chunk] - self.value
+            tail = -block.shape[-1] % FRAME_SAMPLES
+            if tail:
+                # The last frame is padded with silence
+                block = torch.nn.functional.pad(block, (0, tail))
+            energy = block.square_().view(channels, -1, FRAME_SAMPLES).mean(-1).amax(0)
+            frame = start // FRAME_SAMPLES
+            silent[frame:frame + energy.shape[0]] = energy < self.threshold ** 2
+        return silent
+
+    def is_silent(self, silent: torch.Tensor, start: int, end: int) -> bool:
+        """
+        True if mix samples [start, end) are all in silent frames. Samples outside the
+        mix are padding and count as silent.
+        """
+        first = max(0, start) // FRAME_SAMPLES
+        last = min(end, silent.shape[0] * FRAME_SAMPLES)
+        if last <= first * FRAME_SAMPLES:
+            return True
+        return bool(silent[first:-(-last // FRAME_SAMPLES)].all())
+
+    def count(self, skipped: bool) -> None:
+        self.segments += 1
+        self.skipped += int(skipped)
+
+    def skipped_seconds(self, duration: float) -> float:
+        """Share of the inference skipped, expressed in seconds of a `duration`-long track."""
+        if not self.segments:
+            return 0.0
+        return duration * self.skipped / self.segments
+
@@ -0,0 +1,174 @@
+"""
+Drum Extractor Pro - Silent Stems Module
+========================================
+
+Records stems that are silent over the whole track instead of writing them.
+
+Why:
+    A large share of the catalogue has no vocals (or no bass, or no drums), and
+    separation still wrote a full-length, near-silent file for that stem. It was
+    stored in the result cache, downloaded by every client, and decoded by
+    wavesurfer in the frontend just to draw a flat line.
+
+How:
+    After separation every stem is checked in frames of silence.FRAME_SAMPLES: a
+    stem is silent when the RMS of each frame (max over channels) stays below the
+    threshold (dBFS). Loud stems stop the check at their first loud chunk, so it
+    costs next to nothing for them. The streaming path feeds the check block by
+    block (`SilentStems.update`) while the stems are written, and deletes the files
+    of the stems that stayed silent at the end; the in-memory path checks before
+    encoding and skips them.
+
+    Silent stems are listed in metadata.json under `silent_stems` with what is
+    needed to recreate them ({name: {file, samplerate, channels, frames}}). The
+    API serves them by synthesizing digital silence on request (`render`): WAV
+    formats are a header followed by zeros, streamed; FLAC is encoded once per
+    length (a few KB, constant subframes) and kept in a small cache. Either can be
+    rendered from a byte offset, so Range requests (seeking players, resumed
+    downloads) get just the requested bytes. The response
+    marks such stems `"silent": true`, so the frontend draws them without
+    fetching and decoding the audio.
+
+    Everything below the threshold becomes exact zeros, so the threshold should
+    stay well below audible bleed.
+
+Configuration:
+    SILENT_STEMS / SILENT_STEM_THRESHOLD_DB in main.py.
+"""
+
+import functools
+import io
+import os
+import struct
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+import soundfile as sf
+import torch
+
+import silence
+import stem_writer
+
+DEFAULT_THRESHOLD_DB = -60.0
+CHECK_CHUNK_FRAMES = 256
+ZERO_CHUNK_BYTES = 1 << 20
+
+# WAV subtype -> (format tag, bytes per sample)
+_WAV_SUBTYPES = {"PCM_16": (1, 2), "PCM_24": (1, 3), "FLOAT": (3, 4)}
+
+
+def is_silent(source: torch.Tensor, threshold_db: float = DEFAULT_THRESHOLD_DB) -> bool:
+    """True if every FRAME_SAMPLES frame of `source` (Channels, Time) is quieter than `threshold_db`."""
+    threshold = 10 ** (threshold_db / 20)
+    channels, length = source.shape
+    chunk = CHECK_CHUNK_FRAMES * silence.FRAME_SAMPLES
+    for start in range(0, length, chunk):
+        block = source[:, start:start + chunk]
+        tail = -block.shape[-1] % silence.FRAME_SAMPLES
+        if tail:
+            block = torch.nn.functional.pad(block, (0, tail))
+        energy = block.square().view(channels, -1, silence.FRAME_SAMPLES).mean(-1)
+        if bool((energy >= threshold ** 2).any()):
+            return False
+    return True
+
+
+class SilentStems:
+    """
+    Collects the silent stems of one job.
+
+    Args:
+        threshold_db (float): Stems whose frames all stay below this (dBFS) are silent.
+    """
+
+    def __init__(self, threshold_db: float = DEFAULT_THRESHOLD_DB):
+        self.threshold_db = threshold_db
+        self.stems: Dict[str, dict] = {}
+        self._loud = set()
+
+    def update(self, name: str, source: torch.Tensor) -> bool:
+        """Checks the next (Channels, Time) part of stem `name`. True while all of it was silent."""
+        if name not in self._loud and not is_silent(source, self.threshold_db):
+            self._loud.add(name)
+        return name not in self._loud
+
+    def silent(self, names: Sequence[str]):
+        """The names checked so far that stayed silent."""
+        return [name for name in names if name not in self._loud]
+
+    def record(self, name: str, path: str, samplerate: int, channels: int, frames: int) -> None:
+        self.stems[name] = {"file": os.path.basename(path), "samplerate": samplerate,
+                            "channels": channels, "frames": frames}
+
+    def rescale(self, samplerate: int) -> None:
+        """Adjusts the recorded lengths after the written stems were converted to `samplerate`."""
+        for entry in self.stems.values():
+            entry["frames"] = round(entry["frames"] * samplerate / entry["samplerate"])
+            entry["samplerate"] = samplerate
+
+
+def find(metadata: dict, filename: str) -> Optional[dict]:
+    """The `silent_stems` entry of track metadata for `filename`, or None."""
+    for entry in (metadata.get("silent_stems") or {}).values():
+        if entry["file"] == filename:
+            return entry
+    return None
+
+
+def duration(entry: dict) -> float:
+    return entry["frames"] / entry["samplerate"]
+
+
+def _wav_header(entry: dict, subtype: str) -> bytes:
+    tag, width = _WAV_SUBTYPES[subtype]
+    channels = entry["channels"]
+    data_size = entry["frames"] * channels * width
+    return (b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, tag, channels, entry["samplerate"],
+                                    entry["samplerate"] * channels * width, channels * width, width * 8)
+            + b"data" + struct.pack("<I", data_size))
+
+
+@functools.lru_cache(maxsize=32)
+def _flac(samplerate: int, channels: int, frames: int, subtype: str) -> bytes:
+    buffer = io.BytesIO()
+    zeros = np.zeros((min(stem_writer.WRITE_BLOCK_FRAMES, max(frames, 1)), channels), dtype=np.float32)
+    with sf.SoundFile(buffer, "w", samplerate=samplerate, channels=channels, format="FLAC", subtype=subtype) as out:
+        for start in range(0, frames, zeros.shape[0]):
+            out.write(zeros[:frames - start])
+    return buffer.getvalue()
+
+
+def content_length(entry: dict, output_format: str) -> int:
+    """Size in bytes of the file `render` produces."""
+    container, subtype, _ = stem_writer.FORMATS[output_format]
+    if container == "FLAC":
+        return len(_flac(entry["samplerate"], entry["channels"], entry["frames"], subtype))
+    _, width = _WAV_SUBTYPES[subtype]
+    return 44 + entry["frames"] * entry["channels"] * width
+
+
+def render(entry: dict, output_format: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """
+    The silent stem as a file in `output_format` (see stem_writer.FORMATS), in chunks.
+
+    `start` / `end` restrict the output to the bytes [start, end) of that file.
+    """
+    container, subtype, _ = stem_writer.FORMATS[output_format]
+    if container == "FLAC":
+        yield _flac(entry["samplerate"], entry["channels"], entry["frames"], subtype)[start:end]
+        return
+    header = _wav_header(entry, subtype)
+    _, width = _WAV_SUBTYPES[subtype]
+    size = len(header) + entry["frames"] * entry["channels"] * width
+    end = size if end is None else min(end, size)
+    if start < len(header):
+        yield header[start:min(end, len(header))]
+    remaining = end - max(start, len(header))
+    if remaining <= 0:
+        return
+    zeros = bytes(min(ZERO_CHUNK_BYTES, remaining))
+    while remaining > 0:
+        n = min(len(zeros), remaining)
+        yield zeros if n == len(zeros) else zeros[:n]
+        remaining -= n
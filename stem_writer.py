@@ -0,0 +1,130 @@
+"""
+Drum Extractor Pro - Stem Writer Module
+=======================================
+
+Encodes separated stems to disk, in parallel and in a selectable format.
+
+Why:
+    Stems used to be written one after another, each after a full
+    `.numpy().transpose(1, 0)` copy of the (Channels, Time) output, always as
+    16-bit WAV. Encoding (FLAC in particular) is CPU work that can overlap, and the
+    transposed copy doubles the memory held per stem while it is written.
+
+How:
+    Each stem is encoded on a shared thread pool (libsndfile releases the GIL while
+    it encodes). A stem is interleaved block by block into a small reusable
+    (frames, channels) buffer, which is the layout libsndfile expects, so no full
+    transposed copy is made. `FORMATS` maps the API names to libsndfile
+    container/subtype pairs:
+        PCM_16 - 16-bit WAV (default, same as before)
+        PCM_24 - 24-bit WAV
+        FLOAT  - 32-bit float WAV (no quantization or clipping)
+        FLAC   - 16-bit FLAC (same samples as PCM_16, typically about half the size)
+
+Configuration:
+    STEM_WRITER_THREADS: Encoder threads shared by all jobs (default 4).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import soundfile as sf
+import torch
+
+# name -> (container, subtype, file extension)
+FORMATS = {
+    "PCM_16": ("WAV", "PCM_16", "wav"),
+    "PCM_24": ("WAV", "PCM_24", "wav"),
+    "FLOAT": ("WAV", "FLOAT", "wav"),
+    "FLAC": ("FLAC", "PCM_16", "flac"),
+}
+DEFAULT_FORMAT = "PCM_16"
+WRITE_BLOCK_FRAMES = 1 << 16
+WRITER_THREADS = int(os.environ.get("STEM_WRITER_THREADS", "4"))
+
+MEDIA_TYPES = {"wav": "audio/wav", "flac": "audio/flac"}
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def resolve_format(output_format: Optional[str] = None) -> str:
+    """Normalizes a format name (case-insensitive). Raises ValueError for unknown formats."""
+    name = (output_format or DEFAULT_FORMAT).upper()
+    if name not in FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}'. Choose from: {', '.join(FORMATS)}")
+    return name
+
+
+def stem_path(save_dir: str, name: str, output_format: str) -> str:
+    return os.path.join(save_dir, f"{name}.{FORMATS[output_format][2]}")
+
+
+def media_type(filename: str) -> str:
+    """MIME type for a stem file, by extension."""
+    return MEDIA_TYPES.get(os.path.splitext(filename)[1].lstrip(".").lower(), "application/octet-stream")
+
+
+def open_writer(path: str, samplerate: int, channels: int, output_format: str) -> sf.SoundFile:
+    container, subtype, _ = FORMATS[output_format]
+    return sf.SoundFile(path, "w", samplerate=samplerate, channels=channels, format=container, subtype=subtype)
+
+
+def write_interleaved(writer: sf.SoundFile, source: torch.Tensor, buffer: Optional[np.ndarray] = None) -> None:
+    """
+    Appends a (Channels, Time) tensor to `writer` in blocks.
+
+    Each block is interleaved into `buffer` ((frames, channels) float32, reused
+    between calls) instead of transposing the whole stem at once.
+    """
+    data = source.detach().cpu().numpy()
+    channels, length = data.shape
+    if buffer is None:
+        buffer = np.empty((min(WRITE_BLOCK_FRAMES, length), channels), dtype=np.float32)
+    block = buffer.shape[0]
+    for start in range(0, length, block):
+        n = min(block, length - start)
+        np.copyto(buffer[:n], data[:, start:start + n].T)
+        writer.write(buffer[:n])
+
+
+def _write_stem(path, source, samplerate, output_format):
+    with open_writer(path, samplerate, source.shape[0], output_format) as writer:
+        write_interleaved(writer, source)
+    return path
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, WRITER_THREADS), thread_name_prefix="stem-writer")
+        return _pool
+
+
+def write_stems(sources: torch.Tensor, source_names: Sequence[str], save_dir: str, samplerate: int,
+                output_format: Optional[str] = None) -> Dict[str, str]:
+    """
+    Writes each (Channels, Time) entry of `sources` to `save_dir/<name>.<ext>` concurrently.
+
+    Returns:
+        Dict[str, str]: {stem name: written file path}
+    """
+    output_format = resolve_format(output_format)
+    futures = {
+        name: _get_pool().submit(_write_stem, stem_path(save_dir, name, output_format), source,
+                                 samplerate, output_format)
+        for name, source in zip(source_names, sources)
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+
+def write_blocks(writers: Dict[str, sf.SoundFile], source_names: Sequence[str], sources: torch.Tensor) -> None:
+    """Appends one block per stem to already open writers, all stems concurrently."""
+    futures = [_get_pool().submit(write_interleaved, writers[name], source)
+               for name, source in zip(source_names, sources)]
+    for future in futures:
+        future.result()
@@ -0,0 +1,165 @@
+"""
+Drum Extractor Pro - Streaming Separation Module
+================================================
+
+Bounded-memory separation for long uploads.
+
+Why:
+    The in-memory path decodes the whole file, builds a full tensor, and holds the
+    complete (Sources, Channels, Time) output before writing anything. For a long,
+    high sample-rate upload that peaks at several GB per job.
+
+How:
+    1. A first streaming pass computes the mean/std over all samples of the track,
+       which the model normalization needs (same statistics as the in-memory path).
+    2. The file is decoded in overlapping blocks (`decoder.blocks`). Each block is
+       normalized, separated with the regular segment loop, and de-normalized.
+    3. Consecutive blocks are crossfaded linearly over the overlap, and the finished
+       part is appended to one open `SoundFile` writer per stem.
+
+    Peak memory depends on the block length, not on the track length.
+"""
+
+import math
+import os
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import torch
+
+import decoder
+import inference
+import silence as silence_skip
+import stem_writer
+
+BLOCK_SECONDS = 60.0
+BLOCK_OVERLAP_SECONDS = 5.0
+STAT_BLOCK_FRAMES = 1 << 18
+
+
+def mixture_stats(file_path: str):
+    """
+    Mean and (unbiased) std over all samples of the file, computed without loading it.
+
+    The std is floored at silence.MIN_STD (a constant mix has std 0).
+    """
+    total = 0.0
+    total_sq = 0.0
+    count = 0
+    for block in decoder.blocks(file_path, block_frames=STAT_BLOCK_FRAMES):
+        samples = block.ravel().astype(np.float64)
+        total += samples.sum()
+        total_sq += np.dot(samples, samples)
+        count += samples.shape[0]
+    mean = total / max(count, 1)
+    variance = (total_sq - count * mean * mean) / max(count - 1, 1)
+    return mean, max(math.sqrt(max(variance, 0.0)), silence_skip.MIN_STD)
+
+
+def _with_last(blocks):
+    """Yields (block, is_last); the decoder's frame count is only an estimate for some formats."""
+    previous = None
+    for block in blocks:
+        if previous is not None:
+            yield previous, False
+        previous = block
+    if previous is not None:
+        yield previous, True
+
+
+def separate_file(model: torch.nn.Module, file_path: str, save_dir: str,
+                  source_names: Sequence[str], shifts: int = 1, overlap: float = 0.25,
+                  infer=None, device="cpu", progress_callback=None, cancel_check=None,
+                  block_seconds: float = BLOCK_SECONDS,
+                  block_overlap_seconds: float = BLOCK_OVERLAP_SECONDS,
+                  output_format: Optional[str] = None, checkpoint=None,
+                  seed: Optional[int] = None, silence=None, residual_other: bool = False,
+                  segment: Optional[float] = None, batch_segments: int = 1,
+                  silent_stems=None) -> Dict[str, str]:
+    """
+    Separates `file_path` block by block, appending each stem to `save_dir/<name>.<ext>`
+    in `output_format` (see stem_writer.FORMATS).
+    Only the stems in `source_names` (a subset of `model.sources`) are computed.
+    `checkpoint`/`seed` are passed to `inference.apply_segmented`, scoped per block,
+    together with `segment`/`batch_segments` (see autotune.py);
+    `silence` (silence.SilenceDetector) is shared by all blocks. With `residual_other`,
+    "other" is derived per block as mixture minus the inferred stems.
+    With `silent_stems` (silent_stems.SilentStems), every block of every stem is
+    checked and the files of stems that stayed silent are deleted at the end; their
+    paths are still returned.
+
+    Returns:
+        Dict[str, str]: {stem name: written file path}
+    """
+    mean, std = mixture_stats(file_path)
+    inferred_names = inference.residual_plan(model, source_names) if residual_other else None
+    source_indices = [list(model.sources).index(name) for name in inferred_names or source_names]
+    if silence is not None:
+        silence.set_normalization(mean, std)
+
+    info = decoder.probe(file_path)
+    sr = info.samplerate
+    channels = info.channels
+    total_frames = info.frames
+    overlap_frames = int(block_overlap_seconds * sr)
+    block_frames = int(block_seconds * sr) + overlap_frames
+    hop = block_frames - overlap_frames
+    n_blocks = max(1, math.ceil(max(total_frames - overlap_frames, 1) / hop))
+
+    output_format = stem_writer.resolve_format(output_format)
+    paths = {name: stem_writer.stem_path(save_dir, name, output_format) for name in source_names}
+    writers = {name: stem_writer.open_writer(path, sr, channels, output_format)
+               for name, path in paths.items()}
+    ramp = torch.linspace(0.0, 1.0, overlap_frames) if overlap_frames else None
+
+    written = 0
+    try:
+        tail: Optional[torch.Tensor] = None
+        for block_index, (block, is_last) in enumerate(_with_last(
+                decoder.blocks(file_path, block_frames=block_frames, overlap=overlap_frames))):
+            length = block.shape[0]
+
+            # (Time, Channels) -> (Channels, Time), normalized with whole-track stats
+            wav = torch.from_numpy(block).t().to(device)
+            wav.sub_(mean).div_(std)
+
+            def block_progress(p, i=block_index):
+                if progress_callback:
+                    progress_callback((i + p / 100) / n_blocks * 100)
+
+            sources = inference.apply_segmented(
+                model, wav, shifts=shifts, overlap=overlap, segment=segment,
+                batch_segments=batch_segments, infer=infer, progress_callback=block_progress, cancel_check=cancel_check,
+                source_indices=source_indices,
+                checkpoint=checkpoint.scoped(f"b{block_index}") if checkpoint is not None else None,
+                seed=seed + block_index if seed is not None else None, silence=silence
+            )
+            sources = sources.cpu()
+            sources.mul_(std).add_(mean)
+            if inferred_names is not None:
+                wav = wav.cpu().mul_(std).add_(mean)
+                sources = torch.stack(inference.add_residual(wav, sources, inferred_names, source_names))
+            del wav
+
+            if tail is not None:
+                # Crossfade the previous block's tail into this block's head
+                head = sources[..., :overlap_frames]
+                head.mul_(ramp).add_(tail * (1 - ramp))
+            end = length if is_last else length - overlap_frames
+            stem_writer.write_blocks(writers, source_names, sources[..., :end])
+            if silent_stems is not None:
+                for name, source in zip(source_names, sources[..., :end]):
+                    silent_stems.update(name, source)
+            written += end
+            tail = sources[..., end:].clone() if overlap_frames and not is_last else None
+            del sources
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    if silent_stems is not None:
+        for name in silent_stems.silent(source_names):
+            os.remove(paths[name])
+            silent_stems.record(name, paths[name], sr, channels, written)
+    return paths
+
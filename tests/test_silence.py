@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import soundfile as sf
+import torch
+from demucs.htdemucs import HTDemucs
+
+import audio_processor
+import silence
+import silent_stems
+import stem_writer
+import streaming
+
+SOURCES = ["drums", "bass", "other", "vocals"]
+
+
+def _zero_wav(tmp_path, seconds=2.0, samplerate=44100):
+    path = os.path.join(tmp_path, "zeros.wav")
+    sf.write(path, np.zeros((int(seconds * samplerate), 2), dtype=np.float32), samplerate, subtype="PCM_16")
+    return path
+
+
+def _small_model():
+    torch.manual_seed(0)
+    return HTDemucs(SOURCES, channels=4, depth=2, segment=1.0).eval()
+
+
+def test_constant_mix_is_silent():
+    detector = silence.SilenceDetector()
+    detector.set_normalization(0.0, 0.0)
+    assert bool(detector.scan(torch.zeros(2, 10 * silence.FRAME_SAMPLES)).all())
+
+
+def test_zero_wav_stats(tmp_path):
+    mean, std = streaming.mixture_stats(_zero_wav(str(tmp_path)))
+    assert mean == 0.0 and std == silence.MIN_STD
+
+
+def test_zero_wav_separates_to_silent_stems(tmp_path):
+    path = _zero_wav(str(tmp_path))
+    save_dir = os.path.join(str(tmp_path), "out")
+    os.makedirs(save_dir)
+    detector = silence.SilenceDetector()
+    stems = silent_stems.SilentStems()
+    _, settings = audio_processor.resolve_preset("fast")
+    audio_processor._separate_in_memory(
+        _small_model(), path, save_dir, settings, SOURCES, "cpu", None, None, None, stem_writer.DEFAULT_FORMAT,
+        silence=detector, silent_stems=stems
+    )
+    assert detector.skipped == detector.segments > 0
+    assert sorted(stems.stems) == sorted(SOURCES)